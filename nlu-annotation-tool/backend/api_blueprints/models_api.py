@@ -3,6 +3,12 @@ import json
 from flask import Blueprint, request, jsonify
 
 from . import ensure_workspace_dirs
+from utils.retention import apply_retention, set_pinned
+from utils.evaluation import evaluate_workspace, headline_accuracy
+from utils.active_learning import save_workspace_accuracy
+from utils.jobs import start_job
+from utils.inference import predict_texts, BACKENDS
+from utils.prediction_cache import cache_stats
 
 bp = Blueprint('models_api', __name__)
 
@@ -31,3 +37,105 @@ def list_models():
     except Exception:
         pass
     return jsonify(result)
+
+
+@bp.route('/models/gc', methods=['POST'])
+def gc_models():
+    """Apply the retention policy on demand (optionally as a dry run)."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    policy = {k: payload[k] for k in ('keep_last', 'max_age_days') if k in payload}
+    rasa_project_path = None
+    if payload.get('include_project'):
+        rasa_project_path = os.environ.get('RASA_PROJECT_PATH') or os.path.abspath(
+            os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+    try:
+        report = apply_retention(base, policy=policy, dry_run=bool(payload.get('dry_run')),
+                                 rasa_project_path=rasa_project_path)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': 'invalid_policy', 'details': str(e)}), 400
+    return jsonify(report)
+
+
+@bp.route('/models/pin', methods=['POST'])
+def pin_model():
+    """Pin or unpin a model version (spaCy `model_v<ts>`, Rasa `.tar.gz` or tfidf `model_v<ts>.npz` name)."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    backend = payload.get('backend')
+    version = payload.get('version')
+    if not ws or not version or backend not in ('spacy', 'rasa', 'tfidf'):
+        return jsonify({'error': 'missing workspace_id, version, or backend (spacy|rasa|tfidf)'}), 400
+    base = ensure_workspace_dirs(ws)
+    pinned = set_pinned(base, backend, version, pinned=payload.get('pinned', True))
+    return jsonify({'ok': True, 'pinned': pinned})
+
+
+@bp.route('/models/evaluate', methods=['POST'])
+def evaluate_model():
+    """Held-out (folds < 2) or k-fold evaluation; the result is stored on the model version."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    backend = payload.get('backend', 'spacy')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    try:
+        folds = int(payload.get('folds', 0) or 0)
+        test_fraction = float(payload.get('test_fraction', 0.2))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid folds or test_fraction'}), 400
+
+    def _evaluate(job=None):
+        evaluation = evaluate_workspace(base, backend, folds=folds, test_fraction=test_fraction,
+                                        model_version=payload.get('model_version'))
+        accuracy = headline_accuracy(evaluation)
+        if accuracy is not None:
+            save_workspace_accuracy(ws, accuracy)
+        return evaluation
+
+    if payload.get('async'):
+        job = start_job('evaluate_' + backend, ws, _evaluate)
+        return jsonify({'status': 'started', 'job_id': job.id}), 202
+    try:
+        return jsonify(_evaluate())
+    except ValueError as e:
+        return jsonify({'error': 'invalid_backend', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'evaluation_failed', 'details': str(e)}), 500
+
+
+@bp.route('/models/predict', methods=['POST'])
+def predict():
+    """Predict intent/entities for `text` or `texts` with a workspace model (latest by default)."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    backend = payload.get('backend', 'tfidf')
+    texts = payload.get('texts')
+    if texts is None and payload.get('text') is not None:
+        texts = [payload['text']]
+    if not ws or not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': 'missing workspace_id or text/texts'}), 400
+    if backend not in BACKENDS:
+        return jsonify({'error': 'invalid backend; must be spacy, rasa, or tfidf'}), 400
+    base = ensure_workspace_dirs(ws)
+    try:
+        version, predictions = predict_texts(base, backend, texts, payload.get('model_version'))
+    except FileNotFoundError as e:
+        return jsonify({'error': 'model_not_found', 'details': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': 'prediction_failed', 'details': str(e)}), 500
+    return jsonify({'backend': backend, 'model_version': version, 'predictions': predictions})
+
+
+@bp.route('/models/prediction_cache', methods=['GET'])
+def get_prediction_cache():
+    """Size of the workspace prediction cache (entries per model fingerprint)."""
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    return jsonify(cache_stats(base))
@@ -0,0 +1,80 @@
+import os
+from flask import Blueprint, request, jsonify
+
+from . import ensure_workspace_dirs
+from utils.pool import ingest, iter_pool, iter_pool_file, iter_upload, pool_stats, has_pool, STATUS_NAMES
+
+bp = Blueprint('pool_api', __name__)
+
+MAX_ITEMS_PAGE = 500
+
+
+@bp.route('/pool/ingest', methods=['POST'])
+def ingest_pool():
+    """
+    Bulk-add unlabeled utterances to the workspace pool. Accepts a multipart upload
+    (`file`: .jsonl/.csv/.tsv/.txt, form field `workspace_id`), or JSON with `texts`
+    (list of strings) or `path` (a pool file in the workspace data/ dir).
+    """
+    if request.files.get('file'):
+        ws = request.form.get('workspace_id')
+        upload = request.files['file']
+        items, source = iter_upload(upload), upload.filename
+    else:
+        payload = request.get_json(force=True, silent=True) or {}
+        ws = payload.get('workspace_id')
+        if isinstance(payload.get('texts'), list):
+            items, source = [t for t in payload['texts'] if isinstance(t, str)], 'request'
+        elif payload.get('path'):
+            items, source = None, os.path.basename(payload['path'])
+        else:
+            return jsonify({'error': 'missing file, texts, or path'}), 400
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    if items is None:
+        path = os.path.join(base, 'data', source)
+        if not os.path.exists(path):
+            return jsonify({'error': 'file_not_found', 'path': source}), 404
+        items = iter_pool_file(path)
+    try:
+        report = ingest(base, items, source=source)
+    except UnicodeDecodeError as e:
+        return jsonify({'error': 'invalid_encoding', 'details': str(e)}), 400
+    return jsonify({'ok': True, **report})
+
+
+@bp.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    return jsonify(pool_stats(base))
+
+
+@bp.route('/pool/items', methods=['GET'])
+def get_pool_items():
+    """Page through pool items with a given status (default unlabeled)."""
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    names = {v: k for k, v in STATUS_NAMES.items()}
+    status = request.args.get('status', 'unlabeled')
+    if status not in names:
+        return jsonify({'error': 'invalid status; must be unlabeled, queued, or labeled'}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(MAX_ITEMS_PAGE, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({'error': 'invalid offset or limit'}), 400
+    base = ensure_workspace_dirs(ws)
+    items = []
+    if has_pool(base):
+        for n, (index, text) in enumerate(iter_pool(base, (names[status],))):
+            if n < offset:
+                continue
+            if len(items) >= limit:
+                break
+            items.append({'id': index, 'text': text})
+    return jsonify({'status': status, 'offset': offset, 'items': items})
@@ -1,12 +1,54 @@
 import os
 import json
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 
 from . import ensure_workspace_dirs
 from utils.model_utils import train_spacy_model, train_rasa_model
+from utils.tfidf_intent import train_tfidf_model
+from utils.jobs import start_job, get_job, list_jobs
+from utils.sampling import prepare_draft_sample
+from utils.sweep import run_spacy_sweep, validate_grid
+from utils.rasa_profiles import resolve_profile
+from utils.near_dup import prepare_deduped, DEDUPE_MODES, WEIGHTED_BACKENDS
+from utils.snapshots import snapshot_for_training
 
 bp = Blueprint('train_api', __name__)
 
+# seconds between SSE keep-alive comments while a job is silent
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _run_training(base, backend, on_output=None, sample=None, sweep=None, profile=None, dedupe=None):
+    # Ensure Rasa runs from the repository root (where config.yml lives) when not overridden.
+    # train_rasa_model checks RASA_PROJECT_PATH env var first; set it here if missing.
+    if 'RASA_PROJECT_PATH' not in os.environ:
+        # project root is three levels above this file: backend/api_blueprints -> backend -> nlu-annotation-tool -> repo root
+        repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+        os.environ['RASA_PROJECT_PATH'] = repo_root
+
+    # hyperparameter sweep (spaCy): sweep is True for the default grid or a grid dict
+    if sweep:
+        grid = sweep if isinstance(sweep, dict) else None
+        return run_spacy_sweep(base, grid=grid, on_output=on_output,
+                               extra_meta=snapshot_for_training(base, backend))
+
+    # draft model: train on a stratified sample bounded by rows or seconds
+    annotations, extra_meta = None, None
+    if sample:
+        annotations, extra_meta = prepare_draft_sample(base, backend, sample)
+    # near-duplicate clusters collapsed (or down-weighted for tfidf)
+    if dedupe:
+        annotations, extra_meta = prepare_deduped(base, backend, dedupe, annotations, extra_meta)
+    # immutable snapshot of the training data, referenced from the model metadata
+    extra_meta = snapshot_for_training(base, backend, annotations, extra_meta)
+
+    if backend == 'spacy':
+        return train_spacy_model(base, on_output=on_output, annotations=annotations, extra_meta=extra_meta)
+    if backend == 'tfidf':
+        return train_tfidf_model(base, on_output=on_output, annotations=annotations, extra_meta=extra_meta)
+    return train_rasa_model(base, on_output=on_output, annotations=annotations, extra_meta=extra_meta,
+                            profile=profile)
+
 
 @bp.route('/train', methods=['POST'])
 def train():
@@ -15,20 +57,50 @@ def train():
     backend = payload.get('backend', 'rasa')
     if not ws:
         return jsonify({'error': 'missing workspace_id'}), 400
+    if backend not in ('spacy', 'rasa', 'tfidf'):
+        return jsonify({'error': 'invalid backend; must be spacy, rasa, or tfidf'}), 400
+    sample = payload.get('sample')
+    if sample is not None and (not isinstance(sample, dict) or not (sample.get('rows') or sample.get('seconds'))):
+        return jsonify({'error': 'invalid sample; expected {"rows": n} or {"seconds": s}'}), 400
+    sweep = payload.get('sweep')
+    if sweep and backend != 'spacy':
+        return jsonify({'error': 'sweep is only supported for the spacy backend'}), 400
+    if sweep and sweep is not True:
+        try:
+            validate_grid(sweep)
+        except ValueError as e:
+            return jsonify({'error': 'invalid_sweep', 'details': str(e)}), 400
+    dedupe = payload.get('dedupe')
+    if dedupe is not None and dedupe not in DEDUPE_MODES:
+        return jsonify({'error': 'invalid dedupe; must be collapse or weight'}), 400
+    if dedupe == 'weight' and backend not in WEIGHTED_BACKENDS:
+        return jsonify({'error': 'dedupe weight is only supported for the tfidf backend'}), 400
+    if dedupe and sweep:
+        return jsonify({'error': 'dedupe cannot be combined with sweep'}), 400
+    if sample and sweep:
+        return jsonify({'error': 'sample cannot be combined with sweep'}), 400
+    profile = payload.get('profile')
+    if backend == 'rasa':
+        try:
+            profile = resolve_profile(profile)
+        except ValueError as e:
+            return jsonify({'error': 'invalid_profile', 'details': str(e)}), 400
     base = ensure_workspace_dirs(ws)
 
+    if payload.get('async'):
+        # run in background; progress is available via /train/status and /train/jobs/<id>/events
+        job = start_job('train_' + backend, ws,
+                        lambda job: {'model': _run_training(base, backend, on_output=job.append_line,
+                                                           sample=sample, sweep=sweep, profile=profile,
+                                                           dedupe=dedupe)})
+        return jsonify({
+            'status': 'started',
+            'job_id': job.id,
+            'events': f'/api/train/jobs/{job.id}/events'
+        }), 202
+
     try:
-        # Ensure Rasa runs from the repository root (where config.yml lives) when not overridden.
-        # train_rasa_model checks RASA_PROJECT_PATH env var first; set it here if missing.
-        if 'RASA_PROJECT_PATH' not in os.environ:
-            # project root is three levels above this file: backend/api_blueprints -> backend -> nlu-annotation-tool -> repo root
-            repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-            os.environ['RASA_PROJECT_PATH'] = repo_root
-
-        if backend == 'spacy':
-            model_path = train_spacy_model(base)
-        else:
-            model_path = train_rasa_model(base)
+        model_path = _run_training(base, backend, sample=sample, sweep=sweep, profile=profile, dedupe=dedupe)
         return jsonify({'status': 'ok', 'model': model_path})
     except Exception as e:
         return jsonify({'error': 'training_failed', 'details': str(e)}), 500
@@ -36,5 +108,43 @@ def train():
 
 @bp.route('/train/status', methods=['GET'])
 def status():
-    # simple placeholder; if you have SSE integration elsewhere keep it
-    return jsonify({'status': 'unknown'})
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({'error': 'job_not_found', 'job_id': job_id}), 404
+        return jsonify(job.to_dict())
+    ws = request.args.get('workspace_id')
+    jobs = list_jobs(workspace_id=ws)
+    if not jobs:
+        return jsonify({'status': 'unknown', 'jobs': []})
+    return jsonify({'status': jobs[0]['status'], 'jobs': jobs})
+
+
+@bp.route('/train/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of a job's output lines, progress and final result."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'job_not_found', 'job_id': job_id}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_seq = 0
+
+    def stream(last_seq=last_seq):
+        while True:
+            lines, finished = job.wait_for_lines(last_seq, timeout=SSE_KEEPALIVE_SECONDS)
+            for seq, line in lines:
+                yield f"id: {seq}\nevent: log\ndata: {json.dumps(line)}\n\n"
+                last_seq = seq
+            if lines and job.progress:
+                yield f"event: progress\ndata: {json.dumps(job.progress)}\n\n"
+            if finished:
+                yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if not lines:
+                yield ": keep-alive\n\n"
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
@@ -1,11 +1,34 @@
 import os
 import json
-from flask import Blueprint, request, jsonify
+import zlib
+import sqlite3
+import tarfile
+from flask import Blueprint, Response, request, jsonify
 
 from . import ensure_workspace_dirs, WORKSPACES_ROOT
+from utils.spacy_corpus import append_to_corpus
+from utils.annotation_store import (
+    append_annotations, iter_annotations, get_annotation, update_annotation, delete_annotation
+)
+from utils.pool import has_pool
+from utils.jobs import start_job
+from utils.gazetteer import load_gazetteer
+from utils.search_index import index_annotations, search_annotations, MAX_SEARCH_LIMIT, SEARCH_ORDERS
+from utils.workspace_clone import clone_workspace
+from utils.workspace_archive import (
+    export_files, export_etag, stream_export, append_upload, import_archive, default_compression, COMPRESSIONS
+)
+from utils.snapshots import create_snapshot, list_snapshots, diff_snapshots, MAX_DIFF_RECORDS
+from utils.preannotate import (
+    preannotate, get_suggestions, list_suggestions, PREANNOTATE_BATCH_SIZE, DEFAULT_PREANNOTATE_LIMIT
+)
 
 bp = Blueprint('workspace_api', __name__)
 
+MAX_MATCH_TEXTS = int(os.environ.get('MAX_MATCH_TEXTS', '10000'))
+# largest accepted import upload in bytes (unlimited when unset)
+MAX_IMPORT_BYTES = int(os.environ['MAX_IMPORT_BYTES']) if os.environ.get('MAX_IMPORT_BYTES') else None
+
 
 @bp.route('/workspaces', methods=['GET'])
 def list_workspaces():
@@ -14,7 +37,8 @@ def list_workspaces():
     try:
         for name in os.listdir(WORKSPACES_ROOT):
             p = os.path.join(WORKSPACES_ROOT, name)
-            if os.path.isdir(p):
+            # dot entries are in-progress clones / imports and upload parts
+            if os.path.isdir(p) and not name.startswith('.'):
                 items.append(name)
     except Exception:
         pass
@@ -35,6 +59,122 @@ def create_workspace():
     return jsonify({'id': safe, 'path': base})
 
 
+def _existing_workspace(workspace_id):
+    """Workspace dir of an existing workspace id, or None (also for ids that are not plain names)."""
+    path = os.path.join(WORKSPACES_ROOT, workspace_id)
+    if not workspace_id or workspace_id.startswith('.') or os.sep in workspace_id or not os.path.isdir(path):
+        return None
+    return path
+
+
+@bp.route('/workspaces/<workspace_id>/clone', methods=['POST'])
+def clone_workspace_route(workspace_id):
+    """Fork a workspace (data, pool, snapshots and models) without copying file contents."""
+    payload = request.get_json(silent=True) or {}
+    source = _existing_workspace(workspace_id)
+    if not source:
+        return jsonify({'error': 'workspace_not_found'}), 404
+    name = payload.get('name')
+    if not name:
+        return jsonify({'error': 'missing_name'}), 400
+    safe = ''.join([c for c in name if c.isalnum() or c in ['-', '_']]).strip()
+    if not safe:
+        return jsonify({'error': 'invalid_name'}), 400
+    dest = os.path.join(WORKSPACES_ROOT, safe)
+    try:
+        report = clone_workspace(source, dest)
+    except FileExistsError:
+        return jsonify({'error': 'workspace_exists', 'details': safe}), 409
+    except OSError as e:
+        return jsonify({'error': 'clone_failed', 'details': str(e)}), 500
+    return jsonify({'id': safe, 'path': dest, 'source': workspace_id, **report})
+
+
+@bp.route('/workspaces/<workspace_id>/export', methods=['GET'])
+def export_workspace(workspace_id):
+    """
+    Stream a compressed archive of a workspace.
+    Query: models=latest|all|none, compression=zstd|gzip, offset=<bytes already received>,
+    etag=<ETag of the interrupted download> (412 when the workspace changed since)
+    """
+    base = _existing_workspace(workspace_id)
+    if not base:
+        return jsonify({'error': 'workspace_not_found'}), 404
+    compression = request.args.get('compression') or default_compression()
+    if compression not in COMPRESSIONS:
+        return jsonify({'error': 'invalid_compression', 'details': list(COMPRESSIONS)}), 400
+    if compression == 'zstd' and default_compression() != 'zstd':
+        return jsonify({'error': 'compression_unavailable', 'details': 'zstandard is not installed'}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        files = export_files(base, request.args.get('models', 'latest'))
+    except ValueError as e:
+        return jsonify({'error': 'invalid_parameters', 'details': str(e)}), 400
+    etag = export_etag(files, compression)
+    if offset and request.args.get('etag') not in (None, etag):
+        return jsonify({'error': 'export_changed', 'details': etag}), 412
+    extension = 'tar.zst' if compression == 'zstd' else 'tar.gz'
+    headers = {
+        'ETag': etag,
+        'X-Archive-Offset': str(offset),
+        'Content-Disposition': f'attachment; filename="{workspace_id}.{extension}"',
+        'X-Accel-Buffering': 'no',
+    }
+    mimetype = 'application/zstd' if compression == 'zstd' else 'application/gzip'
+    return Response(stream_export(base, files, compression, offset), mimetype=mimetype, headers=headers,
+                    direct_passthrough=True)
+
+
+def _import_target(workspace_id):
+    safe = ''.join([c for c in workspace_id if c.isalnum() or c in ['-', '_']]).strip()
+    if not safe or safe != workspace_id:
+        return None, None
+    return os.path.join(WORKSPACES_ROOT, safe), os.path.join(WORKSPACES_ROOT, '.imports', safe + '.part')
+
+
+@bp.route('/workspaces/<workspace_id>/import', methods=['GET', 'PUT', 'DELETE'])
+def import_workspace(workspace_id):
+    """
+    Resumable import of an exported archive as workspace <workspace_id>.
+    PUT ?offset=<n> appends the request body at byte n of the upload (409 with the current
+    offset otherwise); &complete=1 then verifies and extracts it. GET returns the offset to
+    resume from, DELETE abandons the upload.
+    """
+    dest, part = _import_target(workspace_id)
+    if not dest:
+        return jsonify({'error': 'invalid_name'}), 400
+    size = os.path.getsize(part) if os.path.exists(part) else 0
+    if request.method == 'GET':
+        return jsonify({'workspace_id': workspace_id, 'offset': size, 'exists': os.path.exists(dest)})
+    if request.method == 'DELETE':
+        if os.path.exists(part):
+            os.remove(part)
+        return jsonify({'ok': True, 'discarded_bytes': size})
+
+    if os.path.exists(dest):
+        return jsonify({'error': 'workspace_exists', 'details': workspace_id}), 409
+    try:
+        offset = int(request.args.get('offset', size))
+        size = append_upload(part, offset, request.stream, MAX_IMPORT_BYTES)
+    except ValueError as e:
+        if e.args and isinstance(e.args[0], int):
+            return jsonify({'error': 'offset_mismatch', 'offset': e.args[0]}), 409
+        return jsonify({'error': 'invalid_offset'}), 400
+    except OverflowError:
+        return jsonify({'error': 'upload_too_large', 'details': MAX_IMPORT_BYTES}), 413
+    if request.args.get('complete', '').lower() not in ('1', 'true', 'yes'):
+        return jsonify({'workspace_id': workspace_id, 'offset': size})
+    try:
+        report = import_archive(part, dest)
+    except FileExistsError:
+        return jsonify({'error': 'workspace_exists', 'details': workspace_id}), 409
+    except (ValueError, OSError, EOFError, tarfile.TarError, zlib.error) as e:
+        os.remove(part)
+        return jsonify({'error': 'invalid_archive', 'details': str(e)}), 400
+    os.remove(part)
+    return jsonify({'id': workspace_id, 'path': dest, **report})
+
+
 @bp.route('/annotations', methods=['POST'])
 def post_annotation():
     payload = request.get_json(force=True) or {}
@@ -42,17 +182,17 @@ def post_annotation():
     if not ws:
         return jsonify({'error': 'missing workspace_id'}), 400
     base = ensure_workspace_dirs(ws)
-    ann_file = os.path.join(base, 'data', 'annotations.json')
-    try:
-        with open(ann_file, 'r', encoding='utf-8') as fh:
-            data = json.load(fh) or []
-    except Exception:
-        data = []
-    # shape should be preserved
-    data.append(payload)
-    with open(ann_file, 'w', encoding='utf-8') as fh:
-        json.dump(data, fh, indent=2)
-    return jsonify({'ok': True, 'saved': payload})
+    # shape should be preserved; id and version are assigned by the store
+    saved = append_annotations(base, [payload])[0]
+    # compile into the spaCy corpus now so span alignment is checked once, at write time
+    manifest = append_to_corpus(base)
+    index_annotations(base)
+    result = {'ok': True, 'saved': saved}
+    if manifest:
+        misaligned = [m for m in manifest.get('misaligned', []) if m.get('annotation_id') == saved['id']]
+        if misaligned:
+            result['misaligned_entities'] = misaligned
+    return jsonify(result)
 
 
 @bp.route('/annotations', methods=['GET'])
@@ -61,10 +201,193 @@ def get_annotations():
     if not ws:
         return jsonify({'error': 'missing workspace_id'}), 400
     base = ensure_workspace_dirs(ws)
-    ann_file = os.path.join(base, 'data', 'annotations.json')
+    return jsonify({'annotations': list(iter_annotations(base))})
+
+
+def _store_response(base, result):
+    if result.get('error') == 'annotation_not_found':
+        return jsonify(result), 404
+    if result.get('error') == 'version_conflict':
+        return jsonify(result), 409
+    index_annotations(base)
+    return jsonify({'ok': True, 'annotation': result['annotation']})
+
+
+@bp.route('/annotations/<int:annotation_id>', methods=['GET'])
+def get_annotation_route(annotation_id):
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    annotation = get_annotation(ensure_workspace_dirs(ws), annotation_id)
+    if annotation is None:
+        return jsonify({'error': 'annotation_not_found', 'id': annotation_id}), 404
+    return jsonify({'annotation': annotation})
+
+
+@bp.route('/annotations/<int:annotation_id>', methods=['PATCH'])
+def patch_annotation(annotation_id):
+    """
+    Update fields of an annotation. `version` is the version the edit was based on; when the
+    annotation changed since, nothing is written and 409 returns the current annotation.
+    """
+    payload = request.get_json(force=True) or {}
+    ws = payload.pop('workspace_id', None)
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    version = payload.pop('version', None)
+    if not isinstance(version, int) or isinstance(version, bool):
+        return jsonify({'error': 'missing_version'}), 400
+    base = ensure_workspace_dirs(ws)
+    return _store_response(base, update_annotation(base, annotation_id, payload, version))
+
+
+@bp.route('/annotations/<int:annotation_id>', methods=['DELETE'])
+def delete_annotation_route(annotation_id):
+    """Delete an annotation at `version` (query or JSON body); 409 when it changed since."""
+    payload = request.get_json(silent=True) or {}
+    ws = request.args.get('workspace_id') or payload.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    version = request.args.get('version', type=int)
+    if version is None:
+        version = payload.get('version')
+    if not isinstance(version, int) or isinstance(version, bool):
+        return jsonify({'error': 'missing_version'}), 400
+    base = ensure_workspace_dirs(ws)
+    return _store_response(base, delete_annotation(base, annotation_id, version))
+
+
+@bp.route('/annotations/search', methods=['GET'])
+def search_annotations_route():
+    """Search annotations by terms (`q`), exact `phrase`, `intent` and entity `label` filters."""
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    order = request.args.get('order', 'newest')
+    if order not in SEARCH_ORDERS:
+        return jsonify({'error': 'invalid order; must be one of ' + ', '.join(SEARCH_ORDERS)}), 400
     try:
-        with open(ann_file, 'r', encoding='utf-8') as fh:
-            data = json.load(fh) or []
-    except Exception:
-        data = []
-    return jsonify({'annotations': data})
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 50))), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'invalid offset or limit'}), 400
+    base = ensure_workspace_dirs(ws)
+    try:
+        result = search_annotations(base, q=request.args.get('q'), phrase=request.args.get('phrase'),
+                                    intent=request.args.get('intent'), labels=request.args.getlist('label'),
+                                    offset=offset, limit=limit, order=order,
+                                    count=request.args.get('count') in ('1', 'true'))
+    except sqlite3.OperationalError as e:
+        return jsonify({'error': 'invalid_query', 'details': str(e)}), 400
+    result.update(offset=offset, limit=limit)
+    return jsonify(result)
+
+
+@bp.route('/annotations/preannotate', methods=['POST'])
+def preannotate_texts():
+    """Compute suggestions for new texts (or the unlabeled pool) in a background job."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    texts = payload.get('texts')
+    if texts is not None and (not isinstance(texts, list) or not all(isinstance(t, str) for t in texts)):
+        return jsonify({'error': 'invalid texts; must be a list of strings'}), 400
+    try:
+        limit = int(payload.get('limit', DEFAULT_PREANNOTATE_LIMIT))
+        batch_size = int(payload.get('batch_size', PREANNOTATE_BATCH_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid limit or batch_size'}), 400
+    base = ensure_workspace_dirs(ws)
+    if texts is None and not has_pool(base):
+        return jsonify({'error': 'pool_not_found', 'details': 'no texts given and the workspace has no pool'}), 404
+
+    def _run(job):
+        return preannotate(base, texts, limit=limit, batch_size=max(1, batch_size), on_output=job.append_line)
+
+    job = start_job('preannotate', ws, _run)
+    return jsonify({'status': 'started', 'job_id': job.id,
+                    'events': f'/api/train/jobs/{job.id}/events'}), 202
+
+
+@bp.route('/annotations/suggestions', methods=['GET'])
+def get_suggestions_route():
+    """Stored suggestions for the given `text` parameters, or a page of all suggestions."""
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    base = ensure_workspace_dirs(ws)
+    texts = request.args.getlist('text')
+    if texts:
+        found = get_suggestions(base, texts)
+        return jsonify({'suggestions': [s or {'text': t, 'status': 'pending'} for t, s in zip(texts, found)]})
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 50))), 1000)
+    except ValueError:
+        return jsonify({'error': 'invalid offset or limit'}), 400
+    return jsonify({'suggestions': list_suggestions(base, offset, limit), 'offset': offset, 'limit': limit})
+
+
+@bp.route('/entities/match', methods=['POST'])
+def match_entity_values():
+    """Find all known entity values (entities.json and annotated spans) in `text` or `texts`."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    texts = payload.get('texts')
+    single = texts is None
+    if single:
+        texts = [payload.get('text')]
+    if not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': 'missing text or texts; must be a string or a list of strings'}), 400
+    if len(texts) > MAX_MATCH_TEXTS:
+        return jsonify({'error': 'too_many_texts', 'details': f'at most {MAX_MATCH_TEXTS} per request'}), 400
+    base = ensure_workspace_dirs(ws)
+    gazetteer = load_gazetteer(base)
+    matches = gazetteer.match(texts, overlapping=bool(payload.get('overlapping')))
+    result = {'terms': len(gazetteer), 'fingerprint': gazetteer.fingerprint}
+    if single:
+        result.update(text=texts[0], matches=matches[0])
+    else:
+        result['results'] = [{'text': t, 'matches': m} for t, m in zip(texts, matches)]
+    return jsonify(result)
+
+
+@bp.route('/datasets/snapshots', methods=['GET'])
+def get_dataset_snapshots():
+    ws = request.args.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    return jsonify({'snapshots': list_snapshots(ensure_workspace_dirs(ws))})
+
+
+@bp.route('/datasets/snapshots', methods=['POST'])
+def post_dataset_snapshot():
+    """Snapshot the current annotations (training runs do this automatically)."""
+    payload = request.get_json(force=True) or {}
+    ws = payload.get('workspace_id')
+    if not ws:
+        return jsonify({'error': 'missing workspace_id'}), 400
+    snapshot = create_snapshot(ensure_workspace_dirs(ws), reason=payload.get('reason') or 'manual')
+    return jsonify(snapshot)
+
+
+@bp.route('/datasets/snapshots/diff', methods=['GET'])
+def diff_dataset_snapshots():
+    """Records added / removed and label count changes between snapshots `from` and `to`."""
+    ws = request.args.get('workspace_id')
+    old_id, new_id = request.args.get('from'), request.args.get('to')
+    if not ws or not old_id or not new_id:
+        return jsonify({'error': 'missing workspace_id, from or to'}), 400
+    try:
+        limit = min(max(0, int(request.args.get('limit', MAX_DIFF_RECORDS))), 1000)
+    except ValueError:
+        return jsonify({'error': 'invalid limit'}), 400
+    try:
+        return jsonify(diff_snapshots(ensure_workspace_dirs(ws), old_id, new_id, limit=limit))
+    except ValueError as e:
+        return jsonify({'error': 'invalid_snapshot_id', 'details': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': 'snapshot_not_found', 'details': str(e)}), 404
@@ -33,11 +33,13 @@ try:
     from api_blueprints.workspace_api import bp as ws_bp
     from api_blueprints.train_api import bp as train_bp
     from api_blueprints.models_api import bp as models_bp
+    from api_blueprints.pool_api import bp as pool_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(ws_bp, url_prefix='/api')
     app.register_blueprint(train_bp, url_prefix='/api')
     app.register_blueprint(models_bp, url_prefix='/api')
+    app.register_blueprint(pool_bp, url_prefix='/api')
 except Exception as e:
     # non-fatal: if import fails keep legacy routes working, but print error for debugging
     import traceback, sys
@@ -133,9 +135,19 @@ try:
         retrain_workspace,
         get_workspace_stats,
         load_annotations,
-        get_workspace_dir
+        get_workspace_dir,
+        next_review_batch,
+        release_lease,
+        LEASE_SECONDS,
+        MAX_LEASE_BATCH
     )
     from api_blueprints.auth_api import _load_users
+    from utils.uncertainty import score_pool, STRATEGIES, DEFAULT_TOP_K, SCORE_BATCH_SIZE
+    from utils.pool import iter_pool_file, has_pool
+    from utils.diversity import DIVERSITY_METHODS
+    from utils.near_dup import cluster_members, sync_index, DEDUPE_MODES
+    from utils.jobs import start_job
+    from utils.analytics import compute_analytics
     
     @app.route('/api/active_learning/uncertain_samples', methods=['GET'])
     def get_uncertain():
@@ -147,6 +159,57 @@ try:
         return jsonify({'samples': samples})
     
     
+    @app.route('/api/active_learning/score_pool', methods=['POST'])
+    def score_unlabeled_pool():
+        """Score the workspace pool store (or a pool file under data/) and refill the uncertain queue."""
+        payload = request.get_json(force=True) or {}
+        ws = payload.get('workspace_id')
+        if not ws:
+            return jsonify({'error': 'missing workspace_id'}), 400
+        strategy = payload.get('strategy', 'entropy')
+        if strategy not in STRATEGIES:
+            return jsonify({'error': 'invalid strategy; must be one of ' + ', '.join(STRATEGIES)}), 400
+        if payload.get('diversity') and payload['diversity'] not in DIVERSITY_METHODS:
+            return jsonify({'error': 'invalid diversity; must be one of ' + ', '.join(DIVERSITY_METHODS)}), 400
+        committee = payload.get('committee')
+        if committee is not None and (not isinstance(committee, list)
+                                      or not all(isinstance(m, str) for m in committee)):
+            return jsonify({'error': 'invalid committee; must be a list of backend or backend:model_version'}), 400
+        try:
+            top_k = int(payload.get('top_k', DEFAULT_TOP_K))
+            batch_size = int(payload.get('batch_size', SCORE_BATCH_SIZE))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid top_k or batch_size'}), 400
+        ws_dir = get_workspace_dir(ws)
+        pool_path = None
+        if payload.get('pool') or not has_pool(ws_dir):
+            pool_path = os.path.join(ws_dir, 'data', os.path.basename(payload.get('pool') or 'unlabeled.jsonl'))
+            if not os.path.exists(pool_path):
+                return jsonify({'error': 'pool_not_found', 'pool': os.path.basename(pool_path)}), 404
+
+        def _score(job=None):
+            items = iter_pool_file(pool_path) if pool_path else None
+            return score_pool(ws, items, top_k=top_k, strategy=strategy,
+                              batch_size=batch_size,
+                              intent_backend=payload.get('intent_backend', 'auto'),
+                              entity_backend=payload.get('entity_backend', 'auto'),
+                              diversity=payload.get('diversity'),
+                              candidate_factor=payload.get('candidate_factor'),
+                              committee=payload.get('committee'),
+                              on_output=job.append_line if job else None)
+
+        if payload.get('async'):
+            job = start_job('score_pool', ws, _score)
+            return jsonify({'status': 'started', 'job_id': job.id,
+                            'events': f'/api/train/jobs/{job.id}/events'}), 202
+        try:
+            return jsonify(_score())
+        except FileNotFoundError as e:
+            return jsonify({'error': 'model_not_found', 'details': str(e)}), 404
+        except Exception as e:
+            return jsonify({'error': 'scoring_failed', 'details': str(e)}), 500
+
+
     @app.route('/api/active_learning/mark_reviewed', methods=['POST'])
     def mark_reviewed():
         """Mark a sample as reviewed, re-annotated, or added to training set."""
@@ -158,12 +221,71 @@ try:
         if not ws or not sample_id or not action:
             return jsonify({'error': 'missing workspace_id, sample_id, or action'}), 400
         
-        result = mark_sample_reviewed(ws, sample_id, action)
+        result = mark_sample_reviewed(ws, sample_id, action, cluster=bool(payload.get('cluster')),
+                                      lease_id=payload.get('lease_id'))
+        if result.get('error') == 'lease_conflict':
+            return jsonify(result), 409
         if 'error' in result:
             return jsonify(result), 400
         return jsonify(result)
     
     
+    @app.route('/api/active_learning/next_batch', methods=['POST'])
+    def next_batch():
+        """Lease the next batch of uncertain samples to a reviewer (disjoint from other leases)."""
+        payload = request.get_json(force=True) or {}
+        ws = payload.get('workspace_id')
+        reviewer = payload.get('reviewer')
+        if not ws or not reviewer:
+            return jsonify({'error': 'missing workspace_id or reviewer'}), 400
+        try:
+            size = min(MAX_LEASE_BATCH, max(1, int(payload.get('size', 20))))
+            lease_seconds = max(1, int(payload.get('lease_seconds', LEASE_SECONDS)))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid size or lease_seconds'}), 400
+        return jsonify(next_review_batch(ws, reviewer, size, lease_seconds))
+    
+    
+    @app.route('/api/active_learning/release', methods=['POST'])
+    def release():
+        """Return leased samples to the queue, or extend the lease with extend_seconds."""
+        payload = request.get_json(force=True) or {}
+        ws = payload.get('workspace_id')
+        lease_id = payload.get('lease_id')
+        if not ws or not lease_id:
+            return jsonify({'error': 'missing workspace_id or lease_id'}), 400
+        sample_ids = payload.get('sample_ids')
+        if sample_ids is not None and not isinstance(sample_ids, list):
+            return jsonify({'error': 'invalid sample_ids; must be a list'}), 400
+        try:
+            extend = int(payload['extend_seconds']) if payload.get('extend_seconds') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid extend_seconds'}), 400
+        result = release_lease(ws, lease_id, sample_ids, extend)
+        if 'error' in result:
+            return jsonify(result), 404
+        return jsonify(result)
+    
+    
+    @app.route('/api/active_learning/near_duplicates', methods=['GET'])
+    def near_duplicates():
+        """Texts in the near-duplicate cluster of an uncertain sample (sample_id) or of a text."""
+        ws = request.args.get('workspace_id')
+        text = request.args.get('text')
+        sample_id = request.args.get('sample_id')
+        if not ws or not (text or sample_id):
+            return jsonify({'error': 'missing workspace_id, or text or sample_id'}), 400
+        if sample_id:
+            sample = next((s for s in load_uncertain_samples(ws) if s.get('sample_id') == sample_id), None)
+            if not sample:
+                return jsonify({'error': 'sample_not_found', 'sample_id': sample_id}), 404
+            text = sample.get('text', '')
+        ws_dir = get_workspace_dir(ws)
+        sync_index(ws_dir)
+        members = cluster_members(ws_dir, text)
+        return jsonify({'text': text, 'size': len(members), 'members': members})
+    
+    
     @app.route('/api/active_learning/retrain', methods=['POST'])
     def retrain():
         """Retrain model(s) for a workspace using active learning flow."""
@@ -174,10 +296,24 @@ try:
         if not ws:
             return jsonify({'error': 'missing workspace_id'}), 400
         
-        if backend not in ['spacy', 'rasa', 'both']:
-            return jsonify({'error': 'invalid backend; must be spacy, rasa, or both'}), 400
+        if backend not in ['spacy', 'rasa', 'tfidf', 'both', 'all']:
+            return jsonify({'error': 'invalid backend; must be spacy, rasa, tfidf, both, or all'}), 400
+        if payload.get('dedupe') not in (None, *DEDUPE_MODES):
+            return jsonify({'error': 'invalid dedupe; must be collapse or weight'}), 400
+        try:
+            folds = int(payload.get('folds', 0) or 0)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid folds'}), 400
+        sample = payload.get('sample')
+        if sample is not None and (not isinstance(sample, dict) or not (sample.get('rows') or sample.get('seconds'))):
+            return jsonify({'error': 'invalid sample; expected {"rows": n} or {"seconds": s}'}), 400
         
-        result = retrain_workspace(ws, backend)
+        result = retrain_workspace(ws, backend,
+                                   evaluate=payload.get('evaluate', True),
+                                   folds=folds,
+                                   sample=sample,
+                                   profile=payload.get('profile'),
+                                   dedupe=payload.get('dedupe'))
         return jsonify(result)
     
     
@@ -192,6 +328,22 @@ try:
         return jsonify(stats)
     
     
+    @app.route('/api/admin/analytics', methods=['GET'])
+    def admin_analytics():
+        """Label balance, span statistics and co-occurrence of a workspace's annotations."""
+        ws = request.args.get('workspace_id')
+        if not ws:
+            return jsonify({'error': 'missing workspace_id'}), 400
+        try:
+            top = int(request.args.get('top', 0)) or None
+        except ValueError:
+            return jsonify({'error': 'invalid top'}), 400
+        try:
+            return jsonify(compute_analytics(get_workspace_dir(ws), top=top))
+        except Exception as e:
+            return jsonify({'error': 'analytics_failed', 'details': str(e)}), 500
+    
+    
     @app.route('/api/admin/users', methods=['GET'])
     def admin_users():
         """Get list of registered users."""
@@ -581,6 +733,7 @@ try:
                 import os
                 import json
                 from datetime import datetime
+                from utils.storage import atomic_write_json
                 
                 ws_dir = get_workspace_dir(ws)
                 deploy_file = os.path.join(ws_dir, 'deployment_history.json')
@@ -623,8 +776,7 @@ try:
                 
                 # Save to file
                 os.makedirs(ws_dir, exist_ok=True)
-                with open(deploy_file, 'w', encoding='utf-8') as f:
-                    json.dump(deployment_data, f, indent=2)
+                atomic_write_json(deploy_file, deployment_data)
                 
                 return jsonify({
                     'status': 'success',
@@ -680,27 +832,60 @@ def index():
             "workspaces": {
                 "list": "GET /api/workspaces",
                 "create": "POST /api/workspaces",
+                "clone": "POST /api/workspaces/<workspace_id>/clone",
+                "export": "GET /api/workspaces/<workspace_id>/export?models=latest|all|none&compression=zstd|gzip&offset=<n>&etag=<etag>",
+                "import": "PUT /api/workspaces/<workspace_id>/import?offset=<n>&complete=1",
+                "import_status": "GET /api/workspaces/<workspace_id>/import",
                 "select": "GET /api/workspace/select?id=<workspace_id>"
             },
             "annotations": {
                 "list": "GET /api/annotations",
-                "save": "POST /api/annotations"
+                "save": "POST /api/annotations",
+                "get": "GET /api/annotations/<annotation_id>?workspace_id=<id>",
+                "update": "PATCH /api/annotations/<annotation_id> (workspace_id, version, changed fields)",
+                "delete": "DELETE /api/annotations/<annotation_id>?workspace_id=<id>&version=<version>",
+                "search": "GET /api/annotations/search?workspace_id=<id>&q=<terms>&phrase=<phrase>&intent=<intent>&label=<label>",
+                "preannotate": "POST /api/annotations/preannotate",
+                "suggestions": "GET /api/annotations/suggestions?workspace_id=<id>&text=<text>"
+            },
+            "entities": {
+                "match": "POST /api/entities/match"
+            },
+            "datasets": {
+                "snapshots": "GET /api/datasets/snapshots?workspace_id=<id>",
+                "snapshot": "POST /api/datasets/snapshots",
+                "diff": "GET /api/datasets/snapshots/diff?workspace_id=<id>&from=<snapshot>&to=<snapshot>"
             },
             "training": {
                 "train": "POST /api/train",
-                "status": "GET /api/train/status"
+                "status": "GET /api/train/status?job_id=<job_id>",
+                "events": "GET /api/train/jobs/<job_id>/events"
             },
             "models": {
                 "list": "GET /api/models",
-                "predict": "POST /api/models/predict"
+                "predict": "POST /api/models/predict",
+                "prediction_cache": "GET /api/models/prediction_cache",
+                "evaluate": "POST /api/models/evaluate",
+                "gc": "POST /api/models/gc",
+                "pin": "POST /api/models/pin"
+            },
+            "pool": {
+                "ingest": "POST /api/pool/ingest",
+                "stats": "GET /api/pool/stats?workspace_id=<id>",
+                "items": "GET /api/pool/items?workspace_id=<id>&status=<status>"
             },
             "admin": {
                 "stats": "GET /api/admin/stats?workspace_id=<id>",
+                "analytics": "GET /api/admin/analytics?workspace_id=<id>&top=<n>",
                 "users": "GET /api/admin/users",
                 "model_health": "GET /api/admin/model_health?workspace_id=<id>"
             },
             "active_learning": {
                 "uncertain_samples": "GET /api/active_learning/uncertain_samples?workspace_id=<id>",
+                "score_pool": "POST /api/active_learning/score_pool",
+                "next_batch": "POST /api/active_learning/next_batch",
+                "release": "POST /api/active_learning/release",
+                "near_duplicates": "GET /api/active_learning/near_duplicates?workspace_id=<id>&sample_id=<id>",
                 "retrain": "POST /api/active_learning/retrain",
                 "avg_accuracy": "GET /api/active_learning/avg_accuracy"
             },
@@ -1,4 +1,3 @@
-import random
 # Accuracy helpers
 def get_accuracy_file(workspace_id: str) -> str:
     ws_dir = get_workspace_dir(workspace_id)
@@ -18,18 +17,11 @@ def load_workspace_accuracy(workspace_id: str) -> float:
     return None
 
 def save_workspace_accuracy(workspace_id: str, value: float) -> None:
-    path = get_accuracy_file(workspace_id)
-    with open(path, 'w', encoding='utf-8') as fh:
-        json.dump(value, fh)
+    atomic_write_json(get_accuracy_file(workspace_id), value, indent=None)
 
 def ensure_workspace_accuracy(workspace_id: str) -> float:
-    acc = load_workspace_accuracy(workspace_id)
-    if acc is not None:
-        return acc
-    # Generate and persist a random accuracy between 60 and 90
-    acc = round(random.uniform(60, 90), 2)
-    save_workspace_accuracy(workspace_id, acc)
-    return acc
+    """Accuracy (%) from the last evaluation, or None if the workspace was never evaluated."""
+    return load_workspace_accuracy(workspace_id)
 # backend/utils/active_learning.py
 """
 Active Learning module: manage uncertain samples, re-annotation, and retraining workflows.
@@ -38,10 +30,28 @@ Workspace-aware storage and robust error handling.
 import os
 import json
 import time
-from typing import List, Dict, Any
+import threading
+import uuid
+from typing import List, Dict, Any, Optional
 
 # Import trainers (do not duplicate, reuse from model_utils)
 from .model_utils import train_spacy_model, train_rasa_model
+from .tfidf_intent import train_tfidf_model
+from .evaluation import evaluate_workspace, headline_accuracy
+from .annotation_store import iter_annotations, append_annotations, replace_annotations
+from .spacy_corpus import append_to_corpus
+from .search_index import index_annotations
+from .snapshots import snapshot_for_training
+from .sampling import prepare_draft_sample
+from .pool import mark_texts_labeled
+from .near_dup import index_texts, group_by_cluster, near_duplicates_of, prepare_deduped
+from .storage import atomic_write_json
+
+_queue_locks: Dict[str, threading.RLock] = {}
+_queue_locks_guard = threading.Lock()
+# how long a reviewer holds a leased batch of uncertain samples
+LEASE_SECONDS = int(os.environ.get('REVIEW_LEASE_SECONDS', '900'))
+MAX_LEASE_BATCH = 100
 
 
 def get_workspace_dir(workspace_id: str) -> str:
@@ -51,6 +61,12 @@ def get_workspace_dir(workspace_id: str) -> str:
     return os.path.abspath(os.path.join(workspaces_root, workspace_id))
 
 
+def uncertain_queue_lock(workspace_id: str) -> threading.RLock:
+    """Lock held around every read-modify-write of a workspace's uncertain_samples.json."""
+    with _queue_locks_guard:
+        return _queue_locks.setdefault(workspace_id, threading.RLock())
+
+
 def get_uncertain_samples_file(workspace_id: str) -> str:
     """Get path to uncertain_samples.json for workspace."""
     ws_dir = get_workspace_dir(workspace_id)
@@ -74,12 +90,9 @@ def load_uncertain_samples(workspace_id: str) -> List[Dict]:
 
 
 def save_uncertain_samples(workspace_id: str, samples: List[Dict]) -> bool:
-    """Save uncertain samples to workspace storage. Return True on success."""
+    """Save uncertain samples to workspace storage (atomically). Return True on success."""
     try:
-        path = get_uncertain_samples_file(workspace_id)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as fh:
-            json.dump(samples, fh, indent=2, ensure_ascii=False)
+        atomic_write_json(get_uncertain_samples_file(workspace_id), samples)
         return True
     except Exception as e:
         print(f"[active_learning] Error saving uncertain samples for {workspace_id}: {e}")
@@ -87,7 +100,7 @@ def save_uncertain_samples(workspace_id: str, samples: List[Dict]) -> bool:
 
 
 def get_annotations_file(workspace_id: str) -> str:
-    """Get path to annotations.json for workspace."""
+    """Get path to annotations.json for workspace (the annotation store's compacted base)."""
     ws_dir = get_workspace_dir(workspace_id)
     data_dir = os.path.join(ws_dir, 'data')
     os.makedirs(data_dir, exist_ok=True)
@@ -97,12 +110,7 @@ def get_annotations_file(workspace_id: str) -> str:
 def load_annotations(workspace_id: str) -> List[Dict]:
     """Load annotations from workspace storage. Return [] if not found."""
     try:
-        path = get_annotations_file(workspace_id)
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as fh:
-                data = json.load(fh) or []
-                return data if isinstance(data, list) else []
-        return []
+        return list(iter_annotations(get_workspace_dir(workspace_id)))
     except Exception as e:
         print(f"[active_learning] Error loading annotations for {workspace_id}: {e}")
         return []
@@ -111,10 +119,7 @@ def load_annotations(workspace_id: str) -> List[Dict]:
 def save_annotations(workspace_id: str, annotations: List[Dict]) -> bool:
     """Save annotations to workspace storage. Return True on success."""
     try:
-        path = get_annotations_file(workspace_id)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as fh:
-            json.dump(annotations, fh, indent=2, ensure_ascii=False)
+        replace_annotations(get_workspace_dir(workspace_id), annotations)
         return True
     except Exception as e:
         print(f"[active_learning] Error saving annotations for {workspace_id}: {e}")
@@ -129,28 +134,40 @@ def add_sample_to_annotations(workspace_id: str, sample: Dict) -> bool:
         sample: sample dict to add (expected keys: text, intent, entities, sample_id)
     Returns: True on success
     """
+    return add_samples_to_annotations(workspace_id, [sample])
+
+
+def add_samples_to_annotations(workspace_id: str, samples: List[Dict]) -> bool:
+    """Move several samples (e.g. a near-duplicate cluster) to annotations.json in one write."""
+    with uncertain_queue_lock(workspace_id):
+        return _add_samples_to_annotations(workspace_id, samples)
+
+
+def _sample_intent(sample: Dict) -> str:
+    return sample.get('predicted_intent', sample.get('intent', ''))
+
+
+def _add_samples_to_annotations(workspace_id: str, samples: List[Dict]) -> bool:
     try:
-        # Load current annotations
-        annotations = load_annotations(workspace_id)
-        
-        # Create annotation entry (remove internal sample_id if present)
-        annotation = {
+        ws_dir = get_workspace_dir(workspace_id)
+
+        # Create annotation entries (remove internal sample_id if present)
+        added = [{
             'text': sample.get('text', ''),
-            'intent': sample.get('predicted_intent', sample.get('intent', '')),
+            'intent': _sample_intent(sample),
             'entities': sample.get('entities', [])
-        }
-        
-        annotations.append(annotation)
+        } for sample in samples]
         
-        # Save updated annotations
-        if not save_annotations(workspace_id, annotations):
-            print(f"[active_learning] Failed to save annotations for {workspace_id}")
-            return False
+        # Append to the annotation store (ids and versions are assigned there)
+        append_annotations(ws_dir, added)
+        append_to_corpus(ws_dir)
+        index_annotations(ws_dir)
+        mark_texts_labeled(ws_dir, [a['text'] for a in added])
         
         # Remove from uncertain samples
         uncertain = load_uncertain_samples(workspace_id)
-        sample_id = sample.get('sample_id')
-        uncertain = [s for s in uncertain if s.get('sample_id') != sample_id]
+        sample_ids = {sample.get('sample_id') for sample in samples}
+        uncertain = [s for s in uncertain if s.get('sample_id') not in sample_ids]
         save_uncertain_samples(workspace_id, uncertain)
         
         return True
@@ -159,83 +176,175 @@ def add_sample_to_annotations(workspace_id: str, sample: Dict) -> bool:
         return False
 
 
-def mark_sample_reviewed(workspace_id: str, sample_id: str, action: str) -> Dict:
+def mark_sample_reviewed(workspace_id: str, sample_id: str, action: str, cluster: bool = False,
+                         lease_id: Optional[str] = None) -> Dict:
     """
     Mark a sample as reviewed and apply action.
     Args:
         workspace_id: workspace identifier
         sample_id: unique sample identifier
         action: 'reviewed' (remove), 'reannotate' (mark for re-annotation), 'add_to_training' (move to annotations)
+        cluster: apply the action to the queued samples of the sample's near-duplicate cluster
+            that are within NEAR_DUP_THRESHOLD of the sample itself; add_to_training only takes
+            those whose predicted intent is the sample's (each is saved with its own labels)
+        lease_id: lease under which the reviewer holds the sample (see next_review_batch); a
+            sample under another active lease is refused with 'lease_conflict'
     Returns: status dict
     """
     try:
-        uncertain = load_uncertain_samples(workspace_id)
-        sample = None
-        idx = None
-        
-        # Find sample
-        for i, s in enumerate(uncertain):
-            if s.get('sample_id') == sample_id:
-                sample = s
-                idx = i
-                break
-        
-        if not sample:
-            return {'error': 'sample_not_found', 'sample_id': sample_id}
-        
-        if action == 'reviewed':
-            # Simply remove from uncertain
-            uncertain.pop(idx)
-            save_uncertain_samples(workspace_id, uncertain)
-            return {'status': 'ok', 'action': 'reviewed', 'sample_id': sample_id}
-        
-        elif action == 'reannotate':
-            # Mark for re-annotation (keep in uncertain, flag it)
-            sample['marked_for_reannotation'] = True
-            uncertain[idx] = sample
-            save_uncertain_samples(workspace_id, uncertain)
-            return {'status': 'ok', 'action': 'reannotate', 'sample_id': sample_id, 'sample': sample}
-        
-        elif action == 'add_to_training':
-            # Add to annotations and remove from uncertain
-            if add_sample_to_annotations(workspace_id, sample):
-                return {'status': 'ok', 'action': 'add_to_training', 'sample_id': sample_id}
+        with uncertain_queue_lock(workspace_id):
+            uncertain = load_uncertain_samples(workspace_id)
+            sample = next((s for s in uncertain if s.get('sample_id') == sample_id), None)
+            if not sample:
+                return {'error': 'sample_not_found', 'sample_id': sample_id}
+            now = time.time()
+            if is_lease_active(sample, now) and sample['lease']['lease_id'] != lease_id:
+                return {'error': 'lease_conflict', 'sample_id': sample_id,
+                        'lease_expires_at': sample['lease']['expires_at']}
+
+            targets = [sample]
+            if cluster:
+                ws_dir = get_workspace_dir(workspace_id)
+                index_texts(ws_dir, [s.get('text', '') for s in uncertain])
+                group = next(g for g in group_by_cluster(ws_dir, uncertain).values() if sample in g)
+                # cluster members leased to another reviewer stay with them
+                group = [s for s in group if s is sample or not is_lease_active(s, now)
+                         or s['lease']['lease_id'] == lease_id]
+                targets = [s for s in near_duplicates_of(sample.get('text', ''), group) if s is not sample]
+                if action == 'add_to_training':
+                    intent = _sample_intent(sample)
+                    targets = [s for s in targets if _sample_intent(s) == intent]
+                targets.insert(0, sample)
+            target_ids = [s.get('sample_id') for s in targets]
+            extra = {'cluster_sample_ids': target_ids} if cluster else {}
+
+            if action == 'reviewed':
+                # Simply remove from uncertain
+                uncertain = [s for s in uncertain if s.get('sample_id') not in target_ids]
+                save_uncertain_samples(workspace_id, uncertain)
+                mark_texts_labeled(get_workspace_dir(workspace_id), [s.get('text', '') for s in targets])
+                return {'status': 'ok', 'action': 'reviewed', 'sample_id': sample_id, **extra}
+
+            elif action == 'reannotate':
+                # Mark for re-annotation (keep in uncertain, flag it) and return it to the queue
+                for s in targets:
+                    s['marked_for_reannotation'] = True
+                    s.pop('lease', None)
+                save_uncertain_samples(workspace_id, uncertain)
+                return {'status': 'ok', 'action': 'reannotate', 'sample_id': sample_id, 'sample': sample, **extra}
+
+            elif action == 'add_to_training':
+                # Add to annotations and remove from uncertain
+                if add_samples_to_annotations(workspace_id, targets):
+                    return {'status': 'ok', 'action': 'add_to_training', 'sample_id': sample_id, **extra}
+                else:
+                    return {'error': 'failed_to_add_to_training', 'sample_id': sample_id}
+
             else:
-                return {'error': 'failed_to_add_to_training', 'sample_id': sample_id}
-        
-        else:
-            return {'error': 'unknown_action', 'action': action}
+                return {'error': 'unknown_action', 'action': action}
     
     except Exception as e:
         print(f"[active_learning] Error marking sample {sample_id} for {workspace_id}: {e}")
         return {'error': str(e), 'sample_id': sample_id}
 
 
-def retrain_workspace(workspace_id: str, backend: str) -> Dict:
+def is_lease_active(sample: Dict, now: Optional[float] = None) -> bool:
+    lease = sample.get('lease')
+    return bool(lease) and lease.get('expires_at', 0) > (time.time() if now is None else now)
+
+
+def next_review_batch(workspace_id: str, reviewer: str, size: int = 20,
+                      lease_seconds: int = LEASE_SECONDS) -> Dict:
+    """
+    Lease the next `size` samples nobody holds (queue order) to a reviewer. Expired leases
+    are dropped first, which returns their samples to the queue.
+    Returns: {'lease_id', 'expires_at', 'samples', 'available'} (available: unleased samples left)
+    """
+    now = time.time()
+    with uncertain_queue_lock(workspace_id):
+        uncertain = load_uncertain_samples(workspace_id)
+        expired = [s for s in uncertain if s.get('lease') and not is_lease_active(s, now)]
+        for s in expired:
+            del s['lease']
+        lease = {'lease_id': uuid.uuid4().hex, 'reviewer': reviewer,
+                 'leased_at': int(now), 'expires_at': int(now + lease_seconds)}
+        batch = []
+        for s in uncertain:
+            if len(batch) >= size:
+                break
+            if 'lease' not in s:
+                s['lease'] = lease
+                batch.append(s)
+        if batch or expired:
+            save_uncertain_samples(workspace_id, uncertain)
+        available = sum(1 for s in uncertain if 'lease' not in s)
+    print(f"[active_learning] {workspace_id}: leased {len(batch)} sample(s) to {reviewer}, "
+          f"{len(expired)} expired lease(s) returned")
+    return {'lease_id': lease['lease_id'] if batch else None, 'expires_at': lease['expires_at'],
+            'samples': batch, 'available': available}
+
+
+def release_lease(workspace_id: str, lease_id: str, sample_ids: Optional[List[str]] = None,
+                  extend_seconds: Optional[int] = None) -> Dict:
+    """
+    Return the samples of a lease (all, or sample_ids) to the queue, or, with extend_seconds,
+    keep them and push the expiry to now + extend_seconds.
+    """
+    now = time.time()
+    with uncertain_queue_lock(workspace_id):
+        uncertain = load_uncertain_samples(workspace_id)
+        held = [s for s in uncertain if is_lease_active(s, now) and s['lease']['lease_id'] == lease_id
+                and (sample_ids is None or s.get('sample_id') in sample_ids)]
+        if not held:
+            return {'error': 'lease_not_found', 'lease_id': lease_id}
+        for s in held:
+            if extend_seconds:
+                s['lease']['expires_at'] = int(now + extend_seconds)
+            else:
+                del s['lease']
+        save_uncertain_samples(workspace_id, uncertain)
+    return {'status': 'ok', 'lease_id': lease_id, 'samples': len(held),
+            'action': 'renewed' if extend_seconds else 'released'}
+
+
+def retrain_workspace(workspace_id: str, backend: str, evaluate: bool = True, folds: int = 0,
+                      sample: Optional[Dict] = None, profile: Optional[str] = None,
+                      dedupe: Optional[str] = None) -> Dict:
     """
     Retrain specified backend(s) using existing train functions from model_utils.
     Args:
         workspace_id: workspace identifier
-        backend: 'rasa', 'spacy', or 'both'
+        backend: 'rasa', 'spacy', 'tfidf', 'both' (spacy + rasa) or 'all'
+        evaluate: run the held-out / k-fold evaluation after training and update accuracy; each
+                  backend is evaluated on the data (sample, dedupe) and profile it was trained with
+        folds: k for cross-validation (0 = single stratified held-out split)
+        sample: optional draft budget ({'rows': n} or {'seconds': s}); trains on a stratified sample
+        profile: Rasa training profile ('quick' / 'full'); default from RASA_DEFAULT_PROFILE
+        dedupe: 'collapse' or 'weight' near-duplicate clusters (weight is tfidf only; others collapse)
     Returns: status dict with training results
     """
     try:
         ws_dir = get_workspace_dir(workspace_id)
         results = {}
+        # backend -> (training annotations, or None for the whole workspace; model version)
+        trained = {}
         
-        accuracy_updated = False
-        if backend in ['spacy', 'both']:
+        if backend in ['spacy', 'both', 'all']:
             try:
                 print(f"[active_learning] Starting spaCy training for {workspace_id}")
-                model_path = train_spacy_model(ws_dir)
-                results['spacy'] = {'status': 'ok', 'model_path': model_path}
+                annotations, extra_meta = prepare_draft_sample(ws_dir, 'spacy', sample) if sample else (None, None)
+                if dedupe:
+                    annotations, extra_meta = prepare_deduped(ws_dir, 'spacy', dedupe, annotations, extra_meta)
+                extra_meta = snapshot_for_training(ws_dir, 'spacy', annotations, extra_meta)
+                model_path = train_spacy_model(ws_dir, annotations=annotations, extra_meta=extra_meta)
+                trained['spacy'] = (annotations, os.path.basename(model_path))
+                results['spacy'] = {'status': 'ok', 'model_path': model_path, 'draft': bool(sample)}
                 print(f"[active_learning] spaCy training completed: {model_path}")
-                accuracy_updated = True
             except Exception as e:
                 results['spacy'] = {'status': 'failed', 'error': str(e)}
                 print(f"[active_learning] spaCy training failed: {e}")
         
-        if backend in ['rasa', 'both']:
+        if backend in ['rasa', 'both', 'all']:
             try:
                 print(f"[active_learning] Starting Rasa training for {workspace_id}")
                 # Ensure RASA_PROJECT_PATH is set
@@ -244,17 +353,56 @@ def retrain_workspace(workspace_id: str, backend: str) -> Dict:
                     repo_root = os.path.abspath(os.path.join(ws_dir, '..', '..', '..'))
                     os_module.environ['RASA_PROJECT_PATH'] = repo_root
                 
-                model_path = train_rasa_model(ws_dir)
-                results['rasa'] = {'status': 'ok', 'model_path': model_path}
+                annotations, extra_meta = prepare_draft_sample(ws_dir, 'rasa', sample) if sample else (None, None)
+                if dedupe:
+                    annotations, extra_meta = prepare_deduped(ws_dir, 'rasa', dedupe, annotations, extra_meta)
+                extra_meta = snapshot_for_training(ws_dir, 'rasa', annotations, extra_meta)
+                model_path = train_rasa_model(ws_dir, annotations=annotations, extra_meta=extra_meta,
+                                              profile=profile)
+                trained['rasa'] = (annotations, os.path.basename(model_path))
+                results['rasa'] = {'status': 'ok', 'model_path': model_path, 'draft': bool(sample)}
                 print(f"[active_learning] Rasa training completed: {model_path}")
-                accuracy_updated = True
             except Exception as e:
                 results['rasa'] = {'status': 'failed', 'error': str(e)}
                 print(f"[active_learning] Rasa training failed: {e}")
-        # Only update accuracy if training succeeded
-        if accuracy_updated:
-            new_acc = round(random.uniform(60, 90), 2)
-            save_workspace_accuracy(workspace_id, new_acc)
+
+        if backend in ['tfidf', 'all']:
+            try:
+                print(f"[active_learning] Starting tfidf training for {workspace_id}")
+                annotations, extra_meta = prepare_draft_sample(ws_dir, 'tfidf', sample) if sample else (None, None)
+                if dedupe:
+                    annotations, extra_meta = prepare_deduped(ws_dir, 'tfidf', dedupe, annotations, extra_meta)
+                extra_meta = snapshot_for_training(ws_dir, 'tfidf', annotations, extra_meta)
+                model_path = train_tfidf_model(ws_dir, annotations=annotations, extra_meta=extra_meta)
+                trained['tfidf'] = (annotations, os.path.basename(model_path))
+                results['tfidf'] = {'status': 'ok', 'model_path': model_path, 'draft': bool(sample)}
+                print(f"[active_learning] tfidf training completed: {model_path}")
+            except Exception as e:
+                results['tfidf'] = {'status': 'failed', 'error': str(e)}
+                print(f"[active_learning] tfidf training failed: {e}")
+
+        # Evaluate each successfully trained backend; accuracy only changes on a real evaluation
+        if evaluate:
+            accuracy = None
+            for name in ['spacy', 'tfidf', 'rasa']:
+                if name not in trained:
+                    continue
+                annotations, model_version = trained[name]
+                try:
+                    evaluation = evaluate_workspace(ws_dir, name, folds=folds, model_version=model_version,
+                                                    annotations=annotations,
+                                                    profile=profile if name == 'rasa' else None)
+                    results[name]['evaluation'] = evaluation
+                    # prefer the backend that predicts intents (rasa is evaluated last); a
+                    # draft sample's score is kept on the draft model, not as workspace accuracy
+                    acc = headline_accuracy(evaluation)
+                    if acc is not None and not sample:
+                        accuracy = acc
+                except Exception as e:
+                    results[name]['evaluation'] = {'status': 'failed', 'error': str(e)}
+                    print(f"[active_learning] {name} evaluation failed: {e}")
+            if accuracy is not None:
+                save_workspace_accuracy(workspace_id, accuracy)
         return {'status': 'training_complete', 'workspace_id': workspace_id, 'results': results}
     
     except Exception as e:
@@ -347,7 +495,7 @@ def get_workspace_stats(workspace_id: str) -> Dict:
         # Count uncertain samples
         uncertain = load_uncertain_samples(workspace_id)
         total_uncertain = len(uncertain)
-        # Load or generate accuracy
+        # Accuracy from the last evaluation (None until evaluated)
         accuracy = ensure_workspace_accuracy(workspace_id)
         return {
             'total_annotations': total_annotations,
@@ -0,0 +1,201 @@
+# backend/utils/analytics.py
+"""
+Dataset analytics for the admin dashboard: class balance, entity span statistics,
+entities per utterance and intent / label co-occurrence.
+
+The annotations are materialized once per data version into NumPy columns (intent code
+and text length per annotation; annotation, label code, start and end per entity span),
+kept in memory and in data/analytics_columns.npz, and every statistic is computed from
+those columns with vectorized operations.
+"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from .annotation_store import iter_annotations, annotations_stamp
+
+COLUMNS_FILE = 'analytics_columns.npz'
+# entities-per-utterance and length histograms put everything above the last bin in it
+MAX_ENTITIES_BIN = 10
+LENGTH_BINS = (0, 10, 20, 40, 80, 160, 320, 640)
+_PERCENTILES = (50, 90, 99)
+
+_cache: Dict[str, Dict] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def data_version(base_dir: str) -> str:
+    return annotations_stamp(base_dir)
+
+
+def _materialize(base_dir: str) -> Dict:
+    intents: Dict[str, int] = {}
+    labels: Dict[str, int] = {}
+    intent_codes: List[int] = []
+    text_lengths: List[int] = []
+    span_ann: List[int] = []
+    span_label: List[int] = []
+    span_start: List[int] = []
+    span_end: List[int] = []
+    for i, ann in enumerate(iter_annotations(base_dir)):
+        intent = ann.get('intent')
+        intent_codes.append(intents.setdefault(intent, len(intents)) if intent else -1)
+        text_lengths.append(len(ann.get('text') or ''))
+        for ent in ann.get('entities') or []:
+            label = ent.get('label') or ent.get('entity')
+            try:
+                start, end = int(ent['start']), int(ent['end'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if label:
+                span_ann.append(i)
+                span_label.append(labels.setdefault(label, len(labels)))
+                span_start.append(start)
+                span_end.append(end)
+    return {
+        'intents': np.array(list(intents), dtype=str),
+        'labels': np.array(list(labels), dtype=str),
+        'intent_code': np.array(intent_codes, dtype=np.int32),
+        'text_length': np.array(text_lengths, dtype=np.int32),
+        'span_ann': np.array(span_ann, dtype=np.int32),
+        'span_label': np.array(span_label, dtype=np.int32),
+        'span_start': np.array(span_start, dtype=np.int32),
+        'span_end': np.array(span_end, dtype=np.int32),
+    }
+
+
+def load_columns(base_dir: str) -> Dict:
+    """Column arrays of the current annotations, materialized at most once per data version."""
+    with _lock(base_dir):
+        version = data_version(base_dir)
+        cached = _cache.get(base_dir)
+        if cached is not None and cached['version'] == version:
+            return cached
+        columns = _load_or_materialize(base_dir, version)
+        columns['version'] = version
+        _cache[base_dir] = columns
+        return columns
+
+
+def _load_or_materialize(base_dir: str, version: str) -> Dict:
+    path = os.path.join(base_dir, 'data', COLUMNS_FILE)
+    columns = None
+    if os.path.exists(path):
+        try:
+            # the file lives in the workspace: never unpickle it (columns are plain arrays)
+            with np.load(path, allow_pickle=False) as npz:
+                if str(npz['version']) == version:
+                    columns = {name: npz[name] for name in npz.files if name != 'version'}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[analytics] Ignoring unreadable {path}: {e}")
+    if columns is None:
+        columns = _materialize(base_dir)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, version=np.array(version), **columns)
+        os.replace(tmp, path)
+        print(f"[analytics] {base_dir}: materialized {len(columns['intent_code'])} annotation(s)")
+    return columns
+
+
+def _summary(values: np.ndarray) -> Dict:
+    if not len(values):
+        return {'count': 0}
+    pct = np.percentile(values, _PERCENTILES)
+    return {'count': int(len(values)), 'mean': round(float(values.mean()), 2), 'min': int(values.min()),
+            'max': int(values.max()), **{f'p{p}': round(float(v), 2) for p, v in zip(_PERCENTILES, pct)}}
+
+
+def _histogram(values: np.ndarray, bins=LENGTH_BINS) -> Dict[str, int]:
+    counts = np.bincount(np.searchsorted(bins, values, side='right') - 1, minlength=len(bins))
+    names = [f'{lo}-{hi - 1}' for lo, hi in zip(bins, bins[1:])] + [f'{bins[-1]}+']
+    return dict(zip(names, counts.tolist()))
+
+
+def compute_analytics(base_dir: str, top: Optional[int] = None) -> Dict:
+    """
+    Label balance, span statistics and co-occurrence of the workspace annotations.
+    top: keep only the `top` most frequent intents / labels in the co-occurrence matrices
+    """
+    c = load_columns(base_dir)
+    intents, labels = list(c['intents']), list(c['labels'])
+    n, n_intents, n_labels = len(c['intent_code']), len(intents), len(labels)
+    has_intent = c['intent_code'] >= 0
+
+    # class balance
+    intent_counts = np.bincount(c['intent_code'][has_intent], minlength=n_intents)
+    shares = intent_counts / max(intent_counts.sum(), 1)
+    nonzero = shares[shares > 0]
+    balance = {
+        'counts': dict(zip(intents, intent_counts.tolist())),
+        'unlabelled': int(n - has_intent.sum()),
+        'imbalance_ratio': round(float(intent_counts.max() / intent_counts[intent_counts > 0].min()), 2)
+        if nonzero.size else None,
+        # 1.0 = perfectly balanced, 0.0 = a single intent
+        'normalized_entropy': round(float(-(nonzero * np.log(nonzero)).sum() / np.log(nonzero.size)), 4)
+        if nonzero.size > 1 else 0.0,
+    }
+
+    # entity spans
+    span_len = c['span_end'] - c['span_start']
+    label_counts = np.bincount(c['span_label'], minlength=n_labels)
+    # empty / reversed spans are only reported in invalid_spans, not in the length statistics
+    valid_len = span_len[span_len > 0]
+    valid_label = c['span_label'][span_len > 0]
+    order = np.argsort(valid_label, kind='stable')
+    bounds = np.searchsorted(valid_label[order], np.arange(n_labels + 1))
+    span_lengths = {
+        label: {**_summary(valid_len[order[bounds[j]:bounds[j + 1]]]),
+                'histogram': _histogram(valid_len[order[bounds[j]:bounds[j + 1]]])}
+        for j, label in enumerate(labels)
+    }
+    invalid = int(((span_len <= 0) | (c['span_end'] > c['text_length'][c['span_ann']])).sum()) if n else 0
+
+    # entities per utterance
+    per_utt = np.bincount(c['span_ann'], minlength=n)
+    per_intent = np.bincount(c['intent_code'][has_intent], weights=per_utt[has_intent], minlength=n_intents)
+    entities_per_utterance = {
+        **_summary(per_utt),
+        'histogram': dict(zip([str(k) for k in range(MAX_ENTITIES_BIN)] + [f'{MAX_ENTITIES_BIN}+'],
+                              np.bincount(np.minimum(per_utt, MAX_ENTITIES_BIN),
+                                          minlength=MAX_ENTITIES_BIN + 1).tolist())),
+        'mean_by_intent': {intent: round(float(per_intent[j] / intent_counts[j]), 3)
+                           for j, intent in enumerate(intents) if intent_counts[j]},
+    }
+
+    # co-occurrence: utterances x labels incidence, utterances x intents one-hot
+    incidence = sp.csr_matrix((np.ones(len(c['span_ann']), dtype=np.int32), (c['span_ann'], c['span_label'])),
+                              shape=(n, n_labels))
+    incidence.data[:] = 1       # duplicates were summed: count utterances, not spans
+    one_hot = sp.csr_matrix((np.ones(int(has_intent.sum()), dtype=np.int32),
+                             (np.flatnonzero(has_intent), c['intent_code'][has_intent])), shape=(n, n_intents))
+    intent_label = (one_hot.T @ incidence).toarray()
+    label_label = (incidence.T @ incidence).toarray()
+    top_intents = np.argsort(-intent_counts, kind='stable')[:top] if top else np.arange(n_intents)
+    top_labels = np.argsort(-label_counts, kind='stable')[:top] if top else np.arange(n_labels)
+
+    return {
+        'version': c['version'],
+        'total_annotations': n,
+        'total_entities': int(len(span_len)),
+        'invalid_spans': invalid,
+        'text_length': {**_summary(c['text_length']), 'histogram': _histogram(c['text_length'])},
+        'class_balance': balance,
+        'entity_labels': dict(zip(labels, label_counts.tolist())),
+        'entity_length': span_lengths,
+        'entities_per_utterance': entities_per_utterance,
+        'intent_label_cooccurrence': {
+            'intents': [intents[j] for j in top_intents], 'labels': [labels[j] for j in top_labels],
+            'matrix': intent_label[np.ix_(top_intents, top_labels)].tolist()},
+        'label_cooccurrence': {
+            'labels': [labels[j] for j in top_labels],
+            'matrix': label_label[np.ix_(top_labels, top_labels)].tolist()},
+    }
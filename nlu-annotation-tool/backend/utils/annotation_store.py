@@ -0,0 +1,433 @@
+# backend/utils/annotation_store.py
+"""
+Workspace annotation store: annotations.json plus an append-only journal.
+
+Every annotation has a server-assigned integer 'id', stable for its lifetime and never
+reused, and a 'version' bumped on every update. Updates and deletes name the version
+they were based on and are refused when the record changed since (optimistic
+concurrency).
+
+Writes append one line per operation to data/annotations.journal.jsonl, so adding,
+updating or deleting a record costs the size of that record, not of the workspace.
+annotations.json is the compacted base (one record per line): readers see it with the
+journal applied on top, and once the journal holds ANNOTATION_JOURNAL_MAX_OPS operations
+it is folded into a new base. A byte-offset index of the base makes reading a single
+record a seek.
+
+Operations carry sequence numbers, so derived indexes (search index, spaCy corpus) apply
+just the changes since their last sync (changes_since) and only re-read everything
+when those changes have been compacted away. A base written by anything else (an older
+version of the tool, a restored backup) is adopted on first access: records keep a valid
+unique id and get a new one otherwise.
+"""
+import os
+import json
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .storage import iter_json_array, atomic_write_json
+from .artifact_store import unshare
+
+STORE_FORMAT = 1
+ANNOTATIONS_FILE = 'annotations.json'
+JOURNAL_FILE = 'annotations.journal.jsonl'
+STATE_FILE = 'annotations.state.json'
+OFFSETS_FILE = 'annotations.offsets.npz'
+# journaled operations folded into annotations.json at once
+ANNOTATION_JOURNAL_MAX_OPS = int(os.environ.get('ANNOTATION_JOURNAL_MAX_OPS', '10000'))
+# assigned by the store; ignored in client payloads
+RESERVED_FIELDS = ('id', 'version')
+
+_journals: Dict[str, Dict] = {}
+_offsets: Dict[str, Tuple[str, np.ndarray, np.ndarray]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def _path(base_dir: str, name: str) -> str:
+    return os.path.join(base_dir, 'data', name)
+
+
+def _file_stamp(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ''
+    return f'{st.st_mtime_ns}:{st.st_size}'
+
+
+def _valid_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def annotations_stamp(base_dir: str) -> str:
+    """Changes whenever the annotations do (two stats, no reads): a cache key for derived data."""
+    return _file_stamp(_path(base_dir, ANNOTATIONS_FILE)) + '|' + _file_stamp(_path(base_dir, JOURNAL_FILE))
+
+
+# ---------- journal ----------
+def _journal(base_dir: str) -> List[Dict]:
+    """Complete operations in the journal; only the bytes appended since the last call are parsed."""
+    key = os.path.abspath(base_dir)
+    path = _path(base_dir, JOURNAL_FILE)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _journals.pop(key, None)
+        return []
+    cached = _journals.get(key)
+    if not cached or cached['ino'] != st.st_ino or cached['size'] > st.st_size:
+        cached = _journals[key] = {'ino': st.st_ino, 'size': 0, 'ops': []}
+    if st.st_size > cached['size']:
+        with open(path, 'rb') as fh:
+            fh.seek(cached['size'])
+            data = fh.read()
+        # a torn last line (crash mid-append) is not an operation; the next append drops it
+        end = data.rfind(b'\n') + 1
+        cached['ops'].extend(json.loads(line) for line in data[:end].splitlines() if line.strip())
+        cached['size'] += end
+    return cached['ops']
+
+
+def _append_ops(base_dir: str, ops: List[Dict]) -> None:
+    path = _path(base_dir, JOURNAL_FILE)
+    unshare(path)       # copy on first write when shared with a cloned workspace
+    _journal(base_dir)
+    complete = _journals.get(os.path.abspath(base_dir), {}).get('size', 0)
+    with open(path, 'ab') as fh:
+        if fh.tell() > complete:
+            fh.truncate(complete)
+        fh.write(b''.join(json.dumps(op, ensure_ascii=False).encode('utf-8') + b'\n' for op in ops))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _overlay(ops: Iterable[Dict]) -> 'OrderedDict[int, Optional[Dict]]':
+    """Latest record per id (None when deleted), ids in order of first appearance."""
+    overlay: 'OrderedDict[int, Optional[Dict]]' = OrderedDict()
+    for op in ops:
+        overlay[op['id']] = op.get('record') if op['op'] != 'delete' else None
+    return overlay
+
+
+# ---------- base ----------
+def _write_base(base_dir: str, records: Iterable[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Write annotations.json one record per line. Returns (ids, byte offsets) of the records."""
+    path = _path(base_dir, ANNOTATIONS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + ANNOTATIONS_FILE, suffix='.tmp')
+    ids: List[int] = []
+    offsets: List[int] = []
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(b'[')
+            pos = 1
+            for record in records:
+                line = (b',\n' if ids else b'\n') + json.dumps(record, ensure_ascii=False).encode('utf-8')
+                ids.append(record['id'])
+                offsets.append(pos + (2 if len(ids) > 1 else 1))
+                fh.write(line)
+                pos += len(line)
+            fh.write(b'\n]\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def _rewrite(base_dir: str, state: Optional[Dict], adopt: bool) -> Dict:
+    """
+    Fold the journal into a new annotations.json with its offsets index and start an empty
+    journal. Call under the lock.
+    adopt: the base was not written by the store; repair ids and start a new generation
+    """
+    base = _path(base_dir, ANNOTATIONS_FILE)
+    base_seq = state['base_seq'] if state else 0
+    ops = [op for op in _journal(base_dir) if op['seq'] > base_seq]
+    overlay = _overlay(ops)
+    seq = ops[-1]['seq'] if ops else base_seq
+    next_id = (state or {}).get('next_id', 1)
+    if adopt and os.path.exists(base):
+        taken = {r.get('id') for r in iter_json_array(base) if isinstance(r, dict) and _valid_id(r.get('id'))}
+        next_id = max([next_id - 1, *taken, *overlay]) + 1
+    seen = set()
+
+    def merged():
+        nonlocal next_id
+        records = iter_json_array(base) if os.path.exists(base) else ()
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            rid = record.get('id')
+            if adopt:
+                if not _valid_id(rid) or rid in seen:
+                    rid, next_id = next_id, next_id + 1
+                seen.add(rid)
+                version = record.get('version')
+                record = {**record, 'id': rid, 'version': version if _valid_id(version) else 1}
+            if rid in overlay:
+                record = overlay.pop(rid)
+                if record is None:
+                    continue
+            yield record
+        for record in overlay.values():
+            if record is not None:
+                yield record
+
+    ids, offsets = _write_base(base_dir, merged())
+    if len(ids):
+        next_id = max(next_id, int(ids.max()) + 1)
+    stamp = _file_stamp(base)
+    order = np.argsort(ids, kind='stable')
+    _save_offsets(base_dir, stamp, ids[order], offsets[order])
+    state = {
+        'format': STORE_FORMAT,
+        'generation': uuid.uuid4().hex if adopt or not state else state['generation'],
+        'base_seq': seq,
+        'base_stamp': stamp,
+        'count': int(len(ids)),
+        'next_id': next_id,
+    }
+    atomic_write_json(_path(base_dir, STATE_FILE), state)
+    # operations up to base_seq are ignored from now on; dropping them is just cleanup
+    journal = _path(base_dir, JOURNAL_FILE)
+    if os.path.exists(journal):
+        open(journal + '.tmp', 'wb').close()
+        os.replace(journal + '.tmp', journal)
+    print(f"[annotation_store] {base_dir}: {'adopted' if adopt else 'compacted'} {len(ids)} annotation(s), "
+          f"{len(ops)} journaled operation(s)")
+    return state
+
+
+def _save_offsets(base_dir: str, stamp: str, ids: np.ndarray, offsets: np.ndarray) -> None:
+    path = _path(base_dir, OFFSETS_FILE)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, stamp=np.array(stamp), ids=ids, offsets=offsets)
+    os.replace(tmp, path)
+    _offsets[os.path.abspath(base_dir)] = (stamp, ids, offsets)
+
+
+def _load_offsets(base_dir: str, stamp: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    key = os.path.abspath(base_dir)
+    cached = _offsets.get(key)
+    if cached is None or cached[0] != stamp:
+        try:
+            with np.load(_path(base_dir, OFFSETS_FILE)) as npz:
+                cached = (str(npz['stamp']), npz['ids'], npz['offsets'])
+        except (OSError, ValueError, KeyError):
+            return None
+        if cached[0] != stamp:
+            return None
+        _offsets[key] = cached
+    return cached[1], cached[2]
+
+
+def _current(base_dir: str) -> Tuple[Dict, List[Dict]]:
+    """Store state and the operations past its base, adopting the base first if needed. Call under the lock."""
+    try:
+        with open(_path(base_dir, STATE_FILE), 'r', encoding='utf-8') as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        state = None
+    if not state or state.get('format') != STORE_FORMAT:
+        state = _rewrite(base_dir, None, adopt=True)
+    elif state['base_stamp'] != _file_stamp(_path(base_dir, ANNOTATIONS_FILE)):
+        state = _rewrite(base_dir, state, adopt=True)
+    elif _load_offsets(base_dir, state['base_stamp']) is None:
+        state = _rewrite(base_dir, state, adopt=False)
+    return state, [op for op in _journal(base_dir) if op['seq'] > state['base_seq']]
+
+
+def _position(state: Dict, ops: List[Dict]) -> Tuple[int, int, int]:
+    """(last sequence number, next id, record count)"""
+    seq = ops[-1]['seq'] if ops else state['base_seq']
+    next_id = max([state['next_id'], *(op['id'] + 1 for op in ops)])
+    count = state['count'] + sum(op['op'] == 'insert' for op in ops) - sum(op['op'] == 'delete' for op in ops)
+    return seq, next_id, count
+
+
+def _lookup(base_dir: str, state: Dict, ops: List[Dict], annotation_id: int) -> Optional[Dict]:
+    for op in reversed(ops):
+        if op['id'] == annotation_id:
+            return op.get('record') if op['op'] != 'delete' else None
+    ids, offsets = _load_offsets(base_dir, state['base_stamp'])
+    i = int(np.searchsorted(ids, annotation_id))
+    if i >= len(ids) or ids[i] != annotation_id:
+        return None
+    with open(_path(base_dir, ANNOTATIONS_FILE), 'rb') as fh:
+        fh.seek(int(offsets[i]))
+        return json.loads(fh.readline().rstrip().rstrip(b','))
+
+
+def _maybe_compact(base_dir: str, state: Dict, ops: List[Dict]) -> None:
+    if len(ops) >= ANNOTATION_JOURNAL_MAX_OPS:
+        _rewrite(base_dir, state, adopt=False)
+
+
+# ---------- reads ----------
+def open_annotations(base_dir: str) -> Tuple[str, int, Iterator[Dict]]:
+    """
+    (generation, sequence number, records) of a consistent view of the annotations:
+    a derived index built from these records is up to date as of that position.
+    """
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        overlay = _overlay(ops)
+        seq = _position(state, ops)[0]
+        fh = open(_path(base_dir, ANNOTATIONS_FILE), 'r', encoding='utf-8')
+
+    def records():
+        for record in iter_json_array(fh):
+            if record['id'] in overlay:
+                record = overlay.pop(record['id'])
+                if record is None:
+                    continue
+            yield record
+        for record in overlay.values():
+            if record is not None:
+                yield record
+
+    return state['generation'], seq, records()
+
+
+def iter_annotations(base_dir: str) -> Iterator[Dict]:
+    """The workspace annotations in order (journal applied), streamed."""
+    return open_annotations(base_dir)[2]
+
+
+def get_annotation(base_dir: str, annotation_id: int) -> Optional[Dict]:
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        return _lookup(base_dir, state, ops, annotation_id)
+
+
+def annotation_count(base_dir: str) -> int:
+    with _lock(base_dir):
+        return _position(*_current(base_dir))[2]
+
+
+def store_position(base_dir: str) -> Tuple[str, int]:
+    """(generation, last sequence number): derived indexes at this position are up to date."""
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        return state['generation'], _position(state, ops)[0]
+
+
+def changes_since(base_dir: str, generation: Optional[str], seq: int,
+                  previous: bool = False) -> Optional[List[Dict]]:
+    """
+    Operations ({'seq', 'op': 'insert'|'update'|'delete', 'id', 'record'?}) after `seq`, or
+    None when they are no longer available (another generation, or compacted away) and
+    the caller has to rebuild from iter_annotations.
+    previous: add the record as it was before each update / delete as 'previous', for
+              consumers that keep aggregates rather than records
+    """
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        if generation != state['generation'] or seq < state['base_seq']:
+            return None
+        changes = [op for op in ops if op['seq'] > seq]
+        if not previous:
+            return changes
+        known = _overlay(op for op in ops if op['seq'] <= seq)
+        result = []
+        for op in changes:
+            if op['op'] != 'insert':
+                before = known[op['id']] if op['id'] in known else _lookup(base_dir, state, [], op['id'])
+                op = dict(op, previous=before)
+            known[op['id']] = op.get('record') if op['op'] != 'delete' else None
+            result.append(op)
+        return result
+
+
+# ---------- writes ----------
+def append_annotations(base_dir: str, records: List[Dict]) -> List[Dict]:
+    """Add records with new ids (version 1). Returns the stored records."""
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        seq, next_id, _ = _position(state, ops)
+        added, new_ops = [], []
+        for record in records:
+            seq += 1
+            record = {**{k: v for k, v in record.items() if k not in RESERVED_FIELDS}, 'id': next_id, 'version': 1}
+            new_ops.append({'seq': seq, 'op': 'insert', 'id': next_id, 'record': record})
+            added.append(record)
+            next_id += 1
+        if new_ops:
+            _append_ops(base_dir, new_ops)
+            _maybe_compact(base_dir, state, ops + new_ops)
+    return added
+
+
+def update_annotation(base_dir: str, annotation_id: int, changes: Dict, version: Optional[int] = None) -> Dict:
+    """
+    Apply `changes` (top-level fields) to a record, if it is still at `version` (None: any).
+    Returns: {'status': 'ok', 'annotation'} or {'error': 'annotation_not_found' | 'version_conflict', ...}
+    """
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        current = _lookup(base_dir, state, ops, annotation_id)
+        if current is None:
+            return {'error': 'annotation_not_found', 'id': annotation_id}
+        if version is not None and version != current['version']:
+            return {'error': 'version_conflict', 'id': annotation_id, 'version': current['version'],
+                    'annotation': current}
+        record = {**current, **{k: v for k, v in changes.items() if k not in RESERVED_FIELDS},
+                  'version': current['version'] + 1}
+        op = {'seq': _position(state, ops)[0] + 1, 'op': 'update', 'id': annotation_id, 'record': record}
+        _append_ops(base_dir, [op])
+        _maybe_compact(base_dir, state, ops + [op])
+    return {'status': 'ok', 'annotation': record}
+
+
+def delete_annotation(base_dir: str, annotation_id: int, version: Optional[int] = None) -> Dict:
+    """
+    Delete a record, if it is still at `version` (None: any).
+    Returns: {'status': 'ok', 'annotation': deleted record} or an error dict as update_annotation
+    """
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        current = _lookup(base_dir, state, ops, annotation_id)
+        if current is None:
+            return {'error': 'annotation_not_found', 'id': annotation_id}
+        if version is not None and version != current['version']:
+            return {'error': 'version_conflict', 'id': annotation_id, 'version': current['version'],
+                    'annotation': current}
+        op = {'seq': _position(state, ops)[0] + 1, 'op': 'delete', 'id': annotation_id}
+        _append_ops(base_dir, [op])
+        _maybe_compact(base_dir, state, ops + [op])
+    return {'status': 'ok', 'annotation': current}
+
+
+def replace_annotations(base_dir: str, records: List[Dict]) -> int:
+    """
+    Replace the whole dataset (a full rewrite, for bulk edits). Records keep a valid id
+    they already have; the others get new ids. Returns the number of records.
+    """
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        _, next_id, _ = _position(state, ops)
+        atomic_write_json(_path(base_dir, ANNOTATIONS_FILE), records)
+        state = {**state, 'next_id': next_id, 'base_seq': _position(state, ops)[0]}
+        return _rewrite(base_dir, state, adopt=True)['count']
+
+
+def compact_annotations(base_dir: str) -> Dict:
+    """Fold the journal into annotations.json now. Returns the store state."""
+    with _lock(base_dir):
+        state, ops = _current(base_dir)
+        return _rewrite(base_dir, state, adopt=False) if ops else state
@@ -0,0 +1,273 @@
+# backend/utils/artifact_store.py
+"""
+Content-addressed artifact store for trained models.
+
+Each artifact is stored once as store/sha256/<ab>/<digest> and exposed in workspace
+directories through hardlinks (or reflinks / copies when hardlinks are not possible),
+so identical models are shared and "copying" a model into a workspace is a metadata
+operation. Hardlinks are counted by the filesystem; workspace files that got a reflink
+or copy of a blob (store on another filesystem) are recorded in store/links.json. A blob
+with no other hardlink and no recorded copy left is unreferenced and removed by
+gc_store().
+
+Adding a blob and linking it somewhere are separate calls: callers hold store_lock()
+around both, and gc_store() holds it for the whole run, so a fresh blob is never
+collected before its first link exists.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STORE_ROOT = os.environ.get('ARTIFACT_STORE_PATH') or os.path.join(BACKEND_DIR, 'models', 'store')
+
+# Linux FICLONE ioctl (_IOW(0x94, 9, int)): copy-on-write clone on btrfs/xfs
+_FICLONE = 0x40049409
+_HASH_CHUNK = 1024 * 1024
+
+_sources_lock = threading.Lock()
+_store_lock = threading.RLock()
+
+
+def store_lock() -> threading.RLock:
+    """Held around put_* + link_into sequences; gc_store() does not run meanwhile."""
+    return _store_lock
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(STORE_ROOT, 'sha256', digest[:2], digest)
+
+
+def _sources_file() -> str:
+    return os.path.join(STORE_ROOT, 'sources.json')
+
+
+def _load_sources() -> Dict:
+    try:
+        with open(_sources_file(), 'r', encoding='utf-8') as fh:
+            return json.load(fh) or {}
+    except Exception:
+        return {}
+
+
+def _save_sources(sources: Dict) -> None:
+    os.makedirs(STORE_ROOT, exist_ok=True)
+    tmp = _sources_file() + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(sources, fh, indent=2)
+    os.replace(tmp, _sources_file())
+
+
+def _links_file() -> str:
+    return os.path.join(STORE_ROOT, 'links.json')
+
+
+def _load_links() -> Dict[str, List[str]]:
+    try:
+        with open(_links_file(), 'r', encoding='utf-8') as fh:
+            return json.load(fh) or {}
+    except Exception:
+        return {}
+
+
+def _save_links(links: Dict[str, List[str]]) -> None:
+    os.makedirs(STORE_ROOT, exist_ok=True)
+    tmp = _links_file() + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(links, fh, indent=2, sort_keys=True)
+    os.replace(tmp, _links_file())
+
+
+def _record_link(digest: str, path: str, method: str) -> None:
+    """Remember a reflink / copy of a blob: the filesystem does not count those as links."""
+    if method in ('hardlink', 'existing'):
+        return
+    with _store_lock:
+        links = _load_links()
+        paths = links.setdefault(digest, [])
+        path = os.path.abspath(path)
+        if path not in paths:
+            paths.append(path)
+            _save_links(links)
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_digest(path: str) -> str:
+    """sha256 of a source file, cached by (size, mtime) so unchanged sources are hashed once."""
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    with _sources_lock:
+        cached = _load_sources().get(key)
+    if cached and cached.get('size') == st.st_size and cached.get('mtime_ns') == st.st_mtime_ns:
+        return cached['sha256']
+    digest = file_sha256(path)
+    with _sources_lock:
+        sources = _load_sources()
+        sources[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        # forget sources that no longer exist
+        sources = {p: v for p, v in sources.items() if os.path.exists(p)}
+        _save_sources(sources)
+    return digest
+
+
+def _reflink(src: str, dest: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        shutil.copystat(src, dest)
+        return True
+    except OSError:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        return False
+
+
+def _materialize(src: str, dest: str) -> str:
+    """Create dest with the contents of src: hardlink, else reflink, else copy. Returns the method."""
+    tmp = dest + '.tmp_link'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        method = 'hardlink'
+    except OSError:
+        if _reflink(src, tmp):
+            method = 'reflink'
+        else:
+            shutil.copy2(src, tmp)
+            method = 'copy'
+    os.replace(tmp, dest)
+    return method
+
+
+def share_file(src: str, dest: str) -> str:
+    """Create dest sharing the contents of src (hardlink, else reflink, else copy). Returns the method."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    return _materialize(src, dest)
+
+
+def unshare(path: str) -> bool:
+    """
+    Give path its own copy (reflink, else copy) if it is hardlinked elsewhere, so it can be
+    modified in place without changing the other links. Returns True when it was shared.
+    """
+    try:
+        if os.stat(path).st_nlink <= 1:
+            return False
+    except FileNotFoundError:
+        return False
+    tmp = path + '.tmp_unshare'
+    if not _reflink(path, tmp):
+        shutil.copy2(path, tmp)
+    os.replace(tmp, path)
+    return True
+
+
+def put_file(path: str, digest: Optional[str] = None) -> str:
+    """
+    Add a file to the store (no-op if its content is already stored). Returns its sha256.
+    digest: the sha256 of path when the caller already verified it (skips hashing)
+    """
+    digest = digest or _source_digest(path)
+    blob = _blob_path(digest)
+    with _store_lock:
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            _record_link(digest, path, _materialize(path, blob))
+    return digest
+
+
+def put_bytes(data: bytes) -> str:
+    """Add a blob given as bytes (no-op if already stored). Returns its sha256."""
+    digest = hashlib.sha256(data).hexdigest()
+    blob = _blob_path(digest)
+    with _store_lock:
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f'{blob}.tmp{os.getpid()}_{threading.get_ident()}'
+            with open(tmp, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, blob)
+    return digest
+
+
+def link_into(digest: str, dest: str) -> str:
+    """
+    Expose a stored blob at dest. Returns 'existing', 'hardlink', 'reflink' or 'copy'.
+    """
+    blob = _blob_path(digest)
+    with _store_lock:
+        if not os.path.exists(blob):
+            raise FileNotFoundError('artifact not in store: ' + digest)
+        if os.path.exists(dest):
+            if os.path.samefile(blob, dest):
+                return 'existing'
+            os.remove(dest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        method = _materialize(blob, dest)
+        _record_link(digest, dest, method)
+    return method
+
+
+def blob_path(digest: str) -> Optional[str]:
+    """Path of a stored blob, or None if it is not in the store."""
+    p = _blob_path(digest)
+    return p if os.path.exists(p) else None
+
+
+def _is_copy_of(path: str, size: int) -> bool:
+    """A recorded reflink / copy still stands for the blob (same size; content is not re-hashed)."""
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
+
+
+def gc_store(dry_run: bool = False) -> Dict:
+    """Delete blobs that are no longer linked or copied anywhere outside the store."""
+    report = {'deleted': [], 'reclaimed_bytes': 0}
+    root = os.path.join(STORE_ROOT, 'sha256')
+    if not os.path.isdir(root):
+        return report
+    with _store_lock:
+        links = _load_links()
+        kept_links = {}
+        for prefix in os.listdir(root):
+            pdir = os.path.join(root, prefix)
+            for name in os.listdir(pdir):
+                p = os.path.join(pdir, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                copies = [c for c in links.get(name, []) if _is_copy_of(c, st.st_size)]
+                if copies:
+                    kept_links[name] = copies
+                if st.st_nlink > 1 or copies or '.tmp' in name:
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        continue
+                report['deleted'].append(p)
+                report['reclaimed_bytes'] += st.st_size
+        if not dry_run and kept_links != links:
+            _save_links(kept_links)
+    return report
@@ -0,0 +1,154 @@
+# backend/utils/committee.py
+"""
+Query-by-committee scoring: every trained workspace model (spaCy, Rasa, tfidf, or
+explicit versions of them) is a committee member running in its own worker process.
+Each batch of pool texts is sent to all members at once; the disagreement between
+their answers ranks the batch.
+
+intent:  vote entropy of the members' predicted intents and the (generalised)
+         Jensen-Shannon divergence of their intent distributions, both in [0, 1]
+entity:  mean pairwise Jaccard distance between the members' entity span sets
+A component needs at least two members that predict it; the committee score of a
+text is the larger of its intent and entity disagreement.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .inference import BACKENDS, resolve_model, predict_with_model
+from .prediction_cache import cached_predict
+
+COMMITTEE_STRATEGY = 'committee'
+# backends that can vote on intents / entities (spaCy has no intent classifier, tfidf no NER)
+INTENT_BACKENDS = ('rasa', 'tfidf')
+ENTITY_BACKENDS = ('spacy', 'rasa')
+
+_member = {}
+
+
+def resolve_members(base_dir: str, members: Optional[List[str]] = None) -> List[Tuple[str, str, str]]:
+    """
+    Committee members as (name, backend, model_path).
+    members: ['backend' | 'backend:model_version', ...]; default the latest model of every backend
+    """
+    resolved = []
+    for spec in members or BACKENDS:
+        backend, _, version = spec.partition(':')
+        path = resolve_model(base_dir, backend, version or None)
+        if not path:
+            if members:
+                raise FileNotFoundError(f'committee member not found: {spec}')
+            continue
+        name = f'{backend}:{os.path.basename(path)}'
+        if all(name != r[0] for r in resolved):
+            resolved.append((name, backend, path))
+    return resolved
+
+
+def _init_member(base_dir: str, backend: str, model_path: str) -> None:
+    _member.update(base_dir=base_dir, backend=backend, model_path=model_path)
+
+
+def _member_predict(texts: List[str]) -> List[Dict]:
+    backend, model_path = _member['backend'], _member['model_path']
+    return cached_predict(_member['base_dir'], backend, model_path, 'predict', texts,
+                          lambda batch: predict_with_model(backend, model_path, batch),
+                          lowercase=backend == 'tfidf')
+
+
+def intent_disagreement(predictions: List[Dict]) -> Dict:
+    """Vote entropy and Jensen-Shannon divergence of several members' predictions of one text."""
+    votes = Counter(p['intent'] for p in predictions)
+    m = len(predictions)
+    counts = np.fromiter(votes.values(), dtype=np.float64) / m
+    vote_entropy = float(-(counts * np.log(counts)).sum() / np.log(m))
+
+    labels = sorted({r['name'] for p in predictions for r in p['intent_ranking']} | set(votes))
+    index = {name: i for i, name in enumerate(labels)}
+    dists = np.full((m, len(labels)), 1e-12)
+    for row, p in zip(dists, predictions):
+        ranking = p['intent_ranking'] or [{'name': p['intent'], 'confidence': p.get('confidence') or 1.0}]
+        for r in ranking:
+            row[index[r['name']]] += r.get('confidence') or 0.0
+    dists /= dists.sum(axis=1, keepdims=True)
+
+    def entropy(d):
+        return -(d * np.log(d)).sum(axis=-1)
+    consensus = dists.mean(axis=0)
+    js = float((entropy(consensus) - entropy(dists).mean()) / np.log(m))
+    top = int(np.argmax(consensus))
+    return {
+        'intent': labels[top],
+        'confidence': round(float(consensus[top]), 4),
+        'intent_ranking': [{'name': labels[j], 'confidence': round(float(consensus[j]), 4)}
+                           for j in np.argsort(-consensus)[:3]],
+        'scores': {'vote_entropy': round(abs(vote_entropy), 4),
+                   'jensen_shannon': round(min(max(js, 0.0), 1.0), 4)},
+    }
+
+
+def entity_disagreement(predictions: List[Dict]) -> Dict:
+    """Mean pairwise Jaccard distance of span sets; entities predicted by a majority are kept."""
+    sets = [{(e['start'], e['end'], e['label']) for e in p['entities']} for p in predictions]
+    distances = [1.0 - len(a & b) / len(a | b) if a | b else 0.0 for a, b in combinations(sets, 2)]
+    votes = Counter(span for s in sets for span in s)
+    majority = [{'start': s, 'end': e, 'label': label, 'votes': n}
+                for (s, e, label), n in sorted(votes.items()) if n * 2 > len(sets)]
+    return {'entities': majority, 'scores': {'jaccard': round(float(np.mean(distances)), 4)}}
+
+
+class CommitteeScorer:
+    """Scores batches of texts by member disagreement; one worker process per member."""
+
+    def __init__(self, base_dir: str, members: Optional[List[str]] = None):
+        self.members = resolve_members(base_dir, members)
+        self.intent_members = [m for m in self.members if m[1] in INTENT_BACKENDS]
+        self.entity_members = [m for m in self.members if m[1] in ENTITY_BACKENDS]
+        if len(self.intent_members) < 2 and len(self.entity_members) < 2:
+            raise FileNotFoundError(
+                'committee needs at least two trained models predicting intents or entities; '
+                f"found {[m[0] for m in self.members]}")
+        self._pools = {
+            name: ProcessPoolExecutor(max_workers=1, initializer=_init_member,
+                                      initargs=(base_dir, backend, path))
+            for name, backend, path in self.members
+        }
+
+    @property
+    def model_versions(self) -> Dict[str, str]:
+        return {name: os.path.basename(path) for name, _, path in self.members}
+
+    def score_batch(self, texts: List[str], strategy: str = COMMITTEE_STRATEGY) -> List[Dict]:
+        """Returns one dict per text with consensus predictions, disagreement scores and the ranking score."""
+        futures = {name: pool.submit(_member_predict, texts) for name, pool in self._pools.items()}
+        answers = {name: future.result() for name, future in futures.items()}
+        rows = []
+        for i, text in enumerate(texts):
+            row = {'text': text, 'scores': {},
+                   'committee': {name: {'intent': answers[name][i]['intent'],
+                                        'entities': answers[name][i]['entities']}
+                                 for name, _, _ in self.members}}
+            if len(self.intent_members) >= 2:
+                intent = intent_disagreement([answers[m[0]][i] for m in self.intent_members])
+                row['predicted_intent'] = intent['intent']
+                row['confidence'] = intent['confidence']
+                row['intent_ranking'] = intent['intent_ranking']
+                scores = intent['scores']
+                scores[COMMITTEE_STRATEGY] = round((scores['vote_entropy'] + scores['jensen_shannon']) / 2, 4)
+                row['scores']['intent'] = scores
+            if len(self.entity_members) >= 2:
+                entity = entity_disagreement([answers[m[0]][i] for m in self.entity_members])
+                row['entities'] = entity['entities']
+                entity['scores'][COMMITTEE_STRATEGY] = entity['scores']['jaccard']
+                row['scores']['entity'] = entity['scores']
+            row['score'] = max(s[COMMITTEE_STRATEGY] for s in row['scores'].values())
+            rows.append(row)
+        return rows
+
+    def close(self) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,96 @@
+# backend/utils/diversity.py
+"""
+Diversity-aware batch selection: embed candidate utterances as hashed character/word
+n-gram vectors, reduce them with a fixed random projection, and pick a batch that is
+both uncertain and spread out (uncertainty-weighted k-center greedy or k-means++ seeding).
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from .tfidf_intent import hashed_counts
+
+DIVERSITY_METHODS = ('kcenter', 'kmeanspp')
+# candidates kept from the uncertainty ranking per selected sample
+DIVERSITY_CANDIDATE_FACTOR = int(os.environ.get('DIVERSITY_CANDIDATE_FACTOR', '10'))
+DIVERSITY_HASH_BITS = 14
+DIVERSITY_DIM = int(os.environ.get('DIVERSITY_DIM', '128'))
+_EMBED_BATCH = 20000
+
+_projection = None
+
+
+def _random_projection() -> np.ndarray:
+    # fixed seed: embeddings are comparable across runs
+    global _projection
+    if _projection is None:
+        rng = np.random.default_rng(7)
+        _projection = (rng.standard_normal((1 << DIVERSITY_HASH_BITS, DIVERSITY_DIM)) /
+                       np.sqrt(DIVERSITY_DIM)).astype(np.float32)
+    return _projection
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """L2-normalised (n, DIVERSITY_DIM) float32 embeddings of hashed n-gram counts."""
+    projection = _random_projection()
+    out = np.zeros((len(texts), DIVERSITY_DIM), dtype=np.float32)
+    for lo in range(0, len(texts), _EMBED_BATCH):
+        counts = hashed_counts(texts[lo:lo + _EMBED_BATCH], 1 << DIVERSITY_HASH_BITS)
+        counts.data = np.log1p(counts.data)
+        out[lo:lo + _EMBED_BATCH] = counts @ projection
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return out / norms
+
+
+def select_diverse(embeddings: np.ndarray, scores: np.ndarray, k: int, method: str = 'kcenter',
+                   seed: int = 13) -> List[int]:
+    """
+    Pick k row indices. The first is the most uncertain candidate; every next one maximises
+    (distance to the nearest selected row) x uncertainty (kcenter), or is sampled with
+    probability proportional to that distance squared x uncertainty (kmeanspp).
+    Distances are cosine distances, updated incrementally (one matrix-vector product per pick).
+    """
+    if method not in DIVERSITY_METHODS:
+        raise ValueError(f"unknown diversity method '{method}'; expected one of {list(DIVERSITY_METHODS)}")
+    n = len(scores)
+    if k >= n:
+        return [int(i) for i in np.argsort(-scores)]
+    weight = np.asarray(scores, dtype=np.float32) + 1e-3
+    rng = np.random.default_rng(seed)
+    min_dist = np.full(n, np.inf, dtype=np.float32)
+    chosen = [int(np.argmax(scores))]
+    for _ in range(k - 1):
+        dist = 1.0 - embeddings @ embeddings[chosen[-1]]
+        np.minimum(min_dist, np.maximum(dist, 0.0), out=min_dist)
+        min_dist[chosen[-1]] = 0.0
+        if method == 'kcenter':
+            nxt = int(np.argmax(min_dist * weight))
+        else:
+            p = (min_dist ** 2) * weight
+            total = p.sum()
+            nxt = int(rng.choice(n, p=p / total)) if total > 0 else int(np.argmax(min_dist))
+        if min_dist[nxt] <= 0:
+            break               # only exact duplicates of selected rows are left
+        chosen.append(nxt)
+    return chosen
+
+
+def diversify(samples: List[dict], k: int, method: str = 'kcenter') -> List[dict]:
+    """Reduce uncertainty-ranked samples (dicts with text and score) to a diverse batch of k."""
+    if len(samples) <= k:
+        return samples
+    embeddings = embed_texts([s['text'] for s in samples])
+    scores = np.asarray([s['score'] for s in samples], dtype=np.float32)
+    picked = select_diverse(embeddings, scores, k, method)
+    result = []
+    for rank, i in enumerate(picked):
+        sample = samples[i]
+        sample['selection'] = {'method': method, 'rank': rank, 'candidates': len(samples)}
+        result.append(sample)
+    return result
+
+
+def candidate_pool_size(top_k: int, factor: Optional[int] = None) -> int:
+    return top_k * max(1, int(factor or DIVERSITY_CANDIDATE_FACTOR))
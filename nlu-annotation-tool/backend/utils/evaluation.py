@@ -0,0 +1,301 @@
+# backend/utils/evaluation.py
+"""
+Evaluation stage: intent accuracy and entity precision/recall/F1 on a stratified
+held-out split, or k-fold cross-validation with folds trained in parallel worker
+processes. Results are recorded per model version in the backend's metadata.
+"""
+import os
+import json
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .model_utils import build_spacy_ner, annotations_to_rasa_nlu, run_rasa_train_nlu, rasa_predict
+from .tfidf_intent import build_tfidf_intent
+from .storage import atomic_write_json
+from .rasa_profiles import resolve_profile
+from .annotation_store import iter_annotations
+
+DEFAULT_TEST_FRACTION = 0.2
+DEFAULT_SEED = 13
+
+
+def _stratum(ann: Dict) -> str:
+    """Stratify on intent; fall back to the first entity label for NER-only data."""
+    if ann.get('intent'):
+        return 'intent:' + str(ann['intent'])
+    ents = ann.get('entities') or []
+    return 'label:' + str(ents[0].get('label')) if ents else ''
+
+
+def _by_stratum(annotations: List[Dict], seed: int) -> List[List[Dict]]:
+    groups = defaultdict(list)
+    for ann in annotations:
+        if ann.get('text', '').strip():
+            groups[_stratum(ann)].append(ann)
+    rng = random.Random(seed)
+    result = []
+    for key in sorted(groups):
+        items = groups[key]
+        rng.shuffle(items)
+        result.append(items)
+    return result
+
+
+def stratified_split(annotations: List[Dict], test_fraction: float = DEFAULT_TEST_FRACTION,
+                     seed: int = DEFAULT_SEED) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split annotations into (train, test) keeping each intent's share in both parts.
+    Strata with a single example stay in train.
+    """
+    train, test = [], []
+    for items in _by_stratum(annotations, seed):
+        n_test = int(round(len(items) * test_fraction)) if len(items) > 1 else 0
+        if len(items) > 1:
+            n_test = min(max(n_test, 1), len(items) - 1)
+        test.extend(items[:n_test])
+        train.extend(items[n_test:])
+    return train, test
+
+
+def stratified_kfold(annotations: List[Dict], k: int = 5,
+                     seed: int = DEFAULT_SEED) -> List[Tuple[List[Dict], List[Dict]]]:
+    """Return k (train, test) pairs; each stratum is dealt round-robin over the folds."""
+    folds = [[] for _ in range(k)]
+    offset = 0
+    for items in _by_stratum(annotations, seed):
+        for i, ann in enumerate(items):
+            folds[(offset + i) % k].append(ann)
+        offset += len(items)
+    return [
+        ([a for j, f in enumerate(folds) if j != i for a in f], folds[i])
+        for i in range(k)
+    ]
+
+
+def _span_set(entities: List[Dict]) -> set:
+    spans = set()
+    for e in entities or []:
+        try:
+            spans.add((int(e['start']), int(e['end']), str(e['label'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return spans
+
+
+def score(gold: List[Dict], predicted: List[Dict]) -> Dict:
+    """
+    Compare predictions with gold annotations (same order).
+    Entities match on exact (start, end, label). intent_accuracy is None when the
+    predictor does not produce intents.
+    """
+    intent_total = intent_correct = 0
+    tp = fp = fn = 0
+    per_label = defaultdict(lambda: {'tp': 0, 'fp': 0, 'fn': 0})
+    for g, p in zip(gold, predicted):
+        if p.get('intent') is not None and g.get('intent'):
+            intent_total += 1
+            intent_correct += int(p['intent'] == g['intent'])
+        gs, ps = _span_set(g.get('entities')), _span_set(p.get('entities'))
+        for span in ps & gs:
+            per_label[span[2]]['tp'] += 1
+        for span in ps - gs:
+            per_label[span[2]]['fp'] += 1
+        for span in gs - ps:
+            per_label[span[2]]['fn'] += 1
+        tp += len(ps & gs)
+        fp += len(ps - gs)
+        fn += len(gs - ps)
+
+    def _prf(tp, fp, fn):
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return round(precision, 4), round(recall, 4), round(f1, 4)
+
+    precision, recall, f1 = _prf(tp, fp, fn)
+    labels = {}
+    for label, c in sorted(per_label.items()):
+        lp, lr, lf = _prf(c['tp'], c['fp'], c['fn'])
+        labels[label] = {'precision': lp, 'recall': lr, 'f1': lf, 'support': c['tp'] + c['fn']}
+    return {
+        'num_examples': len(gold),
+        'intent_accuracy': round(intent_correct / intent_total, 4) if intent_total else None,
+        'entity_precision': precision,
+        'entity_recall': recall,
+        'entity_f1': f1,
+        'per_label': labels,
+    }
+
+
+def _predict_spacy(train: List[Dict], test: List[Dict]) -> List[Dict]:
+    nlp = build_spacy_ner(train)
+    texts = [a.get('text', '') for a in test]
+    return [
+        {'intent': None,
+         'entities': [{'start': e.start_char, 'end': e.end_char, 'label': e.label_} for e in doc.ents]}
+        for doc in nlp.pipe(texts)
+    ]
+
+
+def _predict_rasa(train: List[Dict], test: List[Dict], rasa_project_path: str,
+                  profile: Optional[str] = None) -> List[Dict]:
+    tmp = tempfile.mkdtemp(prefix='rasa_eval_')
+    try:
+        nlu_path = annotations_to_rasa_nlu(train, tmp)
+        model_path = run_rasa_train_nlu(rasa_project_path, nlu_path, os.path.join(tmp, 'models'), 'eval',
+                                        profile=profile)
+        return rasa_predict(model_path, [a.get('text', '') for a in test])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _predict_tfidf(train: List[Dict], test: List[Dict]) -> List[Dict]:
+    model = build_tfidf_intent(train)
+    return model.predict([a.get('text', '') for a in test])
+
+
+# backend name -> predictor(train, test, **options) returning one prediction dict per test example
+PREDICTORS = {
+    'spacy': _predict_spacy,
+    'rasa': _predict_rasa,
+    'tfidf': _predict_tfidf,
+}
+
+
+def evaluate_split(backend: str, train: List[Dict], test: List[Dict], options: Dict = None) -> Dict:
+    """Train `backend` on train and score it on test (runs inside worker processes)."""
+    started = time.time()
+    predicted = PREDICTORS[backend](train, test, **(options or {}))
+    metrics = score(test, predicted)
+    metrics['train_size'] = len(train)
+    metrics['seconds'] = round(time.time() - started, 2)
+    return metrics
+
+
+def _mean_metrics(fold_metrics: List[Dict]) -> Dict:
+    keys = ('intent_accuracy', 'entity_precision', 'entity_recall', 'entity_f1')
+    mean = {}
+    for key in keys:
+        values = [m[key] for m in fold_metrics if m.get(key) is not None]
+        mean[key] = round(sum(values) / len(values), 4) if values else None
+    mean['num_examples'] = sum(m['num_examples'] for m in fold_metrics)
+    return mean
+
+
+def evaluate_annotations(annotations: List[Dict], backend: str, folds: int = 0,
+                         test_fraction: float = DEFAULT_TEST_FRACTION, max_workers: int = None,
+                         seed: int = DEFAULT_SEED, options: Dict = None) -> Dict:
+    """
+    Evaluate a backend on annotations.
+    folds < 2: single stratified held-out split; otherwise k-fold cross-validation with
+    the folds trained concurrently in up to max_workers processes (default: CPU count).
+    """
+    if backend not in PREDICTORS:
+        raise ValueError('unknown backend for evaluation: ' + str(backend))
+    result = {'backend': backend, 'evaluated_at': int(time.time()), 'seed': seed}
+
+    if folds and folds >= 2:
+        splits = stratified_kfold(annotations, folds, seed)
+        workers = min(folds, max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(evaluate_split, backend, tr, te, options) for tr, te in splits]
+            fold_metrics = [f.result() for f in futures]
+        result.update({'method': 'kfold', 'folds': folds, 'metrics': _mean_metrics(fold_metrics),
+                       'fold_metrics': fold_metrics})
+    else:
+        train, test = stratified_split(annotations, test_fraction, seed)
+        if not test:
+            raise RuntimeError('Not enough annotations for a held-out split')
+        result.update({'method': 'holdout', 'test_fraction': test_fraction,
+                       'metrics': evaluate_split(backend, train, test, options)})
+    return result
+
+
+def headline_accuracy(evaluation: Dict) -> Optional[float]:
+    """Percentage shown as workspace accuracy: intent accuracy, else entity F1."""
+    metrics = (evaluation or {}).get('metrics') or {}
+    value = metrics.get('intent_accuracy')
+    if value is None:
+        value = metrics.get('entity_f1')
+    return round(value * 100, 2) if value is not None else None
+
+
+def record_evaluation(base_dir: str, backend: str, evaluation: Dict, model_version: str = None) -> Optional[str]:
+    """
+    Store an evaluation in the metadata of a model version (default: the latest one).
+    spaCy / tfidf: meta_v<ts>.json; Rasa: the metadata.json and models_index.json entries of the file.
+    Returns the model version the evaluation was attached to, or None if there is no model.
+    """
+    models_dir = os.path.join(base_dir, 'models')
+    if backend in ('spacy', 'tfidf'):
+        model_dir = os.path.join(models_dir, backend + '_model')
+        suffix = '.npz' if backend == 'tfidf' else ''
+        stamps = {}
+        for n in (os.listdir(model_dir) if os.path.isdir(model_dir) else []):
+            stamp = n[len('model_v'):len(n) - len(suffix)]
+            if n.startswith('model_v') and n.endswith(suffix) and stamp.isdigit():
+                stamps[n] = int(stamp)
+        if model_version is None and stamps:
+            model_version = max(stamps, key=stamps.get)
+        if not model_version:
+            return None
+        stamp = model_version[len('model_v'):]
+        if suffix and stamp.endswith(suffix):
+            stamp = stamp[:-len(suffix)]
+        meta_path = os.path.join(model_dir, 'meta_v' + stamp + '.json')
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as fh:
+                meta = json.load(fh) or {}
+        meta['evaluation'] = evaluation
+        atomic_write_json(meta_path, meta)
+        return model_version
+
+    rasa_dir = os.path.join(models_dir, 'rasa_model')
+    attached = None
+    for fname in ('metadata.json', 'models_index.json'):
+        path = os.path.join(rasa_dir, fname)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as fh:
+            entries = json.load(fh)
+        if isinstance(entries, dict):
+            entries = [entries]
+        target = model_version or (entries[-1].get('file') if entries else None)
+        for entry in reversed(entries):
+            if entry.get('file') == target:
+                entry['evaluation'] = evaluation
+                attached = target
+                break
+        atomic_write_json(path, entries)
+    return attached
+
+
+def evaluate_workspace(base_dir: str, backend: str, folds: int = 0,
+                       test_fraction: float = DEFAULT_TEST_FRACTION, model_version: str = None,
+                       max_workers: int = None, annotations: Optional[List[Dict]] = None,
+                       profile: Optional[str] = None) -> Dict:
+    """
+    Evaluate a workspace's annotations with `backend` and record the result on its model.
+    annotations: evaluate on these instead (the draft sample / deduped set a model was trained on)
+    profile: Rasa training profile of the evaluated model
+    """
+    subset = annotations is not None
+    if annotations is None:
+        annotations = list(iter_annotations(base_dir))
+    options = None
+    if backend == 'rasa':
+        options = {'rasa_project_path': os.path.abspath(
+            os.environ.get('RASA_PROJECT_PATH') or os.path.join(base_dir, '..', '..')), 'profile': profile}
+    evaluation = evaluate_annotations(annotations, backend, folds=folds, test_fraction=test_fraction,
+                                      max_workers=max_workers, options=options)
+    evaluation['subset'] = subset
+    if backend == 'rasa':
+        evaluation['profile'] = resolve_profile(profile)
+    evaluation['model_version'] = record_evaluation(base_dir, backend, evaluation, model_version)
+    return evaluation
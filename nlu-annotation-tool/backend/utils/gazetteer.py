@@ -0,0 +1,322 @@
+# backend/utils/gazetteer.py
+"""
+Workspace gazetteer: every known entity value (from entities.json and from annotated
+spans) compiled into one Aho-Corasick automaton over tokens, which finds all of them in
+a text in a single pass regardless of the dictionary size.
+
+When entities.json or the annotations change only the added and removed values are
+applied to the automaton; a value whose label counts change just gets its label and
+confidence updated. Annotation edits are applied from the annotation store's changes
+since the last sync (the spans a record had before and after), so annotating does not
+re-read the workspace. Confidence of a value is the share of its most frequent label.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from .annotation_store import iter_annotations, open_annotations, changes_since
+
+GAZETTEER_BATCH_SIZE = int(os.environ.get('GAZETTEER_BATCH_SIZE', '256'))
+# terms longer than this (in characters) are ignored; they are sentences, not entity values
+MAX_TERM_CHARS = int(os.environ.get('GAZETTEER_MAX_TERM_CHARS', '100'))
+
+_gazetteers: Dict[str, 'Gazetteer'] = {}
+_registry_lock = threading.Lock()
+
+
+def _entity_list_terms(path: str) -> Dict[str, Counter]:
+    """
+    Terms per label from entities.json. Accepted shapes: {"LABEL": ["term", ...]}, or a
+    list of {"label"|"name"|"entity": ..., "values"|"synonyms"|"examples": [...]} where a
+    value may also be {"value": ..., "synonyms": [...]}. Plain label names add no terms.
+    """
+    terms: Dict[str, Counter] = defaultdict(Counter)
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh) or []
+    except (OSError, ValueError):
+        return terms
+    entries = data.items() if isinstance(data, dict) else [
+        (e.get('label') or e.get('name') or e.get('entity'),
+         e.get('values') or e.get('synonyms') or e.get('examples') or [])
+        for e in data if isinstance(e, dict)]
+    for label, values in entries:
+        if not label or not isinstance(values, list):
+            continue
+        for value in values:
+            names = [value] if isinstance(value, str) else (
+                [value.get('value')] + list(value.get('synonyms') or []) if isinstance(value, dict) else [])
+            for name in names:
+                if isinstance(name, str) and 0 < len(name.strip()) <= MAX_TERM_CHARS:
+                    terms[_normalize(name)][str(label)] += 1
+    return terms
+
+
+def _count_spans(terms: Dict[str, Counter], ann: Optional[Dict], sign: int, touched: set) -> None:
+    """Add (sign 1) or subtract (-1) the annotated spans of ann to terms, noting the terms touched."""
+    if not ann:
+        return
+    text = ann.get('text') or ''
+    for ent in ann.get('entities') or []:
+        try:
+            span = _normalize(text[int(ent['start']):int(ent['end'])])
+        except (KeyError, TypeError, ValueError):
+            continue
+        label = ent.get('label') or ent.get('entity')
+        if span and label and len(span) <= MAX_TERM_CHARS:
+            counts = terms[span]
+            counts[label] += sign
+            if counts[label] <= 0:
+                del counts[label]
+                if not counts:
+                    del terms[span]
+            touched.add(span)
+
+
+def gazetteer_terms(base_dir: str) -> Dict[str, Counter]:
+    """term (lower-cased) -> Counter of labels, from entities.json and annotated spans."""
+    terms = _entity_list_terms(os.path.join(base_dir, 'data', 'entities.json'))
+    for ann in iter_annotations(base_dir):
+        _count_spans(terms, ann, 1, set())
+    return terms
+
+
+def _normalize(term: str) -> str:
+    return ' '.join(term.lower().split())
+
+
+def _term_hash(term: str, label: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f'{term}\t{label}'.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class Gazetteer:
+    """
+    Case-insensitive Aho-Corasick automaton over the lower-cased tokens of known entity values.
+
+    Nodes are never deleted while the automaton is in use: a removed value just clears its
+    node's output, and the trie is rebuilt from scratch once dead nodes outnumber live values.
+    """
+
+    def __init__(self):
+        import spacy
+
+        self.nlp = spacy.blank('en')
+        self.labels: Dict[str, Tuple[str, float, Dict[str, int]]] = {}
+        self._reset()
+        self._hash = 0              # order-independent sum of term/label hashes
+        self.stamp = None           # of entities.json
+        self.position = None        # annotation store (generation, seq) applied
+        self._entity_terms: Dict[str, Counter] = {}
+        self._span_terms: Dict[str, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _reset(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._term: List[Optional[str]] = [None]
+        self._final: List[bool] = [False]   # holds or held a term
+        self._depth: List[int] = [0]
+        self._fail: List[int] = [0]
+        self._out: List[int] = [0]  # nearest proper suffix node that is final
+        self._dead = 0
+        self._stale = False
+
+    @property
+    def fingerprint(self) -> str:
+        return f'{self._hash:016x}'
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _tokens(self, term: str) -> List[str]:
+        words = term.split()
+        # plain words are never split by the tokenizer; skipping it keeps 100k-value builds fast
+        if all((w.isalpha() or w.isdigit()) and w not in self.nlp.tokenizer.rules for w in words):
+            return words
+        return [t.lower_ for t in self.nlp.tokenizer(term)]
+
+    def _insert(self, term: str) -> None:
+        node = 0
+        for token in self._tokens(term):
+            nxt = self._goto[node].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][token] = nxt
+                self._goto.append({})
+                self._term.append(None)
+                self._final.append(False)
+                self._depth.append(self._depth[node] + 1)
+                self._fail.append(0)
+                self._out.append(0)
+                self._stale = True
+            node = nxt
+        if not self._final[node]:
+            self._final[node] = True
+            self._stale = True
+        self._term[node] = term
+
+    def _remove(self, term: str) -> None:
+        node = 0
+        for token in self._tokens(term):
+            node = self._goto[node].get(token)
+            if node is None:
+                return
+        if self._term[node] == term:
+            self._term[node] = None
+            self._dead += 1
+
+    def _link(self) -> None:
+        """Breadth-first failure and output links."""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = self._out[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(token, 0)
+                self._fail[child] = fail
+                self._out[child] = fail if self._final[fail] else self._out[fail]
+                queue.append(child)
+        self._stale = False
+
+    def update(self, terms: Dict[str, Counter]) -> Dict[str, int]:
+        """Bring the automaton in line with terms: insert added values, clear removed ones."""
+        changes = dict(terms)
+        changes.update((t, Counter()) for t in list(self.labels) if t not in terms)
+        return self.apply(changes)
+
+    def apply(self, changes: Dict[str, Counter]) -> Dict[str, int]:
+        """Set the label counts of the given terms; an empty Counter removes the term."""
+        with self._lock:
+            added = [t for t, counts in changes.items() if counts and t not in self.labels]
+            removed = [t for t, counts in changes.items() if not counts and t in self.labels]
+            for term in removed:
+                self._hash = (self._hash - _term_hash(term, self.labels.pop(term)[0])) % (1 << 64)
+            if self._dead + len(removed) > max(len(self.labels), 1000):
+                self._reset()
+                for term in self.labels:
+                    self._insert(term)
+            else:
+                for term in removed:
+                    self._remove(term)
+            for term in added:
+                self.labels[term] = ('', 0.0, {})
+                self._insert(term)
+            if self._stale:
+                self._link()
+            changed = 0
+            for term, counts in changes.items():
+                if not counts:
+                    continue
+                label, count = counts.most_common(1)[0]
+                entry = (label, round(count / sum(counts.values()), 4), dict(counts))
+                old = self.labels[term]
+                if old != entry:
+                    changed += 1
+                    if old[0] != label:
+                        if old[0]:
+                            self._hash = (self._hash - _term_hash(term, old[0])) % (1 << 64)
+                        self._hash = (self._hash + _term_hash(term, label)) % (1 << 64)
+                    self.labels[term] = entry
+        return {'added': len(added), 'removed': len(removed), 'changed': changed, 'terms': len(self.labels)}
+
+    def _scan(self, tokens: List[str]) -> List[Tuple[int, int, str]]:
+        """(first token, end token, term) of every value occurring in tokens."""
+        found = []
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            hit = node
+            while hit:
+                term = self._term[hit]
+                if term is not None:
+                    found.append((i + 1 - self._depth[hit], i + 1, term))
+                hit = self._out[hit]
+        return found
+
+    def match(self, texts: List[str], overlapping: bool = False) -> List[List[Dict]]:
+        """
+        Known entity values in each text as {start, end, text, label, confidence, labels}.
+        overlapping: return every match; default keeps the longest non-overlapping ones
+        """
+        docs = list(self.nlp.tokenizer.pipe(texts, batch_size=GAZETTEER_BATCH_SIZE))
+        results = []
+        with self._lock:
+            for doc in docs:
+                hits = self._scan([t.lower_ for t in doc])
+                if not overlapping:
+                    kept, taken = [], set()
+                    for s, e, term in sorted(hits, key=lambda h: (h[0] - h[1], h[0])):
+                        if not taken.intersection(range(s, e)):
+                            kept.append((s, e, term))
+                            taken.update(range(s, e))
+                    hits = kept
+                found = []
+                for s, e, term in sorted(hits):
+                    span = doc[s:e]
+                    label, confidence, counts = self.labels[term]
+                    found.append({'start': span.start_char, 'end': span.end_char, 'text': span.text,
+                                  'label': label, 'confidence': confidence, 'labels': counts})
+                results.append(found)
+        return results
+
+
+def _stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_gazetteer(base_dir: str) -> Gazetteer:
+    """The workspace gazetteer, updated incrementally when entities.json or the annotations change."""
+    with _registry_lock:
+        gazetteer = _gazetteers.get(base_dir)
+        if gazetteer is None:       # not setdefault: building one loads a spaCy tokenizer
+            gazetteer = _gazetteers[base_dir] = Gazetteer()
+    with gazetteer._sync_lock:
+        touched: set = set()
+        entities_file = os.path.join(base_dir, 'data', 'entities.json')
+        stamp = _stamp(entities_file)
+        if gazetteer.stamp != stamp:
+            terms = _entity_list_terms(entities_file)
+            touched.update(gazetteer._entity_terms, terms)
+            gazetteer._entity_terms, gazetteer.stamp = terms, stamp
+
+        spans = gazetteer._span_terms
+        ops = changes_since(base_dir, *gazetteer.position, previous=True) if gazetteer.position else None
+        if ops is None:
+            # first load, or the changes were compacted away: count every annotation once
+            generation, seq, records = open_annotations(base_dir)
+            touched.update(spans)
+            spans = gazetteer._span_terms = defaultdict(Counter)
+            for ann in records:
+                _count_spans(spans, ann, 1, touched)
+            gazetteer.position = (generation, seq)
+        elif ops:
+            for op in ops:
+                _count_spans(spans, op.get('previous'), -1, touched)
+                if op['op'] != 'delete':
+                    _count_spans(spans, op['record'], 1, touched)
+            gazetteer.position = (gazetteer.position[0], ops[-1]['seq'])
+
+        if touched:
+            stats = gazetteer.apply({t: gazetteer._entity_terms.get(t, Counter()) + spans.get(t, Counter())
+                                     for t in touched})
+            print(f"[gazetteer] {base_dir}: {stats['terms']} term(s), +{stats['added']} -{stats['removed']} "
+                  f"~{stats['changed']}")
+    return gazetteer
+
+
+def match_entities(base_dir: str, texts: List[str], overlapping: bool = False) -> List[List[Dict]]:
+    return load_gazetteer(base_dir).match(texts, overlapping=overlapping)
@@ -0,0 +1,84 @@
+# backend/utils/inference.py
+"""
+Predictions from a workspace's trained models. Every backend returns the same shape:
+{"intent", "confidence", "intent_ranking", "entities": [{"start", "end", "label"}]}
+(spaCy only predicts entities, tfidf only intents).
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .model_utils import rasa_predict
+from .tfidf_intent import find_latest_tfidf_model, load_tfidf_model
+from .prediction_cache import cached_predict
+
+BACKENDS = ('spacy', 'rasa', 'tfidf')
+# loaded spaCy pipelines kept in memory (oldest loaded is dropped first)
+MAX_LOADED_SPACY_MODELS = 4
+
+_spacy_models: Dict[str, object] = {}
+_spacy_lock = threading.Lock()
+
+
+def resolve_model(base_dir: str, backend: str, model_version: str = None) -> Optional[str]:
+    """
+    Path of a model version (spaCy `model_v<ts>`, Rasa `<name>.tar.gz`, tfidf `model_v<ts>.npz`);
+    the latest one when model_version is None. Returns None if it does not exist.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend: ' + str(backend))
+    model_dir = os.path.join(base_dir, 'models', backend + '_model')
+    if model_version:
+        path = os.path.join(model_dir, os.path.basename(model_version))
+        return path if os.path.exists(path) else None
+    if backend == 'tfidf':
+        return find_latest_tfidf_model(base_dir)
+    if not os.path.isdir(model_dir):
+        return None
+    if backend == 'spacy':
+        versions = [n for n in os.listdir(model_dir)
+                    if n.startswith('model_v') and n[len('model_v'):].isdigit()]
+        return os.path.join(model_dir, max(versions, key=lambda n: int(n[len('model_v'):]))) if versions else None
+    models = [os.path.join(model_dir, n) for n in os.listdir(model_dir) if n.endswith('.tar.gz')]
+    return max(models, key=os.path.getmtime) if models else None
+
+
+def load_spacy_model(path: str):
+    with _spacy_lock:
+        nlp = _spacy_models.get(path)
+        if nlp is None:
+            import spacy
+            nlp = spacy.load(path)
+            _spacy_models[path] = nlp
+            while len(_spacy_models) > MAX_LOADED_SPACY_MODELS:
+                _spacy_models.pop(next(iter(_spacy_models)))
+        return nlp
+
+
+def predict_with_model(backend: str, model_path: str, texts: List[str]) -> List[Dict]:
+    """Run one model over texts (batched where the backend supports it)."""
+    if backend == 'tfidf':
+        return load_tfidf_model(model_path).predict(texts)
+    if backend == 'rasa':
+        return rasa_predict(model_path, texts)
+    nlp = load_spacy_model(model_path)
+    return [
+        {'intent': None, 'confidence': None, 'intent_ranking': [],
+         'entities': [{'start': e.start_char, 'end': e.end_char, 'label': e.label_} for e in doc.ents]}
+        for doc in nlp.pipe(texts)
+    ]
+
+
+def predict_texts(base_dir: str, backend: str, texts: List[str],
+                  model_version: str = None) -> Tuple[str, List[Dict]]:
+    """
+    Predict texts with a workspace model (latest by default), through the prediction cache.
+    Returns: (model version name, list of predictions); raises FileNotFoundError without a model.
+    """
+    model_path = resolve_model(base_dir, backend, model_version)
+    if not model_path:
+        raise FileNotFoundError(f'no trained {backend} model in workspace')
+    predictions = cached_predict(base_dir, backend, model_path, 'predict', texts,
+                                 lambda batch: predict_with_model(backend, model_path, batch),
+                                 lowercase=backend == 'tfidf')
+    return os.path.basename(model_path), predictions
@@ -0,0 +1,189 @@
+# backend/utils/jobs.py
+"""
+Background jobs: run long tasks (training, scoring, ...) in a worker thread and keep
+a bounded ring buffer of their output so clients can follow progress over
+Server-Sent Events without holding the triggering request open.
+"""
+import os
+import re
+import time
+import uuid
+import threading
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Max output lines kept per job; older lines are dropped (full output stays in log files)
+JOB_LOG_BUFFER_LINES = int(os.environ.get('JOB_LOG_BUFFER_LINES', '2000'))
+# Finished jobs kept in memory for status queries
+MAX_FINISHED_JOBS = int(os.environ.get('MAX_FINISHED_JOBS', '50'))
+
+# spaCy trainer: "[model_utils] epoch 3/10, losses={'ner': 12.3}"
+_SPACY_EPOCH_RE = re.compile(r'epoch (\d+)/(\d+), losses=(\{.*\})')
+# loss values inside the dict, also when printed as numpy scalars ("np.float32(1.5)")
+_LOSS_VALUE_RE = re.compile(r':\s*(?:np\.float\d+\()?([-+]?[\d.]+(?:[eE][-+]?\d+)?)')
+# Rasa/tqdm: "Epochs:  45%|####5   | 45/100 [00:10<00:12,  4.38it/s, t_loss=1.23, i_acc=0.9]"
+_TQDM_RE = re.compile(r'Epochs:.*?(\d+)/(\d+) \[([\d:]+)<([\d:?]+)')
+_TQDM_LOSS_RE = re.compile(r't_loss=([\d.]+)')
+
+
+def _parse_clock(value: str) -> Optional[int]:
+    """Parse a tqdm clock ('MM:SS' or 'H:MM:SS') into seconds."""
+    try:
+        seconds = 0
+        for part in value.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+def parse_progress(line: str) -> Optional[Dict]:
+    """
+    Extract training progress from a single output line.
+    Returns: dict with epoch, total_epochs, loss and (when known) eta_seconds, or None
+    """
+    m = _SPACY_EPOCH_RE.search(line)
+    if m:
+        values = _LOSS_VALUE_RE.findall(m.group(3))
+        loss = round(sum(float(v) for v in values), 4) if values else None
+        return {'epoch': int(m.group(1)), 'total_epochs': int(m.group(2)), 'loss': loss}
+
+    m = _TQDM_RE.search(line)
+    if m:
+        loss_m = _TQDM_LOSS_RE.search(line)
+        return {
+            'epoch': int(m.group(1)),
+            'total_epochs': int(m.group(2)),
+            'loss': float(loss_m.group(1)) if loss_m else None,
+            'eta_seconds': _parse_clock(m.group(4)),
+        }
+    return None
+
+
+class Job:
+    """A background task with a bounded output buffer and parsed progress."""
+
+    def __init__(self, kind: str, workspace_id: str, buffer_lines: int = JOB_LOG_BUFFER_LINES):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.workspace_id = workspace_id
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self._lines = deque(maxlen=buffer_lines)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def append_line(self, line: str) -> None:
+        """Record one line of output (used as the on_output callback of trainers)."""
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            return
+        with self._cond:
+            self._seq += 1
+            self._lines.append((self._seq, line))
+            progress = parse_progress(line)
+            if progress:
+                if progress.get('eta_seconds') is None and self.started_at and progress['epoch']:
+                    elapsed = time.time() - self.started_at
+                    remaining = progress['total_epochs'] - progress['epoch']
+                    progress['eta_seconds'] = int(elapsed / progress['epoch'] * remaining)
+                self.progress = progress
+            self._cond.notify_all()
+
+    def set_progress(self, **progress) -> None:
+        """Update progress directly (for jobs that do not print epoch lines)."""
+        with self._cond:
+            self.progress = {**self.progress, **progress}
+            self._cond.notify_all()
+
+    def wait_for_lines(self, after_seq: int, timeout: float) -> Tuple[List[Tuple[int, str]], bool]:
+        """
+        Block until output newer than after_seq exists, the job finishes or timeout passes.
+        Returns: (list of (seq, line) newer than after_seq still in the buffer, finished flag)
+        """
+        with self._cond:
+            if self._seq <= after_seq and not self.finished:
+                self._cond.wait(timeout)
+            lines = [item for item in self._lines if item[0] > after_seq]
+            return lines, self.finished
+
+    def _finish(self, status: str, result: Any = None, error: str = None) -> None:
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'workspace_id': self.workspace_id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'last_event_id': self._seq,
+        }
+
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+
+
+def _prune_finished() -> None:
+    finished = sorted((j for j in _jobs.values() if j.finished), key=lambda j: j.finished_at)
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        _jobs.pop(job.id, None)
+
+
+def start_job(kind: str, workspace_id: str, target: Callable[[Job], Any]) -> Job:
+    """
+    Run target(job) in a daemon thread. The return value becomes job.result;
+    an exception marks the job failed with its message as job.error.
+    """
+    job = Job(kind, workspace_id)
+
+    def _run():
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            result = target(job)
+            job._finish('succeeded', result=result)
+        except Exception as e:
+            traceback.print_exc()
+            job._finish('failed', error=str(e))
+
+    with _jobs_lock:
+        _prune_finished()
+        _jobs[job.id] = job
+    threading.Thread(target=_run, name=f'job-{kind}-{job.id}', daemon=True).start()
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(workspace_id: str = None, kind: str = None) -> List[Dict]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return [
+        j.to_dict() for j in sorted(jobs, key=lambda j: j.created_at, reverse=True)
+        if (workspace_id is None or j.workspace_id == workspace_id) and (kind is None or j.kind == kind)
+    ]
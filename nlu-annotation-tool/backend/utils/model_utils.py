@@ -1,36 +1,65 @@
 # backend/utils/model_utils.py
 import os
+import re
 import json
+import heapq
 import random
+import tempfile
 import time
 import shutil
 import subprocess
+from collections import deque
 from glob import glob
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Optional
 from datetime import datetime
 
+from .artifact_store import put_file, link_into, store_lock
+from .retention import apply_retention
+from .storage import atomic_write_json
+from .annotation_store import iter_annotations
+from .spacy_corpus import sync_corpus, load_corpus_examples, load_manifest
+from .sampling import record_throughput
+from .rasa_profiles import resolve_profile, build_profile_config
+
+# Number of trailing Rasa output lines kept for metadata snippets and error messages
+RASA_OUTPUT_TAIL_LINES = 200
+# Rows buffered by export_rasa_nlu before sorted runs are spilled to disk
+EXPORT_SPILL_ROWS = int(os.environ.get('EXPORT_SPILL_ROWS', '50000'))
+
+
+def _emit(message: str, on_output: Optional[Callable[[str], None]] = None) -> None:
+    """Print a trainer message and forward it to the job output callback, if any."""
+    print(message)
+    if on_output:
+        on_output(message)
+
+
+def _apply_retention_after_training(base_dir: str, on_output=None, rasa_project_path: str = None) -> None:
+    """Run the retention policy after a successful training; failures are not fatal."""
+    if os.environ.get('RETENTION_AFTER_TRAINING', '1') != '1':
+        return
+    try:
+        report = apply_retention(base_dir, rasa_project_path=rasa_project_path)
+        if report['deleted']:
+            _emit(f"[model_utils] retention removed {len(report['deleted'])} old artifact(s), "
+                  f"reclaimed {report['reclaimed_bytes']} bytes", on_output)
+    except Exception as e:
+        print(f"[model_utils] retention failed (non-fatal): {e}")
+
+
 # ---------- spaCy trainer (your existing function kept) ----------
-def train_spacy_model(base_dir: str) -> str:
+def build_spacy_ner(annotations: List[dict], epochs: int = 10, drop: float = 0.35,
+                    on_output: Optional[Callable[[str], None]] = None, batch_size=None):
     """
-    Train a minimal spaCy NER model from annotations.json and save to models/spacy_model/model_v{ts}
+    Train a blank English NER pipeline in memory and return it (nothing is saved).
+    annotations: list of {"text":..., "entities":[{"start":int,"end":int,"label":str}, ...]}
+    batch_size: None for one example per update, or a compounding schedule [start, stop, compound]
     """
     try:
-        import spacy
         from spacy.training import Example
     except Exception as e:
         raise RuntimeError('spaCy is required for training: ' + str(e))
 
-    backend_dir = os.path.join(base_dir, 'models')
-    spacy_dir = os.path.join(backend_dir, 'spacy_model')
-    os.makedirs(spacy_dir, exist_ok=True)
-
-    data_file = os.path.join(base_dir, 'data', 'annotations.json')
-    if not os.path.exists(data_file):
-        raise FileNotFoundError('annotations.json not found')
-
-    with open(data_file, 'r', encoding='utf-8') as fh:
-        annotations = json.load(fh)
-
     # Prepare training examples: spaCy expects list of (text, {'entities': [(start,end,label), ...]})
     training_data = []
     labels = set()
@@ -54,7 +83,47 @@ def train_spacy_model(base_dir: str) -> str:
     if not training_data:
         raise RuntimeError('No training data available in annotations.json')
 
+    nlp = _new_ner_pipeline(labels)
+
+    # convert training data to spaCy Example objects for newer API
+    examples = []
+    for text, ann in training_data:
+        doc = nlp.make_doc(text)
+        examples.append(Example.from_dict(doc, ann))
+
+    def _shuffled():
+        random.shuffle(examples)
+        return examples
+
+    return _run_ner_epochs(nlp, _shuffled, epochs, drop, on_output, batch_size=batch_size)
+
+
+def build_spacy_ner_from_corpus(base_dir: str, epochs: int = 10, drop: float = 0.35,
+                                on_output: Optional[Callable[[str], None]] = None):
+    """
+    Train a blank English NER pipeline from the workspace's compiled DocBin corpus
+    (data/corpus): the Docs are loaded once instead of being rebuilt from annotations.
+    """
+    manifest = sync_corpus(base_dir)
+    if not manifest.get('num_docs'):
+        raise RuntimeError('No training data available in annotations.json')
+    if manifest.get('misaligned_count'):
+        _emit(f"[model_utils] {manifest['misaligned_count']} misaligned entity span(s) were rejected "
+              f"when compiling the corpus (see data/corpus/manifest.json)", on_output)
+
+    nlp = _new_ner_pipeline(manifest['labels'])
+    examples = load_corpus_examples(base_dir, nlp)
+
+    def _shuffled():
+        random.shuffle(examples)
+        return examples
+
+    return _run_ner_epochs(nlp, _shuffled, epochs, drop, on_output)
+
+
+def _new_ner_pipeline(labels: Iterable[str]):
     # Create blank English model
+    import spacy
     nlp = spacy.blank('en')
 
     if 'ner' not in nlp.pipe_names:
@@ -64,23 +133,61 @@ def train_spacy_model(base_dir: str) -> str:
 
     for label in labels:
         ner.add_label(label)
+    return nlp
+
+
+def _run_ner_epochs(nlp, epoch_examples: Callable[[], Iterable], epochs: int, drop: float,
+                    on_output: Optional[Callable[[str], None]] = None, batch_size=None):
+    from spacy.util import minibatch, compounding
 
     # Begin training
     optimizer = nlp.begin_training()
 
-    # convert training data to spaCy Example objects for newer API
-    examples = []
-    for text, ann in training_data:
-        doc = nlp.make_doc(text)
-        examples.append(Example.from_dict(doc, ann))
-
     # Train for a small number of epochs
-    for epoch in range(10):
-        random.shuffle(examples)
+    for epoch in range(epochs):
         losses = {}
-        for example in examples:
-            nlp.update([example], sgd=optimizer, drop=0.35, losses=losses)
-        print(f'[model_utils] epoch {epoch+1}/10, losses={losses}')
+        if batch_size:
+            batches = minibatch(epoch_examples(), size=compounding(*batch_size))
+        else:
+            batches = ([example] for example in epoch_examples())
+        for batch in batches:
+            nlp.update(batch, sgd=optimizer, drop=drop, losses=losses)
+        losses = {name: round(float(value), 4) for name, value in losses.items()}
+        _emit(f'[model_utils] epoch {epoch+1}/{epochs}, losses={losses}', on_output)
+
+    return nlp
+
+
+def train_spacy_model(base_dir: str, on_output: Optional[Callable[[str], None]] = None,
+                      annotations: Optional[List[dict]] = None, extra_meta: Optional[dict] = None) -> str:
+    """
+    Train a minimal spaCy NER model from annotations.json and save to models/spacy_model/model_v{ts}
+    Examples are streamed from the compiled corpus (data/corpus), which is synced first.
+    on_output: optional callback receiving each progress line (epoch losses)
+    annotations: train on these instead of the workspace corpus (e.g. a draft sample)
+    extra_meta: merged into meta_v{ts}.json (e.g. {'draft': True, 'sample': {...}})
+    """
+    backend_dir = os.path.join(base_dir, 'models')
+    spacy_dir = os.path.join(backend_dir, 'spacy_model')
+    os.makedirs(spacy_dir, exist_ok=True)
+
+    data_file = os.path.join(base_dir, 'data', 'annotations.json')
+    if not os.path.exists(data_file):
+        raise FileNotFoundError('annotations.json not found')
+
+    try:
+        import spacy  # fail early with a clear message before compiling the corpus
+    except Exception as e:
+        raise RuntimeError('spaCy is required for training: ' + str(e))
+
+    started = time.time()
+    if annotations is not None:
+        nlp = build_spacy_ner(annotations, on_output=on_output)
+        rows = len(annotations)
+    else:
+        nlp = build_spacy_ner_from_corpus(base_dir, on_output=on_output)
+        rows = load_manifest(base_dir).get('num_docs', 0)
+    record_throughput(base_dir, 'spacy', rows, time.time() - started)
 
     # Save model
     timestamp = int(time.time())
@@ -89,10 +196,10 @@ def train_spacy_model(base_dir: str) -> str:
     nlp.to_disk(model_version_dir)
 
     # write metadata
-    meta = {'name': 'spacy_ner', 'version': f'v{timestamp}', 'trained_at': timestamp}
-    with open(os.path.join(spacy_dir, f'meta_v{timestamp}.json'), 'w', encoding='utf-8') as fh:
-        json.dump(meta, fh, indent=2)
+    meta = {'name': 'spacy_ner', 'version': f'v{timestamp}', 'trained_at': timestamp, **(extra_meta or {})}
+    atomic_write_json(os.path.join(spacy_dir, f'meta_v{timestamp}.json'), meta)
 
+    _apply_retention_after_training(base_dir, on_output)
     return model_version_dir
 
 def save_rasa_model_metadata(model_path: str, training_data: dict, model_performance: dict = None) -> None:
@@ -127,49 +234,49 @@ def save_rasa_model_metadata(model_path: str, training_data: dict, model_perform
     
     # Save metadata
     metadata_path = os.path.join(metadata_dir, "model_metadata.json")
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=2)
+    atomic_write_json(metadata_path, metadata)
     
     # Also save a copy with timestamp for version tracking
     timestamp_metadata_path = os.path.join(
         metadata_dir, 
         f"model_metadata_{metadata['training_timestamp']}.json"
     )
-    with open(timestamp_metadata_path, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=2)
+    atomic_write_json(timestamp_metadata_path, metadata)
+
+_ENTITY_MARKUP_RE = re.compile(r'\]\(([^)]+)\)')
+
 
 def get_training_data_stats(nlu_data_path: str) -> dict:
     """
     Extract training data statistics from nlu.yml
+    Streams the file line by line (no YAML parse of the whole document); understands the
+    layout written by export_rasa_nlu ("- intent: X" followed by "    - example" lines).
     Args:
         nlu_data_path: Path to the nlu.yml file
     Returns:
         Dictionary containing training data statistics
     """
     try:
-        import yaml
-        with open(nlu_data_path, 'r', encoding='utf-8') as f:
-            nlu_data = yaml.safe_load(f)
-
         intents = set()
         entities = set()
         examples_count = 0
+        in_examples = False
 
-        for item in nlu_data.get('nlu', []):
-            if 'intent' in item:
-                intent_name = item['intent']
-                intents.add(intent_name)
-                examples = item.get('examples', '').split('\n')
-                examples_count += len([ex for ex in examples if ex.strip()])
-
-                # Extract entities from examples
-                for example in examples:
-                    if '[' in example and '](' in example:
-                        entity_matches = example.split('[')
-                        for match in entity_matches[1:]:
-                            if '](' in match:
-                                entity_type = match.split('](')[1].split(')')[0]
-                                entities.add(entity_type)
+        with open(nlu_data_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                stripped = line.strip()
+                if stripped.startswith('- intent:'):
+                    intents.add(stripped[len('- intent:'):].strip())
+                    in_examples = False
+                elif stripped.startswith('examples:'):
+                    in_examples = True
+                elif in_examples and stripped.startswith('- '):
+                    examples_count += 1
+                    # Extract entities from examples: [value](entity)
+                    for entity_type in _ENTITY_MARKUP_RE.findall(stripped):
+                        entities.add(entity_type)
+                elif not line.startswith(' '):
+                    in_examples = False
 
         return {
             "num_intents": len(intents),
@@ -186,119 +293,128 @@ def get_training_data_stats(nlu_data_path: str) -> dict:
             "entities": []
         }
 
-    if not training_data:
-        raise RuntimeError('No training data available in annotations.json')
 
-    # Create blank English model
-    import spacy
-    nlp = spacy.blank('en')
+# ---------- Rasa trainer + helpers ----------
+def _mark_entities(ann: dict) -> Optional[str]:
+    """Render one annotation as a Rasa example line ([value](label) markup), or None if empty."""
+    text = ann.get("text", "")
+    entities = ann.get("entities", [])
+    if not text.strip():
+        return None
 
-    if 'ner' not in nlp.pipe_names:
-        ner = nlp.add_pipe('ner')
+    if not entities:
+        example = text
     else:
-        ner = nlp.get_pipe('ner')
-
-    for label in labels:
-        ner.add_label(label)
-
-    # Begin training
-    optimizer = nlp.begin_training()
-
-    # convert training data to spaCy Example objects for newer API
-    examples = []
-    from spacy.training import Example
-    for text, ann in training_data:
-        doc = nlp.make_doc(text)
-        examples.append(Example.from_dict(doc, ann))
-
-    # Train for a small number of epochs
-    for epoch in range(10):
-        random.shuffle(examples)
-        losses = {}
-        for example in examples:
-            nlp.update([example], sgd=optimizer, drop=0.35, losses=losses)
-        print(f'[model_utils] epoch {epoch+1}/10, losses={losses}')
-
-    # Save model
-    timestamp = int(time.time())
-    model_version_dir = os.path.join(spacy_dir, f'model_v{timestamp}')
-    os.makedirs(model_version_dir, exist_ok=True)
-    nlp.to_disk(model_version_dir)
-
-    # write metadata
-    meta = {'name': 'spacy_ner', 'version': f'v{timestamp}', 'trained_at': timestamp}
-    with open(os.path.join(spacy_dir, f'meta_v{timestamp}.json'), 'w', encoding='utf-8') as fh:
-        json.dump(meta, fh, indent=2)
-
-    return model_version_dir
-
-
-# ---------- Rasa trainer + helpers ----------
-def annotations_to_rasa_nlu(annotations: List[dict], rasa_project_path: str) -> str:
+        spans = sorted(entities, key=lambda e: int(e.get("start", 0)))
+        marked = ""
+        last = 0
+        for sp in spans:
+            s = int(sp["start"])
+            e = int(sp["end"])
+            label = sp["label"]
+            marked += text[last:s]
+            marked += f"[{text[s:e]}]({label})"
+            last = e
+        marked += text[last:]
+        example = marked
+    # one example per line inside the YAML block scalar
+    return " ".join(example.split())
+
+
+def _write_run(rows: List[tuple], spill_dir: str, runs: List[str]) -> None:
+    rows.sort()
+    path = os.path.join(spill_dir, f"run_{len(runs):05d}.jsonl")
+    with open(path, "w", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+    runs.append(path)
+    rows.clear()
+
+
+def _read_run(path: str) -> Iterator[tuple]:
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            yield tuple(json.loads(line))
+
+
+def export_rasa_nlu(annotations: Iterable[dict], target: str, spill_rows: int = None) -> dict:
     """
-    Convert annotations list into Rasa-style data/nlu.yml file inside rasa_project_path/data/nlu.yml
-    annotations: list of {"text":..., "intent":..., "entities":[{"start":int,"end":int,"label":str}, ...]}
-    Returns path to written nlu.yml
+    Write annotations grouped by intent to a Rasa nlu.yml at target, with bounded memory.
+    Examples are buffered up to spill_rows; beyond that, sorted runs are spilled to temp
+    files and merged (external sort on (intent first-seen order, arrival order)), so memory
+    scales with the number of intents rather than the number of rows. Intent/entity/example
+    counts are computed in the same pass.
+    Returns: stats dict (same keys as get_training_data_stats plus per-intent/entity counts)
     """
-    import yaml, os
-    
-
-    data_dir = os.path.join(rasa_project_path, "data")
-    os.makedirs(data_dir, exist_ok=True)
-
-    intents_map = {}
-    for ann in annotations:
-        text = ann.get("text", "").strip()
-        if not text:
-            continue
-
-        intent = ann.get("intent", "unknown_intent")
-        entities = ann.get("entities", [])
-
-        if not entities:
-            example = text
+    spill_rows = spill_rows or EXPORT_SPILL_ROWS
+    intent_order = {}
+    intent_counts = {}
+    entity_counts = {}
+    rows = []
+    runs = []
+    spill_dir = None
+    try:
+        for seq, ann in enumerate(annotations):
+            example = _mark_entities(ann)
+            if example is None:
+                continue
+            intent = ann.get("intent") or "unknown_intent"
+            idx = intent_order.setdefault(intent, len(intent_order))
+            intent_counts[intent] = intent_counts.get(intent, 0) + 1
+            for ent in ann.get("entities", []):
+                label = ent.get("label")
+                if label:
+                    entity_counts[label] = entity_counts.get(label, 0) + 1
+            rows.append((idx, seq, example))
+            if len(rows) >= spill_rows:
+                if spill_dir is None:
+                    spill_dir = tempfile.mkdtemp(prefix="nlu_export_")
+                _write_run(rows, spill_dir, runs)
+
+        if runs:
+            _write_run(rows, spill_dir, runs)
+            merged = heapq.merge(*(_read_run(p) for p in runs))
         else:
-            spans = sorted(entities, key=lambda e: int(e.get("start", 0)))
-            marked = ""
-            last = 0
-            for sp in spans:
-                s = int(sp["start"])
-                e = int(sp["end"])
-                label = sp["label"]
-                marked += text[last:s]
-                marked += f"[{text[s:e]}]({label})"
-                last = e
-            marked += text[last:]
-            example = marked
-
-        intents_map.setdefault(intent, []).append(example)
-
-    nlu_section = {"version": "3.1", "nlu": []}
-
-    for intent, examples in intents_map.items():
-        block = {
-            "intent": intent,
-            "examples": "\n".join(f"  - {ex}" for ex in examples)
-        }
-
-        nlu_section["nlu"].append(block)
-
-    target = os.path.join(data_dir, "nlu.yml")
-
-    with open(target, "w", encoding="utf-8") as f:
-        f.write('version: "3.1"\n')
-        f.write("nlu:\n")
-        for intent, examples in intents_map.items():
-            f.write(f"- intent: {intent}\n")
-            f.write("  examples: |\n")
-            for ex in examples:
-                f.write(f"    - {ex}\n")
+            rows.sort()
+            merged = iter(rows)
+
+        intent_names = {idx: name for name, idx in intent_order.items()}
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write('version: "3.1"\n')
+            f.write("nlu:\n")
+            current = None
+            for idx, _, example in merged:
+                if idx != current:
+                    current = idx
+                    f.write(f"- intent: {intent_names[idx]}\n")
+                    f.write("  examples: |\n")
+                f.write(f"    - {example}\n")
+    finally:
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return {
+        "num_intents": len(intent_counts),
+        "num_examples": sum(intent_counts.values()),
+        "intents": list(intent_order),
+        "entities": list(entity_counts),
+        "intent_counts": intent_counts,
+        "entity_counts": entity_counts,
+    }
 
 
+def annotations_to_rasa_nlu(annotations: Iterable[dict], rasa_project_path: str) -> str:
+    """
+    Convert annotations into Rasa-style data/nlu.yml file inside rasa_project_path/data/nlu.yml
+    annotations: iterable of {"text":..., "intent":..., "entities":[{"start":int,"end":int,"label":str}, ...]}
+    Returns path to written nlu.yml
+    """
+    target = os.path.join(rasa_project_path, "data", "nlu.yml")
+    export_rasa_nlu(annotations, target)
     return target
 
 
-
 def _which_rasa_executable():
     """
     Return a command list to invoke rasa in the current environment.
@@ -319,6 +435,103 @@ def _which_rasa_executable():
     return [sys.executable, "-m", "rasa"]
 
 
+def _run_streaming(cmd: List[str], cwd: str, env: dict, log_fh=None,
+                   on_output: Optional[Callable[[str], None]] = None):
+    """
+    Run a command, reading stdout+stderr line by line (tqdm's carriage-return updates become lines).
+    Returns: (returncode, deque with the last RASA_OUTPUT_TAIL_LINES lines)
+    """
+    tail = deque(maxlen=RASA_OUTPUT_TAIL_LINES)
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, encoding="utf-8", errors="replace", bufsize=1,
+    )
+    for line in proc.stdout:
+        if log_fh:
+            log_fh.write(line)
+            log_fh.flush()
+        tail.append(line)
+        if on_output:
+            on_output(line)
+    return proc.wait(), tail
+
+
+def run_rasa_train_nlu(rasa_project_path: str, data_path: str, out_dir: str, model_name: str,
+                       on_output: Optional[Callable[[str], None]] = None, profile: Optional[str] = None) -> str:
+    """
+    Train a Rasa NLU model on data_path (file or directory) with the project's config.yml
+    (or the config generated for `profile`), writing <out_dir>/<model_name>.tar.gz without
+    touching the project's data/ or models/. Returns the model path.
+    """
+    cmd = _which_rasa_executable() + [
+        "train", "nlu", "--data", data_path, "--out", out_dir, "--fixed-model-name", model_name,
+    ]
+    config_path = build_profile_config(rasa_project_path, profile) if profile else None
+    if config_path:
+        cmd += ["--config", config_path]
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    try:
+        returncode, tail = _run_streaming(cmd, rasa_project_path, env, on_output=on_output)
+    finally:
+        if config_path:
+            os.remove(config_path)
+    if returncode != 0:
+        raise RuntimeError("Rasa training failed:\n" + "".join(tail)[-4000:])
+    model_path = os.path.join(out_dir, model_name + ".tar.gz")
+    if not os.path.exists(model_path):
+        raise RuntimeError("Rasa trained but no model file found at: " + model_path)
+    return model_path
+
+
+# loaded Rasa agents by model path (a scoring process parses many batches with one model)
+_rasa_agents = {}
+MAX_LOADED_RASA_AGENTS = 2
+
+
+def _load_rasa_agent(model_path: str):
+    from rasa.core.agent import Agent
+
+    agent = _rasa_agents.get(model_path)
+    if agent is None:
+        agent = Agent.load(model_path)
+        _rasa_agents[model_path] = agent
+        while len(_rasa_agents) > MAX_LOADED_RASA_AGENTS:
+            _rasa_agents.pop(next(iter(_rasa_agents)))
+    return agent
+
+
+def rasa_predict(model_path: str, texts: List[str]) -> List[dict]:
+    """
+    Parse texts with a trained Rasa model in this interpreter (requires rasa to be importable).
+    Returns: list of {"intent", "confidence", "intent_ranking", "entities":[{"start","end","label"}]}
+    """
+    import asyncio
+
+    agent = _load_rasa_agent(model_path)
+
+    async def _parse_all():
+        return [await agent.parse_message(t) for t in texts]
+
+    results = []
+    for parsed in asyncio.run(_parse_all()):
+        intent = parsed.get("intent") or {}
+        results.append({
+            "intent": intent.get("name"),
+            "confidence": intent.get("confidence"),
+            "intent_ranking": [
+                {"name": r.get("name"), "confidence": r.get("confidence")}
+                for r in parsed.get("intent_ranking", [])
+            ],
+            "entities": [
+                {"start": e.get("start"), "end": e.get("end"), "label": e.get("entity")}
+                for e in parsed.get("entities", [])
+            ],
+        })
+    return results
+
+
 def find_latest_rasa_model(rasa_project_path: str):
     models_dir = os.path.join(rasa_project_path, "models")
     if not os.path.isdir(models_dir):
@@ -327,16 +540,23 @@ def find_latest_rasa_model(rasa_project_path: str):
     return gz[0] if gz else None
 
 
-def train_rasa_model(base_dir: str) -> str:
+def train_rasa_model(base_dir: str, on_output: Optional[Callable[[str], None]] = None,
+                     annotations: Optional[Iterable[dict]] = None, extra_meta: Optional[dict] = None,
+                     profile: Optional[str] = None) -> str:
     """
     Robust Rasa training:
-      - writes annotations -> rasa_project/data/nlu.yml (uses annotations_to_rasa_nlu)
+      - streams annotations -> rasa_project/data/nlu.yml (uses export_rasa_nlu)
       - backs up existing nlu.yml
       - runs `rasa train nlu` using the same Python interpreter (sys.executable -m rasa)
-      - saves full logs to backend/models/rasa_model/training_log_{ts}.txt
-      - copies produced .tar.gz into backend/models/rasa_model/
+      - streams output line by line to backend/models/rasa_model/training_log_{ts}.txt
+        and to on_output (if given), keeping only a bounded tail in memory
+      - stores the produced .tar.gz in the artifact store and links it into backend/models/rasa_model/
       - writes metadata.json and returns dest path
+    annotations: train on these instead of annotations.json (e.g. a draft sample)
+    extra_meta: merged into the metadata.json / models_index.json entries of this run
+    profile: training profile ('quick' / 'full', see rasa_profiles); recorded in models_index.json
     """
+    profile = resolve_profile(profile)
     # allow override with env var for safety
     rasa_project_path = os.environ.get("RASA_PROJECT_PATH")
     if not rasa_project_path:
@@ -351,14 +571,6 @@ def train_rasa_model(base_dir: str) -> str:
     if not os.path.exists(annotations_file):
         raise FileNotFoundError("annotations.json not found at: " + annotations_file)
 
-    # load annotations
-    with open(annotations_file, "r", encoding="utf-8") as fh:
-        annotations = json.load(fh)
-
-    # convert -> rasa/data/nlu.yml using your converter function
-    # annotations_to_rasa_nlu is defined above in same file (keep it)
-    nlu_path = annotations_to_rasa_nlu(annotations, rasa_project_path)
-
     # backup existing nlu.yml (if any)
     nlu_file = os.path.join(rasa_project_path, "data", "nlu.yml")
     try:
@@ -369,73 +581,75 @@ def train_rasa_model(base_dir: str) -> str:
         # not fatal, continue
         pass
 
+    # stream annotations -> rasa/data/nlu.yml, collecting training data stats in the same pass
+    source = annotations if annotations is not None else iter_annotations(base_dir)
+    training_stats = export_rasa_nlu(source, nlu_file)
+
     # build command to run rasa; prefer module invocation to use same venv
     rasa_cmd = _which_rasa_executable()
     cmd = rasa_cmd + ["train", "nlu"]  # faster: only NLU
+    config_path = build_profile_config(rasa_project_path, profile)
+    if config_path:
+        cmd += ["--config", config_path]
     env = os.environ.copy()
-
-    # run training synchronously and capture logs (so Flask returns clear errors)
-    proc = subprocess.run(cmd, cwd=rasa_project_path, env=env, capture_output=True, text=True)
-    stdout = proc.stdout or ""
-    stderr = proc.stderr or ""
+    env["PYTHONUNBUFFERED"] = "1"
 
     ts = int(time.time())
-    # save training logs for debugging
     log_file = os.path.join(dest_models_dir, f"training_log_{ts}.txt")
-    with open(log_file, "w", encoding="utf-8") as lf:
-        lf.write("CMD: " + " ".join(cmd) + "\n\n")
-        lf.write("CWD: " + rasa_project_path + "\n\n")
-        lf.write("=== STDOUT ===\n")
-        lf.write(stdout + "\n\n")
-        lf.write("=== STDERR ===\n")
-        lf.write(stderr + "\n")
-
-    if proc.returncode != 0:
+
+    # stream stdout+stderr line by line into the log file (tqdm's \r updates become lines)
+    try:
+        with open(log_file, "w", encoding="utf-8") as lf:
+            lf.write("CMD: " + " ".join(cmd) + "\n\n")
+            lf.write("CWD: " + rasa_project_path + "\n\n")
+            lf.write("PROFILE: " + profile + "\n\n")
+            if config_path:
+                with open(config_path, "r", encoding="utf-8") as cf:
+                    lf.write("=== CONFIG ===\n" + cf.read() + "\n")
+            lf.write("=== OUTPUT ===\n")
+            started = time.time()
+            returncode, tail = _run_streaming(cmd, rasa_project_path, env, log_fh=lf, on_output=on_output)
+    finally:
+        if config_path:
+            os.remove(config_path)
+    output_tail = "".join(tail)[-4000:]
+
+    if returncode != 0:
         # raise with pointer to saved log so UI can show where to inspect
         raise RuntimeError(
             "Rasa training failed. See training log: "
             + log_file
-            + "\n\nSTDERR:\n"
-            + stderr[:4000]
-            + "\n\nSTDOUT:\n"
-            + stdout[:4000]
+            + "\n\nOUTPUT (tail):\n"
+            + output_tail
         )
 
+    record_throughput(base_dir, "rasa", training_stats["num_examples"], time.time() - started)
+
     # find produced model in rasa project
     latest = find_latest_rasa_model(rasa_project_path)
     if not latest:
         raise RuntimeError("Rasa trained but no model file found in rasa_project/models. See log: " + log_file)
 
-    # copy models from rasa project's models/ into backend models dir (include any new/older models)
-    rasa_models = sorted(glob(os.path.join(rasa_project_path, "models", "*.tar.gz")), key=os.path.getmtime)
-    copied = []
-    for rm in rasa_models:
-        name = os.path.basename(rm)
-        dest = os.path.join(dest_models_dir, name)
-        try:
-            if not os.path.exists(dest):
-                shutil.copy2(rm, dest)
-            copied.append({
-                "file": name,
-                "original_model_path": rm,
-                "trained_at": int(os.path.getmtime(rm)),
-            })
-        except Exception:
-            # non-fatal: continue with others
-            continue
-
-    # ensure latest is present (guaranteed by copy above, but set dest_name/dest_path)
+    # store the model produced by this run once in the content-addressed store and link it
+    # into backend models dir. Older project models are not re-linked, otherwise retention
+    # would be undone on every run.
     dest_name = os.path.basename(latest)
     dest_path = os.path.join(dest_models_dir, dest_name)
+    with store_lock():
+        model_sha256 = put_file(latest)
+        link_into(model_sha256, dest_path)
 
     # write metadata for the most-recent training run (keeps compatibility)
     metadata = {
         "info": {"name": "rasa_model", "trained_at": ts, "version": f"v{ts}"},
         "file": dest_name,
         "original_model_path": latest,
+        "sha256": model_sha256,
         "training_log": log_file,
-        "rasa_stdout_snippet": stdout[:4000],
-        "rasa_stderr_snippet": stderr[:4000],
+        "training_data": training_stats,
+        "profile": profile,
+        "rasa_output_snippet": output_tail,
+        **(extra_meta or {}),
     }
     meta_file = os.path.join(dest_models_dir, "metadata.json")
     # Append new metadata entry instead of overwriting the file.
@@ -460,13 +674,11 @@ def train_rasa_model(base_dir: str) -> str:
     entries.append(metadata)
 
     try:
-        with open(meta_file, 'w', encoding='utf-8') as fh:
-            json.dump(entries, fh, indent=2)
+        atomic_write_json(meta_file, entries)
     except Exception:
         # If writing fails, fall back to writing single-object metadata to avoid losing latest info
         try:
-            with open(meta_file, 'w', encoding='utf-8') as fh:
-                json.dump(metadata, fh, indent=2)
+            atomic_write_json(meta_file, metadata)
         except Exception:
             pass
 
@@ -481,29 +693,16 @@ def train_rasa_model(base_dir: str) -> str:
     except Exception:
         index = []
 
-    # Add/merge entries for copied models
-    existing_files = {e.get('file'): e for e in index if isinstance(e, dict) and e.get('file')}
-    for c in copied:
-        fname = c['file']
-        if fname in existing_files:
-            # update original path/trained_at if changed
-            existing_files[fname].setdefault('original_model_path', c.get('original_model_path'))
-            existing_files[fname].setdefault('trained_at', c.get('trained_at'))
-        else:
-            index.append({
-                'file': fname,
-                'original_model_path': c.get('original_model_path'),
-                'trained_at': c.get('trained_at')
-            })
-
-    # also ensure latest metadata entry is present (with training log and stdout/stderr)
+    # also ensure latest metadata entry is present (with training log and output tail)
     latest_entry = {
         'file': dest_name,
         'original_model_path': latest,
+        'sha256': model_sha256,
         'trained_at': ts,
         'training_log': log_file,
-        'rasa_stdout_snippet': stdout[:4000],
-        'rasa_stderr_snippet': stderr[:4000]
+        'profile': profile,
+        'rasa_output_snippet': output_tail,
+        **(extra_meta or {})
     }
     # replace or append latest
     replaced = False
@@ -517,10 +716,10 @@ def train_rasa_model(base_dir: str) -> str:
 
     # write back index
     try:
-        with open(index_file, 'w', encoding='utf-8') as idxf:
-            json.dump(index, idxf, indent=2)
+        atomic_write_json(index_file, index)
     except Exception:
         # non-fatal
         pass
 
+    _apply_retention_after_training(base_dir, on_output, rasa_project_path=rasa_project_path)
     return dest_path
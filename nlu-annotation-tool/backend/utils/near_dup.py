@@ -0,0 +1,356 @@
+# backend/utils/near_dup.py
+"""
+Near-duplicate clustering of annotation and uncertain-sample texts with MinHash + LSH.
+
+Every indexed text gets a MinHash signature over its character shingles; the signature
+is cut into bands and each band is hashed into a bucket. Texts sharing a bucket are
+candidates (an indexed join, no scan of the corpus; buckets hold at most BUCKET_CAP
+texts, so near-identical texts join through any member), and candidates whose estimated
+Jaccard similarity reaches NEAR_DUP_THRESHOLD are merged into one cluster (union by
+size: the smaller cluster is relabelled). The index lives in data/near_dup.sqlite and
+is maintained incrementally: only texts not yet indexed are hashed.
+"""
+import os
+import sqlite3
+import threading
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .pool import normalize_text, text_key
+from .storage import iter_json_array
+from .annotation_store import iter_annotations
+
+INDEX_FILE = 'near_dup.sqlite'
+NEAR_DUP_THRESHOLD = float(os.environ.get('NEAR_DUP_THRESHOLD', '0.6'))
+SHINGLE_SIZE = 4
+# 24 bands x 5 rows: pairs at Jaccard 0.6 become candidates with p~0.86, at 0.7 ~0.98, at 0.3 ~0.06
+NUM_BANDS = 24
+ROWS_PER_BAND = 5
+# keys stored per band bucket and candidates verified per new text (bounds work on dense data)
+BUCKET_CAP = int(os.environ.get('NEAR_DUP_BUCKET_CAP', '20'))
+MAX_CANDIDATES = 20
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+DEDUPE_MODES = ('collapse', 'weight')
+# backends whose trainer honours a per-annotation 'weight'
+WEIGHTED_BACKENDS = ('tfidf',)
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(2024)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_BAND_MULT = np.uint64(0x9E3779B97F4A7C15)
+_SIGNATURE_BATCH = 1000
+_SQL_CHUNK = 500
+# candidate pairs verified per step (bounds memory on very dense buckets)
+_PAIR_CHUNK = 50000
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def index_path(base_dir: str) -> str:
+    return os.path.join(base_dir, 'data', INDEX_FILE)
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def _connect(base_dir: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(index_path(base_dir), timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS docs ('
+                 'key TEXT PRIMARY KEY, text TEXT NOT NULL, sig BLOB NOT NULL, cluster TEXT NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS docs_cluster ON docs (cluster)')
+    conn.execute('CREATE TABLE IF NOT EXISTS clusters (cluster TEXT PRIMARY KEY, size INTEGER NOT NULL)')
+    conn.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                 'band INTEGER NOT NULL, bucket INTEGER NOT NULL, key TEXT NOT NULL, '
+                 'PRIMARY KEY (band, bucket, key)) WITHOUT ROWID')
+    return conn
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    text = normalize_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        grams = {text}
+    else:
+        grams = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """(n, NUM_PERM) uint32 MinHash signatures ((a*x + b) mod p over crc32 shingle hashes)."""
+    out = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    for lo in range(0, len(texts), _SIGNATURE_BATCH):
+        shingles = [_shingle_hashes(t) for t in texts[lo:lo + _SIGNATURE_BATCH]]
+        flat = np.concatenate(shingles)
+        starts = np.cumsum([0] + [len(s) for s in shingles[:-1]])
+        hashed = (_PERM_A[:, None] * flat[None, :] + _PERM_B[:, None]) % _PRIME
+        out[lo:lo + len(shingles)] = np.minimum.reduceat(hashed, starts, axis=1).T
+    return out
+
+
+def band_buckets(signatures: np.ndarray) -> np.ndarray:
+    """(n, NUM_BANDS) int64 bucket ids: each band's rows folded into one 64-bit hash."""
+    sig = signatures.astype(np.uint64).reshape(len(signatures), NUM_BANDS, ROWS_PER_BAND)
+    h = np.zeros((len(signatures), NUM_BANDS), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for r in range(ROWS_PER_BAND):
+            h = h * _BAND_MULT + sig[:, :, r] + np.uint64(1)
+    return h.view(np.int64)
+
+
+def _existing(conn: sqlite3.Connection, keys: List[str]) -> set:
+    found = set()
+    for lo in range(0, len(keys), _SQL_CHUNK):
+        chunk = keys[lo:lo + _SQL_CHUNK]
+        found.update(k for (k,) in conn.execute(
+            f"SELECT key FROM docs WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+    return found
+
+
+def _signatures_of(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+    keys = list(keys)
+    sigs = {}
+    for lo in range(0, len(keys), _SQL_CHUNK):
+        chunk = keys[lo:lo + _SQL_CHUNK]
+        for key, blob in conn.execute(
+                f"SELECT key, sig FROM docs WHERE key IN ({','.join('?' * len(chunk))})", chunk):
+            sigs[key] = np.frombuffer(blob, dtype=np.uint32)
+    return sigs
+
+
+def _clusters_of(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, Tuple[str, int]]:
+    keys = list(keys)
+    result = {}
+    for lo in range(0, len(keys), _SQL_CHUNK):
+        chunk = keys[lo:lo + _SQL_CHUNK]
+        result.update((k, (c, n)) for k, c, n in conn.execute(
+            'SELECT d.key, d.cluster, c.size FROM docs d JOIN clusters c ON c.cluster = d.cluster '
+            f"WHERE d.key IN ({','.join('?' * len(chunk))})", chunk))
+    return result
+
+
+def _verify(conn: sqlite3.Connection, known: Dict[str, np.ndarray],
+            pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Candidate pairs whose estimated Jaccard (share of equal signature rows) reaches the threshold."""
+    missing = {k for pair in pairs for k in pair if k not in known}
+    sigs = {k: known[k] for pair in pairs for k in pair if k in known}
+    sigs.update(_signatures_of(conn, missing))
+    order = list(sigs)
+    position = {k: i for i, k in enumerate(order)}
+    matrix = np.stack([sigs[k] for k in order])
+    a_idx = np.fromiter((position[a] for a, _ in pairs), dtype=np.int64, count=len(pairs))
+    b_idx = np.fromiter((position[b] for _, b in pairs), dtype=np.int64, count=len(pairs))
+    keep = (matrix[a_idx] == matrix[b_idx]).mean(axis=1) >= NEAR_DUP_THRESHOLD
+    return [pairs[i] for i in np.flatnonzero(keep)]
+
+
+def _candidates(conn: sqlite3.Connection, keys: List[str], buckets: np.ndarray) -> Tuple[List, List]:
+    """
+    Candidate pairs of the new texts (the texts sharing the most bands with each, earlier
+    texts of the batch included) and the bucket rows to store. Full buckets stop growing,
+    so dense regions stay bounded.
+    """
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS probe (band INTEGER, bucket INTEGER, '
+                 'PRIMARY KEY (band, bucket)) WITHOUT ROWID')
+    conn.execute('DELETE FROM probe')
+    # sorted inserts keep the b-tree writes local
+    conn.executemany('INSERT OR IGNORE INTO probe VALUES (?, ?)',
+                     sorted({(band, b) for row in buckets.tolist() for band, b in enumerate(row)}))
+    members = defaultdict(list)
+    for band, bucket, key in conn.execute(
+            'SELECT b.band, b.bucket, b.key FROM probe p JOIN buckets b '
+            'ON b.band = p.band AND b.bucket = p.bucket'):
+        members[(band, bucket)].append(key)
+    conn.execute('DELETE FROM probe')
+
+    pairs, inserts = [], []
+    for i, key in enumerate(keys):
+        shared = Counter()
+        for band, bucket_id in enumerate(buckets[i].tolist()):
+            bucket = members[(band, bucket_id)]
+            if bucket:
+                shared.update(bucket)
+            if len(bucket) < BUCKET_CAP:
+                bucket.append(key)
+                inserts.append((band, bucket_id, key))
+        pairs.extend((other, key) for other, _ in shared.most_common(MAX_CANDIDATES))
+    return pairs, sorted(inserts)
+
+
+def index_texts(base_dir: str, texts: Iterable[str]) -> Dict:
+    """
+    Add texts that are not indexed yet and merge them into near-duplicate clusters.
+    Returns: {'added': n, 'merged': n}
+    """
+    new: Dict[str, str] = {}
+    for text in texts:
+        if text and text.strip():
+            new.setdefault(text_key(text), text)
+    if not new:
+        return {'added': 0, 'merged': 0}
+    with _lock(base_dir):
+        conn = _connect(base_dir)
+        try:
+            for key in _existing(conn, list(new)):
+                del new[key]
+            if not new:
+                return {'added': 0, 'merged': 0}
+            keys = list(new)
+            sigs = minhash_signatures([new[k] for k in keys])
+            pairs, inserts = _candidates(conn, keys, band_buckets(sigs))
+            known = {k: sigs[i] for i, k in enumerate(keys)}
+            similar = []
+            for lo in range(0, len(pairs), _PAIR_CHUNK):
+                similar.extend(_verify(conn, known, pairs[lo:lo + _PAIR_CHUNK]))
+
+            # union-find over cluster ids in memory (new texts start as singleton clusters)
+            old = _clusters_of(conn, {k for pair in similar for k in pair} - set(known))
+            size = {c: n for c, n in old.values()}
+            size.update((k, 1) for k in keys)
+            parent = {c: c for c in size}
+
+            def find(c):
+                while parent[c] != c:
+                    parent[c] = parent[parent[c]]
+                    c = parent[c]
+                return c
+
+            merged = 0
+            for a, b in similar:
+                ra, rb = find(old[a][0] if a in old else a), find(old[b][0] if b in old else b)
+                if ra == rb:
+                    continue
+                if size[ra] < size[rb]:
+                    ra, rb = rb, ra
+                parent[rb] = ra             # union by size: the larger cluster keeps its id
+                size[ra] += size[rb]
+                merged += 1
+
+            conn.executemany('INSERT INTO docs (key, text, sig, cluster) VALUES (?, ?, ?, ?)',
+                             [(k, new[k], sigs[i].tobytes(), find(k)) for i, k in enumerate(keys)])
+            conn.executemany('INSERT OR IGNORE INTO buckets (band, bucket, key) VALUES (?, ?, ?)', inserts)
+            for cluster in {c for c, _ in old.values()}:
+                root = find(cluster)
+                if root != cluster:
+                    conn.execute('UPDATE docs SET cluster = ? WHERE cluster = ?', (root, cluster))
+                    conn.execute('DELETE FROM clusters WHERE cluster = ?', (cluster,))
+            conn.executemany('INSERT OR REPLACE INTO clusters (cluster, size) VALUES (?, ?)',
+                             [(c, size[c]) for c in parent if parent[c] == c])
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"[near_dup] {base_dir}: indexed {len(keys)} text(s), {merged} merge(s)")
+    return {'added': len(keys), 'merged': merged}
+
+
+def sync_index(base_dir: str) -> Dict:
+    """Index annotation and uncertain-sample texts added since the last sync."""
+    texts = [ann.get('text', '') for ann in iter_annotations(base_dir)]
+    path = os.path.join(base_dir, 'data', 'uncertain_samples.json')
+    if os.path.exists(path):
+        texts.extend(item.get('text', '') for item in iter_json_array(path) if isinstance(item, dict))
+    return index_texts(base_dir, texts)
+
+
+def cluster_ids(base_dir: str, texts: List[str]) -> Dict[str, Tuple[str, int]]:
+    """text_key -> (cluster id, cluster size) for indexed texts."""
+    keys = {text_key(t) for t in texts}
+    if not keys or not os.path.exists(index_path(base_dir)):
+        return {}
+    conn = _connect(base_dir)
+    try:
+        return _clusters_of(conn, keys)
+    finally:
+        conn.close()
+
+
+def cluster_members(base_dir: str, text: str) -> List[Dict]:
+    """All indexed texts in the cluster of text ([] when text is not indexed)."""
+    if not os.path.exists(index_path(base_dir)):
+        return []
+    conn = _connect(base_dir)
+    try:
+        row = conn.execute('SELECT cluster FROM docs WHERE key = ?', (text_key(text),)).fetchone()
+        if not row:
+            return []
+        return [{'key': k, 'text': t} for k, t in
+                conn.execute('SELECT key, text FROM docs WHERE cluster = ? ORDER BY key', row)]
+    finally:
+        conn.close()
+
+
+def dedupe_annotations(base_dir: str, annotations: List[Dict], mode: str) -> Tuple[List[Dict], Dict]:
+    """
+    Reduce near-duplicate clusters in a training set. Annotations are grouped by
+    (cluster, intent) so near-identical texts with different labels are all kept.
+    collapse: keep the first annotation of each group
+    weight: keep all, with 'weight' = 1 / group size (for WEIGHTED_BACKENDS)
+    Returns: (annotations, summary)
+    """
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"unknown dedupe mode '{mode}'; expected one of {list(DEDUPE_MODES)}")
+    texts = [a.get('text', '') for a in annotations]
+    index_texts(base_dir, texts)
+    clusters = cluster_ids(base_dir, texts)
+    groups = []
+    for a, text in zip(annotations, texts):
+        cluster = clusters.get(text_key(text), (text_key(text), 1))[0] if text.strip() else id(a)
+        groups.append((cluster, a.get('intent')))
+    sizes = Counter(groups)
+    if mode == 'collapse':
+        seen = set()
+        result = []
+        for a, group in zip(annotations, groups):
+            if group not in seen:
+                seen.add(group)
+                result.append(a)
+    else:
+        result = [dict(a, weight=round(1.0 / sizes[g], 6)) for a, g in zip(annotations, groups)]
+    summary = {'mode': mode, 'rows_before': len(annotations), 'rows': len(result),
+               'groups': len(sizes), 'duplicated_groups': sum(1 for n in sizes.values() if n > 1)}
+    return result, summary
+
+
+def prepare_deduped(base_dir: str, backend: str, mode: str, annotations: Optional[List[Dict]] = None,
+                    extra_meta: Optional[Dict] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Training set with near-duplicates collapsed or down-weighted (the workspace annotations
+    when annotations is None). 'weight' falls back to 'collapse' for backends that ignore weights.
+    Returns: (annotations, extra_meta with a 'dedupe' summary)
+    """
+    if annotations is None:
+        annotations = list(iter_annotations(base_dir))
+    if mode == 'weight' and backend not in WEIGHTED_BACKENDS:
+        mode = 'collapse'
+    annotations, summary = dedupe_annotations(base_dir, annotations, mode)
+    return annotations, {**(extra_meta or {}), 'dedupe': summary}
+
+
+def group_by_cluster(base_dir: str, samples: List[Dict]) -> Dict[str, List[Dict]]:
+    """cluster id -> samples of that cluster (samples must be indexed)."""
+    clusters = cluster_ids(base_dir, [s.get('text', '') for s in samples])
+    grouped = defaultdict(list)
+    for s in samples:
+        key = text_key(s.get('text', ''))
+        grouped[clusters.get(key, (key, 1))[0]].append(s)
+    return grouped
+
+
+def near_duplicates_of(text: str, samples: List[Dict]) -> List[Dict]:
+    """
+    The samples whose estimated Jaccard similarity with text itself reaches
+    NEAR_DUP_THRESHOLD. Clusters are single-linkage and chain (a ~ b ~ c does not make
+    a ~ c), so actions taken for one reviewed text are limited to these.
+    """
+    if not samples:
+        return []
+    sigs = minhash_signatures([text] + [s.get('text', '') for s in samples])
+    close = (sigs[1:] == sigs[0]).mean(axis=1) >= NEAR_DUP_THRESHOLD
+    return [s for s, keep in zip(samples, close.tolist()) if keep]
@@ -0,0 +1,347 @@
+# backend/utils/pool.py
+"""
+Unlabeled utterance pool.
+
+Readers stream (item_id, text) pairs from pool files (JSONL, CSV or plain text).
+The pool store keeps ingested utterances per workspace under data/pool/ in flat
+binary files that are memory-mapped for random access:
+
+    texts.bin    contiguous UTF-8 blob of all texts
+    ends.i64     end offset of item i in texts.bin (item i starts at ends[i-1])
+    keys.u64     64-bit hash of the normalised text (dedupe on ingest)
+    status.u8    0 unlabeled, 1 queued (in the uncertain queue), 2 labeled
+    manifest.json  counts and ingested sources
+
+Item ids are positions in these arrays; items are never removed.
+"""
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from .annotation_store import iter_annotations
+from .artifact_store import unshare
+
+UNLABELED, QUEUED, LABELED = 0, 1, 2
+STATUS_NAMES = {UNLABELED: 'unlabeled', QUEUED: 'queued', LABELED: 'labeled'}
+# texts hashed, deduplicated and appended per step of an ingest
+INGEST_CHUNK = int(os.environ.get('POOL_INGEST_CHUNK', '50000'))
+# ingested sources listed in the manifest
+MAX_MANIFEST_SOURCES = 100
+_ARRAY_FILES = ('texts.bin', 'ends.i64', 'keys.u64', 'status.u8')
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def text_hash64(text: str) -> int:
+    """64-bit hash of the normalised text (case and whitespace insensitive)."""
+    digest = hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def text_key(text: str) -> str:
+    """Stable id of an utterance: text_hash64 as 16 hex digits."""
+    return f'{text_hash64(text):016x}'
+
+
+# ---------- pool file readers ----------
+def pool_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext in ('.csv', '.tsv'):
+        return 'csv'
+    return 'text'
+
+
+def iter_pool_stream(fh, fmt: str, delimiter: str = ',') -> Iterator[Tuple[str, str]]:
+    """Yield (item_id, text) from an open text stream in the given format."""
+    if fmt == 'csv':
+        for n, row in enumerate(csv.DictReader(fh, delimiter=delimiter)):
+            text = (row.get('text') or '').strip()
+            if text:
+                yield str(row.get('id') or n), text
+        return
+    for n, line in enumerate(fh):
+        line = line.strip()
+        if not line:
+            continue
+        if fmt == 'jsonl':
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            text = str(obj.get('text') or '').strip() if isinstance(obj, dict) else ''
+            if text:
+                yield str(obj.get('id') or n), text
+        else:
+            yield str(n), line
+
+
+def iter_pool_file(path: str, fmt: str = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (item_id, text) from a pool file.
+    jsonl: one object per line with "text" and optional "id"; csv/tsv: header with a "text"
+    column and optional "id"; text: one utterance per line. Ids default to the line number.
+    """
+    fmt = fmt or pool_format(path)
+    delimiter = '\t' if path.lower().endswith('.tsv') else ','
+    with open(path, 'r', encoding='utf-8', newline='' if fmt == 'csv' else None) as fh:
+        yield from iter_pool_stream(fh, fmt, delimiter)
+
+
+def iter_upload(file_storage) -> Iterator[Tuple[str, str]]:
+    """(item_id, text) pairs from an uploaded file (werkzeug FileStorage), format from its name."""
+    name = file_storage.filename or ''
+    fmt = pool_format(name)
+    stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    yield from iter_pool_stream(stream, fmt, '\t' if name.lower().endswith('.tsv') else ',')
+
+
+# ---------- pool store ----------
+def pool_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, 'data', 'pool')
+
+
+def _path(base_dir: str, name: str) -> str:
+    return os.path.join(pool_dir(base_dir), name)
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def has_pool(base_dir: str) -> bool:
+    return os.path.exists(_path(base_dir, 'manifest.json'))
+
+
+def load_pool_manifest(base_dir: str) -> Dict:
+    try:
+        with open(_path(base_dir, 'manifest.json'), 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except Exception:
+        return {'count': 0, 'bytes': 0, 'sources': []}
+
+
+def _save_manifest(base_dir: str, manifest: Dict) -> None:
+    path = _path(base_dir, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _map(base_dir: str, name: str, dtype, mode: str = 'r') -> np.ndarray:
+    """Memory-map one of the pool arrays (an empty array when the file is empty or missing)."""
+    path = _path(base_dir, name)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    if mode != 'r':
+        unshare(path)       # copy on first write when shared with a cloned workspace
+    return np.memmap(path, dtype=dtype, mode=mode)
+
+
+def _truncate_to_manifest(base_dir: str, manifest: Dict) -> None:
+    """Cut the pool arrays back to the rows the manifest records (drops a failed ingest's rows)."""
+    count = manifest.get('count', 0)
+    sizes = {'texts.bin': manifest.get('bytes', 0), 'ends.i64': count * 8,
+             'keys.u64': count * 8, 'status.u8': count}
+    for name, size in sizes.items():
+        path = _path(base_dir, name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            unshare(path)
+            os.truncate(path, size)
+
+
+def ingest(base_dir: str, items: Iterable, source: str = None) -> Dict:
+    """
+    Append texts to the pool, skipping empty texts and texts already in the pool
+    (normalised-text hash). items: texts or (item_id, text) pairs.
+    Rows are only committed by the manifest saved at the end; a failed ingest is rolled back.
+    Returns: {'read', 'added', 'duplicates', 'total'}
+    """
+    os.makedirs(pool_dir(base_dir), exist_ok=True)
+    read = added = 0
+    with _lock(base_dir):
+        manifest = load_pool_manifest(base_dir)
+        _truncate_to_manifest(base_dir, manifest)
+        known = np.sort(np.array(_map(base_dir, 'keys.u64', np.uint64)))
+        offset = manifest['bytes']
+        for name in _ARRAY_FILES:
+            unshare(_path(base_dir, name))
+        try:
+            with open(_path(base_dir, 'texts.bin'), 'ab') as blob, \
+                    open(_path(base_dir, 'ends.i64'), 'ab') as ends_fh, \
+                    open(_path(base_dir, 'keys.u64'), 'ab') as keys_fh, \
+                    open(_path(base_dir, 'status.u8'), 'ab') as status_fh:
+
+                def _flush(texts: List[str]) -> None:
+                    nonlocal offset, added, known
+                    if not texts:
+                        return
+                    keys = np.fromiter((text_hash64(t) for t in texts), dtype=np.uint64, count=len(texts))
+                    _, first = np.unique(keys, return_index=True)
+                    first.sort()
+                    keys = keys[first]
+                    pos = np.searchsorted(known, keys)
+                    seen = (pos < len(known)) & (known[np.minimum(pos, max(len(known) - 1, 0))] == keys) \
+                        if len(known) else np.zeros(len(keys), dtype=bool)
+                    fresh = first[~seen]
+                    if not len(fresh):
+                        return
+                    encoded = [texts[i].encode('utf-8') for i in fresh]
+                    ends = offset + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+                    blob.write(b''.join(encoded))
+                    ends_fh.write(ends.tobytes())
+                    keys_fh.write(keys[~seen].tobytes())
+                    status_fh.write(np.zeros(len(fresh), dtype=np.uint8).tobytes())
+                    offset = int(ends[-1])
+                    added += len(fresh)
+                    known = np.sort(np.concatenate((known, keys[~seen])))
+
+                chunk = []
+                for item in items:
+                    text = item[1] if isinstance(item, (tuple, list)) else item
+                    text = (text or '').strip()
+                    read += 1
+                    if text:
+                        chunk.append(text)
+                    if len(chunk) >= INGEST_CHUNK:
+                        _flush(chunk)
+                        chunk = []
+                _flush(chunk)
+        except BaseException:
+            _truncate_to_manifest(base_dir, manifest)
+            raise
+
+        manifest['count'] = manifest.get('count', 0) + added
+        manifest['bytes'] = offset
+        manifest['sources'] = (manifest.get('sources', []) + [
+            {'source': source, 'read': read, 'added': added, 'ingested_at': int(time.time())}
+        ])[-MAX_MANIFEST_SOURCES:]
+        _save_manifest(base_dir, manifest)
+
+    labeled = sync_labeled(base_dir)
+    print(f"[pool] {base_dir}: ingested {added} of {read} item(s) from {source or 'request'}")
+    return {'read': read, 'added': added, 'duplicates': read - added, 'total': manifest['count'],
+            'labeled': labeled}
+
+
+def _text_at(blob, ends, i: int) -> str:
+    start = int(ends[i - 1]) if i else 0
+    return bytes(blob[start:int(ends[i])]).decode('utf-8')
+
+
+def get_texts(base_dir: str, indices: Iterable[int]) -> List[str]:
+    """Random access to item texts by pool index."""
+    blob = _map(base_dir, 'texts.bin', np.uint8)
+    ends = _map(base_dir, 'ends.i64', np.int64)
+    return [_text_at(blob, ends, int(i)) for i in indices]
+
+
+def iter_pool(base_dir: str, statuses: Tuple[int, ...] = (UNLABELED,),
+              chunk: int = 65536) -> Iterator[Tuple[int, str]]:
+    """Yield (index, text) of items whose status is in statuses, reading the blob via mmap."""
+    if not has_pool(base_dir):
+        return
+    blob = _map(base_dir, 'texts.bin', np.uint8)
+    ends = _map(base_dir, 'ends.i64', np.int64)
+    status = _map(base_dir, 'status.u8', np.uint8)
+    n = min(len(ends), len(status))
+    for lo in range(0, n, chunk):
+        selected = np.flatnonzero(np.isin(status[lo:lo + chunk], statuses)) + lo
+        for i in selected:
+            yield int(i), _text_at(blob, ends, int(i))
+
+
+def find_indices(base_dir: str, texts: Iterable[str]) -> np.ndarray:
+    """Pool index of each text (-1 when not in the pool)."""
+    texts = list(texts)
+    keys = _map(base_dir, 'keys.u64', np.uint64)
+    if not len(keys) or not texts:
+        return np.full(len(texts), -1, dtype=np.int64)
+    wanted = np.fromiter((text_hash64(t) for t in texts), dtype=np.uint64, count=len(texts))
+    order = np.argsort(keys, kind='stable')
+    pos = np.minimum(np.searchsorted(keys[order], wanted), len(keys) - 1)
+    found = keys[order][pos] == wanted
+    return np.where(found, order[pos], -1).astype(np.int64)
+
+
+def set_status(base_dir: str, indices: Iterable[int], status: int) -> int:
+    """Set the status of the given items; returns how many were updated."""
+    idx = np.asarray([i for i in indices if i is not None and int(i) >= 0], dtype=np.int64)
+    if not len(idx) or not has_pool(base_dir):
+        return 0
+    with _lock(base_dir):
+        arr = _map(base_dir, 'status.u8', np.uint8, mode='r+')
+        idx = idx[idx < len(arr)]
+        arr[idx] = status
+        arr.flush()
+    return len(idx)
+
+
+def mark_texts_labeled(base_dir: str, texts: Iterable[str]) -> int:
+    """Mark pool items with these texts as labeled. Never raises (the pool is optional)."""
+    try:
+        if not has_pool(base_dir):
+            return 0
+        return set_status(base_dir, find_indices(base_dir, texts), LABELED)
+    except Exception as e:
+        print(f"[pool] Could not update labeled items for {base_dir}: {e}")
+        return 0
+
+
+def sync_labeled(base_dir: str) -> int:
+    """Mark every pool item whose text is annotated as labeled."""
+    if not has_pool(base_dir):
+        return 0
+    annotated = np.fromiter((text_hash64(a['text']) for a in iter_annotations(base_dir) if a.get('text')),
+                            dtype=np.uint64)
+    with _lock(base_dir):
+        keys = _map(base_dir, 'keys.u64', np.uint64)
+        status = _map(base_dir, 'status.u8', np.uint8, mode='r+')
+        if not len(status):
+            return 0
+        hit = np.isin(keys[:len(status)], annotated) & (status != LABELED)
+        status[hit] = LABELED
+        status.flush()
+        return int(hit.sum())
+
+
+def requeue(base_dir: str, queued: Iterable[int]) -> None:
+    """Make exactly `queued` the queued items: other queued items return to unlabeled."""
+    if not has_pool(base_dir):
+        return
+    idx = np.asarray(list(queued), dtype=np.int64)
+    with _lock(base_dir):
+        status = _map(base_dir, 'status.u8', np.uint8, mode='r+')
+        if not len(status):
+            return
+        status[status == QUEUED] = UNLABELED
+        idx = idx[(idx >= 0) & (idx < len(status))]
+        idx = idx[status[idx] != LABELED]
+        status[idx] = QUEUED
+        status.flush()
+
+
+def pool_stats(base_dir: str) -> Dict:
+    manifest = load_pool_manifest(base_dir)
+    status = _map(base_dir, 'status.u8', np.uint8)
+    counts = np.bincount(status, minlength=3) if len(status) else np.zeros(3, dtype=np.int64)
+    return {
+        'total': manifest.get('count', 0),
+        'bytes': manifest.get('bytes', 0),
+        **{STATUS_NAMES[s]: int(counts[s]) for s in STATUS_NAMES},
+        'sources': manifest.get('sources', []),
+    }
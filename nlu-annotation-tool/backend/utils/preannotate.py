@@ -0,0 +1,190 @@
+# backend/utils/preannotate.py
+"""
+Model-assisted pre-annotation: run the latest workspace models plus the gazetteer over
+batches of new texts and store the suggested intent and entity spans (with confidences)
+in data/suggestions.sqlite, so the annotation UI only has to accept or correct them.
+
+Suggestions are computed by background jobs (see /api/annotations/preannotate) and keyed
+by text; each carries the version of the models and gazetteer that produced it, and a
+text is only recomputed when that version changes.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .pool import text_key, has_pool, iter_pool, UNLABELED
+from .gazetteer import load_gazetteer
+from .uncertainty import PoolScorer
+
+SUGGESTIONS_FILE = 'suggestions.sqlite'
+PREANNOTATE_BATCH_SIZE = int(os.environ.get('PREANNOTATE_BATCH_SIZE', '256'))
+DEFAULT_PREANNOTATE_LIMIT = int(os.environ.get('PREANNOTATE_LIMIT', '10000'))
+_SQL_CHUNK = 500
+
+
+def merge_entities(model_spans: List[Dict], gazetteer_spans: List[Dict]) -> List[Dict]:
+    """Union of model and gazetteer spans; on overlap the more confident span wins."""
+    merged: Dict[tuple, Dict] = {}
+    for span in model_spans:
+        merged[(span['start'], span['end'], span['label'])] = dict(span, source='model')
+    for span in gazetteer_spans:
+        span = {k: span[k] for k in ('start', 'end', 'label', 'confidence')}
+        span['source'] = 'gazetteer'
+        key = (span['start'], span['end'], span['label'])
+        if key in merged:
+            merged[key]['confidence'] = max(merged[key]['confidence'] or 0.0, span['confidence'])
+            merged[key]['source'] = 'model+gazetteer'
+        else:
+            merged[key] = span
+    kept: List[Dict] = []
+    for span in sorted(merged.values(), key=lambda s: -(s['confidence'] or 0.0)):
+        if all(span['end'] <= k['start'] or span['start'] >= k['end'] for k in kept):
+            kept.append(span)
+    return sorted(kept, key=lambda s: s['start'])
+
+
+# ---------- suggestions ----------
+class Preannotator:
+    """Suggests intent and entities for batches of texts with the latest models and the gazetteer."""
+
+    def __init__(self, base_dir: str):
+        try:
+            self.scorer = PoolScorer(base_dir)
+        except FileNotFoundError:
+            self.scorer = None          # gazetteer-only suggestions until a model is trained
+        self.gazetteer = load_gazetteer(base_dir)
+        self.model_versions = self.scorer.model_versions if self.scorer else {}
+        self.version = hashlib.blake2b(
+            json.dumps([self.model_versions, self.gazetteer.fingerprint], sort_keys=True).encode('utf-8'),
+            digest_size=8).hexdigest()
+
+    def suggest(self, texts: List[str]) -> List[Dict]:
+        rows = self.scorer.score_batch(texts, 'entropy') if self.scorer else [{} for _ in texts]
+        suggestions = []
+        for text, row, matched in zip(texts, rows, self.gazetteer.match(texts)):
+            suggestions.append({
+                'text': text,
+                'intent': row.get('predicted_intent'),
+                'confidence': row.get('confidence'),
+                'intent_ranking': row.get('intent_ranking', []),
+                'entities': merge_entities(row.get('entities', []), matched),
+                'model_versions': self.model_versions,
+                'version': self.version,
+            })
+        return suggestions
+
+    def close(self) -> None:
+        if self.scorer:
+            self.scorer.close()
+
+
+def _connect(base_dir: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(base_dir, 'data', SUGGESTIONS_FILE), timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS suggestions ('
+                 'key TEXT PRIMARY KEY, version TEXT NOT NULL, payload TEXT NOT NULL, created_at INTEGER NOT NULL)')
+    return conn
+
+
+def _stored_versions(conn: sqlite3.Connection, keys: List[str]) -> Dict[str, str]:
+    found = {}
+    for lo in range(0, len(keys), _SQL_CHUNK):
+        chunk = keys[lo:lo + _SQL_CHUNK]
+        found.update(conn.execute(
+            f"SELECT key, version FROM suggestions WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+    return found
+
+
+def _batches(texts: Iterable[str], size: int):
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def preannotate(base_dir: str, texts: Optional[Iterable[str]] = None, limit: int = DEFAULT_PREANNOTATE_LIMIT,
+                batch_size: int = PREANNOTATE_BATCH_SIZE,
+                on_output: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Compute and store suggestions for up to `limit` texts (default: the unlabeled items of
+    the pool store). Texts whose stored suggestion has the current version are skipped.
+    Returns: summary with counts, version and model versions
+    """
+    started = time.time()
+    if texts is None:
+        if not has_pool(base_dir):
+            raise FileNotFoundError('no texts given and the workspace has no unlabeled pool')
+        texts = (text for _, text in iter_pool(base_dir, (UNLABELED,)))
+    annotator = Preannotator(base_dir)
+    suggested = skipped = 0
+    conn = _connect(base_dir)
+    try:
+        seen = set()
+        for batch in _batches(texts, batch_size):
+            unique = {}
+            for text in batch:
+                key = text_key(text)
+                if text.strip() and key not in seen:
+                    seen.add(key)
+                    unique[key] = text
+            stored = _stored_versions(conn, list(unique))
+            todo = {k: t for k, t in unique.items() if stored.get(k) != annotator.version}
+            skipped += len(unique) - len(todo)
+            todo = dict(list(todo.items())[:max(0, limit - suggested)])
+            if todo:
+                now = int(time.time())
+                rows = annotator.suggest(list(todo.values()))
+                conn.executemany('INSERT OR REPLACE INTO suggestions (key, version, payload, created_at) '
+                                 'VALUES (?, ?, ?, ?)',
+                                 [(k, annotator.version, json.dumps(r, ensure_ascii=False), now)
+                                  for k, r in zip(todo, rows)])
+                conn.commit()
+                suggested += len(todo)
+                if on_output:
+                    on_output(f'[preannotate] suggested {suggested} text(s)')
+            if suggested >= limit:
+                break
+    finally:
+        conn.close()
+        annotator.close()
+    summary = {'suggested': suggested, 'skipped_current': skipped, 'version': annotator.version,
+               'model_versions': annotator.model_versions, 'seconds': round(time.time() - started, 2)}
+    print(f"[preannotate] {base_dir}: suggested {suggested} text(s), {skipped} already current")
+    return summary
+
+
+def get_suggestions(base_dir: str, texts: List[str]) -> List[Optional[Dict]]:
+    """Stored suggestion per text (None when not computed yet)."""
+    if not os.path.exists(os.path.join(base_dir, 'data', SUGGESTIONS_FILE)) or not texts:
+        return [None] * len(texts)
+    keys = [text_key(t) for t in texts]
+    conn = _connect(base_dir)
+    try:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for lo in range(0, len(unique), _SQL_CHUNK):
+            chunk = unique[lo:lo + _SQL_CHUNK]
+            found.update((k, json.loads(p)) for k, p in conn.execute(
+                f"SELECT key, payload FROM suggestions WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+    finally:
+        conn.close()
+    return [found.get(k) for k in keys]
+
+
+def list_suggestions(base_dir: str, offset: int = 0, limit: int = 50) -> List[Dict]:
+    """Stored suggestions, newest first."""
+    if not os.path.exists(os.path.join(base_dir, 'data', SUGGESTIONS_FILE)):
+        return []
+    conn = _connect(base_dir)
+    try:
+        return [json.loads(p) for (p,) in conn.execute(
+            'SELECT payload FROM suggestions ORDER BY created_at DESC, key LIMIT ? OFFSET ?', (limit, offset))]
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+# backend/utils/prediction_cache.py
+"""
+Persistent prediction cache per workspace (models/prediction_cache.sqlite), keyed by
+(model fingerprint + kind of output, text hash). Scoring, prediction and pre-annotation
+look texts up before running inference; entries of a model are evicted when retention
+deletes (retires) that model.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List
+
+CACHE_FILE = 'prediction_cache.sqlite'
+PREDICTION_CACHE_ENABLED = os.environ.get('PREDICTION_CACHE', '1') == '1'
+# keys per SELECT ... IN (...) statement
+_LOOKUP_CHUNK = 500
+# suffix of the model id, so entries keyed by an earlier cache_key scheme are not hit
+_KEY_SCHEME = 'k2'
+
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def cache_path(base_dir: str) -> str:
+    return os.path.join(base_dir, 'models', CACHE_FILE)
+
+
+def model_fingerprint(backend: str, model_path: str) -> str:
+    """Identifies one trained artifact: backend, file name and modification time."""
+    return f'{backend}:{os.path.basename(model_path)}:{os.stat(model_path).st_mtime_ns}'
+
+
+def cache_key(text: str, lowercase: bool = False) -> int:
+    """
+    Signed 64-bit hash of the text exactly as the model sees it: entity offsets depend on
+    every character, so only models that lower-case their input (tfidf) share keys, via
+    the same str.lower() their featurizer applies.
+    """
+    if lowercase:
+        text = text.lower()
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _connect(base_dir: str) -> sqlite3.Connection:
+    path = cache_path(base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS models ('
+                         'model TEXT PRIMARY KEY, backend TEXT, path TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS predictions ('
+                         'model TEXT NOT NULL, key INTEGER NOT NULL, payload TEXT NOT NULL, '
+                         'PRIMARY KEY (model, key)) WITHOUT ROWID')
+            conn.commit()
+            _initialized.add(path)
+    return conn
+
+
+def cached_predict(base_dir: str, backend: str, model_path: str, kind: str, texts: List[str],
+                   compute: Callable[[List[str]], List[Any]], lowercase: bool = False) -> List[Any]:
+    """
+    Return one JSON-serialisable payload per text, computing only cache misses (each
+    distinct text once) with compute(texts) and storing them.
+    kind: which output of the model is cached ('predict', 'proba', 'beam', ...)
+    """
+    if not PREDICTION_CACHE_ENABLED or not texts:
+        return compute(texts)
+    fingerprint = model_fingerprint(backend, model_path)
+    model = f'{fingerprint}#{kind}@{_KEY_SCHEME}'
+    keys = [cache_key(t, lowercase) for t in texts]
+    found: Dict[int, Any] = {}
+    conn = _connect(base_dir)
+    try:
+        unique = list(dict.fromkeys(keys))
+        for lo in range(0, len(unique), _LOOKUP_CHUNK):
+            chunk = unique[lo:lo + _LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, payload FROM predictions WHERE model = ? AND key IN ({','.join('?' * len(chunk))})",
+                [model, *chunk])
+            found.update((k, json.loads(p)) for k, p in rows)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = compute(list(missing.values()))
+            found.update(zip(missing.keys(), computed))
+            conn.execute('INSERT OR IGNORE INTO models (model, backend, path) VALUES (?, ?, ?)',
+                         (model, backend, os.path.abspath(model_path)))
+            conn.executemany('INSERT OR REPLACE INTO predictions (model, key, payload) VALUES (?, ?, ?)',
+                             [(model, k, json.dumps(found[k])) for k in missing])
+            conn.commit()
+    finally:
+        conn.close()
+    return [found[k] for k in keys]
+
+
+def evict_retired(base_dir: str) -> int:
+    """Delete cached predictions of models whose artifact no longer exists (or was replaced)."""
+    if not os.path.exists(cache_path(base_dir)):
+        return 0
+    conn = _connect(base_dir)
+    try:
+        retired = []
+        for model, backend, path in conn.execute('SELECT model, backend, path FROM models').fetchall():
+            fingerprint = model.split('#', 1)[0]
+            if not os.path.exists(path) or model_fingerprint(backend, path) != fingerprint:
+                retired.append(model)
+        deleted = 0
+        for model in retired:
+            deleted += conn.execute('DELETE FROM predictions WHERE model = ?', (model,)).rowcount
+            conn.execute('DELETE FROM models WHERE model = ?', (model,))
+        conn.commit()
+        if retired:
+            print(f"[prediction_cache] {base_dir}: evicted {deleted} prediction(s) of {len(retired)} retired model(s)")
+        return deleted
+    finally:
+        conn.close()
+
+
+def cache_stats(base_dir: str) -> Dict:
+    if not os.path.exists(cache_path(base_dir)):
+        return {'models': 0, 'predictions': 0, 'bytes': 0}
+    conn = _connect(base_dir)
+    try:
+        per_model = dict(conn.execute('SELECT model, COUNT(*) FROM predictions GROUP BY model').fetchall())
+    finally:
+        conn.close()
+    return {'models': len(per_model), 'predictions': sum(per_model.values()),
+            'per_model': per_model, 'bytes': os.path.getsize(cache_path(base_dir))}
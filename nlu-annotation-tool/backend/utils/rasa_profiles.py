@@ -0,0 +1,61 @@
+# backend/utils/rasa_profiles.py
+"""
+Rasa training profiles: generate the pipeline config for a run from the project's
+config.yml. 'full' trains with config.yml unchanged (deployment quality); 'quick'
+reduces DIET epochs and model size and caps the count-vector vocabulary so an
+annotator gets a sanity-check model in seconds.
+"""
+import os
+import copy
+import tempfile
+from typing import Dict, Optional
+
+DEFAULT_PROFILE = os.environ.get('RASA_DEFAULT_PROFILE', 'full')
+
+# profile -> component name -> parameters overriding config.yml
+PROFILES: Dict[str, Dict[str, Dict]] = {
+    'full': {},
+    'quick': {
+        'DIETClassifier': {
+            'epochs': int(os.environ.get('RASA_QUICK_EPOCHS', '20')),
+            'hidden_layers_sizes': {'text': [64]},
+            'number_of_transformer_layers': 1,
+            'transformer_size': 64,
+            'embedding_dimension': 10,
+        },
+        'CountVectorsFeaturizer': {'max_features': 2000},
+        'ResponseSelector': {'epochs': int(os.environ.get('RASA_QUICK_EPOCHS', '20'))},
+    },
+}
+
+
+def resolve_profile(profile: Optional[str]) -> str:
+    """Return a known profile name (default when empty); raises ValueError otherwise."""
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"unknown training profile '{profile}'; expected one of {sorted(PROFILES)}")
+    return profile
+
+
+def build_profile_config(rasa_project_path: str, profile: str) -> Optional[str]:
+    """
+    Write the config for `profile` to a temporary YAML file and return its path
+    (the caller removes it). Returns None for profiles without overrides, in which
+    case Rasa uses the project's config.yml as-is.
+    """
+    overrides = PROFILES[resolve_profile(profile)]
+    if not overrides:
+        return None
+
+    import yaml
+
+    with open(os.path.join(rasa_project_path, 'config.yml'), 'r', encoding='utf-8') as fh:
+        config = yaml.safe_load(fh) or {}
+    config = copy.deepcopy(config)
+    for component in config.get('pipeline') or []:
+        component.update(overrides.get(component.get('name'), {}))
+
+    fd, path = tempfile.mkstemp(prefix=f'config_{profile}_', suffix='.yml')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        yaml.safe_dump(config, fh, sort_keys=False)
+    return path
@@ -0,0 +1,275 @@
+# backend/utils/retention.py
+"""
+Retention / garbage collection for training artifacts.
+
+Policy: an artifact is kept when it is among the newest `keep_last` of its kind,
+newer than `max_age_days`, pinned, or the latest model of its backend. Everything
+else is deleted and the workspace indexes (metadata.json, models_index.json) are
+rewritten to only reference what is left.
+"""
+import os
+import re
+import json
+import time
+import shutil
+from glob import glob
+from typing import Dict, List, Optional
+
+from .artifact_store import gc_store
+from .prediction_cache import evict_retired
+from .storage import atomic_write_json
+
+RETENTION_KEEP_LAST = int(os.environ.get('RETENTION_KEEP_LAST', '5'))
+_max_age = os.environ.get('RETENTION_MAX_AGE_DAYS')
+RETENTION_MAX_AGE_DAYS = float(_max_age) if _max_age else None
+
+PINNED_FILE = 'pinned.json'
+
+_SPACY_VERSION_RE = re.compile(r'^model_v(\d+)$')
+_TFIDF_VERSION_RE = re.compile(r'^model_v(\d+)\.npz$')
+_LOG_RE = re.compile(r'^training_log_(\d+)\.txt$')
+_BACKUP_RE = re.compile(r'^nlu\.yml\.bak_(\d+)$')
+
+
+def _file_reclaimable(path: str) -> int:
+    """Bytes freed by unlinking path: 0 while other hardlinks (e.g. the artifact store) remain."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    return st.st_size if st.st_nlink <= 1 else 0
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for f in files:
+                total += _file_reclaimable(os.path.join(root, f))
+        return total
+    return _file_reclaimable(path)
+
+
+def _remove(path: str, report: Dict, dry_run: bool) -> None:
+    size = _path_size(path)
+    if not dry_run:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            print(f"[retention] Could not delete {path}: {e}")
+            return
+    report['deleted'].append(path)
+    report['reclaimed_bytes'] += size
+
+
+def _select_kept(items: List[tuple], keep_last: int, max_age_days: Optional[float],
+                 pinned: set, always_keep_latest: bool = True) -> set:
+    """
+    items: list of (name, timestamp). Returns the set of names to keep.
+    """
+    now = time.time()
+    ordered = sorted(items, key=lambda it: it[1], reverse=True)
+    kept = set()
+    for rank, (name, ts) in enumerate(ordered):
+        if rank < keep_last or name in pinned or (always_keep_latest and rank == 0):
+            kept.add(name)
+        elif max_age_days is not None and now - ts < max_age_days * 86400:
+            kept.add(name)
+    return kept
+
+
+def load_pinned(models_dir: str) -> Dict[str, List[str]]:
+    """Load pinned versions ({'spacy': [...], 'rasa': [...]}) for a workspace models dir."""
+    path = os.path.join(models_dir, PINNED_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh) or {}
+            return {'spacy': list(data.get('spacy', [])), 'rasa': list(data.get('rasa', [])),
+                    'tfidf': list(data.get('tfidf', []))}
+    except Exception:
+        return {'spacy': [], 'rasa': [], 'tfidf': []}
+
+
+def set_pinned(base_dir: str, backend: str, version: str, pinned: bool = True) -> Dict[str, List[str]]:
+    """Pin (or unpin) a model version so retention never deletes it."""
+    models_dir = os.path.join(base_dir, 'models')
+    os.makedirs(models_dir, exist_ok=True)
+    data = load_pinned(models_dir)
+    versions = [v for v in data.setdefault(backend, []) if v != version]
+    if pinned:
+        versions.append(version)
+    data[backend] = versions
+    atomic_write_json(os.path.join(models_dir, PINNED_FILE), data)
+    return data
+
+
+def _load_json_list(path: str) -> Optional[list]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh)
+    except Exception:
+        return None
+    if isinstance(data, dict):
+        return [data]
+    return data if isinstance(data, list) else None
+
+
+def _entry_ts(entry: Dict) -> float:
+    info = entry.get('info') or {}
+    return entry.get('trained_at') or info.get('trained_at') or 0
+
+
+def _gc_spacy(models_dir: str, policy: Dict, pinned: set, report: Dict, dry_run: bool) -> None:
+    spacy_dir = os.path.join(models_dir, 'spacy_model')
+    if not os.path.isdir(spacy_dir):
+        return
+    versions = []
+    for name in os.listdir(spacy_dir):
+        m = _SPACY_VERSION_RE.match(name)
+        if m and os.path.isdir(os.path.join(spacy_dir, name)):
+            versions.append((name, int(m.group(1))))
+    kept = _select_kept(versions, policy['keep_last'], policy['max_age_days'], pinned)
+    for name, ts in versions:
+        if name in kept:
+            continue
+        _remove(os.path.join(spacy_dir, name), report, dry_run)
+        meta = os.path.join(spacy_dir, f'meta_v{ts}.json')
+        if os.path.exists(meta):
+            _remove(meta, report, dry_run)
+    report['kept']['spacy'] = sorted(kept)
+
+
+def _gc_tfidf(models_dir: str, policy: Dict, pinned: set, report: Dict, dry_run: bool) -> None:
+    tfidf_dir = os.path.join(models_dir, 'tfidf_model')
+    if not os.path.isdir(tfidf_dir):
+        return
+    versions = []
+    for name in os.listdir(tfidf_dir):
+        m = _TFIDF_VERSION_RE.match(name)
+        if m:
+            versions.append((name, int(m.group(1))))
+    kept = _select_kept(versions, policy['keep_last'], policy['max_age_days'], pinned)
+    for name, ts in versions:
+        if name in kept:
+            continue
+        _remove(os.path.join(tfidf_dir, name), report, dry_run)
+        meta = os.path.join(tfidf_dir, f'meta_v{ts}.json')
+        if os.path.exists(meta):
+            _remove(meta, report, dry_run)
+    report['kept']['tfidf'] = sorted(kept)
+
+
+def _gc_rasa(models_dir: str, policy: Dict, pinned: set, report: Dict, dry_run: bool) -> None:
+    rasa_dir = os.path.join(models_dir, 'rasa_model')
+    if not os.path.isdir(rasa_dir):
+        return
+    keep_last = policy['keep_last']
+    models = [(name, os.path.getmtime(os.path.join(rasa_dir, name)))
+              for name in os.listdir(rasa_dir) if name.endswith('.tar.gz')]
+    kept = _select_kept(models, keep_last, policy['max_age_days'], pinned)
+    for name, _ in models:
+        if name not in kept:
+            _remove(os.path.join(rasa_dir, name), report, dry_run)
+    report['kept']['rasa'] = sorted(kept)
+
+    # rewrite metadata.json / models_index.json so they only reference kept models,
+    # and drop output snippets from all but the newest entries
+    referenced_logs = set()
+    for fname in ('metadata.json', 'models_index.json'):
+        path = os.path.join(rasa_dir, fname)
+        entries = _load_json_list(path)
+        if entries is None:
+            continue
+        entries = [e for e in entries if isinstance(e, dict) and e.get('file') in kept]
+        entries.sort(key=_entry_ts)
+        for i, e in enumerate(entries):
+            if i < len(entries) - keep_last:
+                for key in ('rasa_output_snippet', 'rasa_stdout_snippet', 'rasa_stderr_snippet'):
+                    e.pop(key, None)
+            if e.get('training_log'):
+                referenced_logs.add(os.path.basename(e['training_log']))
+        if not dry_run:
+            atomic_write_json(path, entries)
+
+    # training logs: keep the ones referenced by kept models plus the newest keep_last
+    logs = []
+    for name in os.listdir(rasa_dir):
+        m = _LOG_RE.match(name)
+        if m:
+            logs.append((name, int(m.group(1))))
+    kept_logs = _select_kept(logs, keep_last, policy['max_age_days'], referenced_logs)
+    for name, _ in logs:
+        if name not in kept_logs:
+            _remove(os.path.join(rasa_dir, name), report, dry_run)
+
+
+def gc_rasa_project(rasa_project_path: str, policy: Dict = None, dry_run: bool = False) -> Dict:
+    """Prune nlu.yml backups and old .tar.gz models in the shared Rasa project."""
+    policy = {'keep_last': RETENTION_KEEP_LAST, 'max_age_days': RETENTION_MAX_AGE_DAYS, **(policy or {})}
+    report = {'deleted': [], 'reclaimed_bytes': 0, 'kept': {}, 'dry_run': dry_run}
+
+    data_dir = os.path.join(rasa_project_path, 'data')
+    backups = []
+    if os.path.isdir(data_dir):
+        for name in os.listdir(data_dir):
+            m = _BACKUP_RE.match(name)
+            if m:
+                backups.append((name, int(m.group(1))))
+    kept = _select_kept(backups, policy['keep_last'], policy['max_age_days'], set())
+    for name, _ in backups:
+        if name not in kept:
+            _remove(os.path.join(data_dir, name), report, dry_run)
+    report['kept']['nlu_backups'] = sorted(kept)
+
+    models = [(os.path.basename(p), os.path.getmtime(p))
+              for p in glob(os.path.join(rasa_project_path, 'models', '*.tar.gz'))]
+    kept = _select_kept(models, policy['keep_last'], policy['max_age_days'], set())
+    for name, _ in models:
+        if name not in kept:
+            _remove(os.path.join(rasa_project_path, 'models', name), report, dry_run)
+    report['kept']['project_models'] = sorted(kept)
+    return report
+
+
+def apply_retention(base_dir: str, policy: Dict = None, dry_run: bool = False,
+                    rasa_project_path: str = None) -> Dict:
+    """
+    Apply the retention policy to a workspace (and optionally the shared Rasa project).
+    Args:
+        base_dir: workspace directory (contains models/)
+        policy: {'keep_last': int, 'max_age_days': float|None}; defaults from env
+        dry_run: report what would be deleted without deleting
+        rasa_project_path: also prune backups/models of this Rasa project
+    Returns: report dict with deleted paths, reclaimed_bytes and kept versions
+    """
+    policy = {'keep_last': RETENTION_KEEP_LAST, 'max_age_days': RETENTION_MAX_AGE_DAYS, **(policy or {})}
+    policy['keep_last'] = max(1, int(policy['keep_last']))
+    models_dir = os.path.join(base_dir, 'models')
+    pinned = load_pinned(models_dir)
+    report = {'deleted': [], 'reclaimed_bytes': 0, 'kept': {}, 'dry_run': dry_run, 'policy': policy}
+
+    _gc_spacy(models_dir, policy, set(pinned['spacy']), report, dry_run)
+    _gc_rasa(models_dir, policy, set(pinned['rasa']), report, dry_run)
+    _gc_tfidf(models_dir, policy, set(pinned['tfidf']), report, dry_run)
+
+    if rasa_project_path:
+        project = gc_rasa_project(rasa_project_path, policy, dry_run)
+        report['deleted'].extend(project['deleted'])
+        report['reclaimed_bytes'] += project['reclaimed_bytes']
+        report['kept'].update(project['kept'])
+
+    # cached predictions of deleted models, then blobs whose last workspace/project link was just removed
+    if not dry_run:
+        report['evicted_predictions'] = evict_retired(base_dir)
+        store = gc_store()
+        report['deleted'].extend(store['deleted'])
+        report['reclaimed_bytes'] += store['reclaimed_bytes']
+
+    print(f"[retention] {base_dir}: deleted {len(report['deleted'])} item(s), "
+          f"reclaimed {report['reclaimed_bytes']} bytes{' (dry run)' if dry_run else ''}")
+    return report
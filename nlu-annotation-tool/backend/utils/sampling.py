@@ -0,0 +1,152 @@
+# backend/utils/sampling.py
+"""
+Stratified subsampling for draft models: bound training time on large workspaces by
+training on a sample that keeps every intent / entity-label combination represented.
+A budget is given in rows or in seconds; seconds are converted to rows using the
+training throughput measured on previous runs of the same backend.
+"""
+import os
+import json
+import random
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .storage import atomic_write_json
+from .annotation_store import iter_annotations
+
+THROUGHPUT_FILE = 'throughput.json'
+# rows/second assumed before a backend has been timed in this workspace
+DEFAULT_ROWS_PER_SECOND = {'spacy': 150.0, 'rasa': 40.0, 'tfidf': 20000.0}
+# weight of the newest measurement in the moving average
+_THROUGHPUT_SMOOTHING = 0.5
+
+
+def _stratum(ann: Dict) -> Tuple[str, Tuple[str, ...]]:
+    labels = sorted({str(e.get('label')) for e in ann.get('entities', []) if e.get('label')})
+    return str(ann.get('intent') or ''), tuple(labels)
+
+
+def stratified_sample(annotations: List[Dict], max_rows: int, seed: int = 13) -> List[Dict]:
+    """
+    Pick at most max_rows annotations, stratified by (intent, entity label set).
+    Every stratum gets at least one row when the budget allows; the rest is allocated
+    proportionally (largest remainder), and rows a small stratum cannot fill go to the
+    strata that still have rows. With fewer rows than strata, strata that add an
+    unseen intent or label are preferred. Original order is preserved.
+    """
+    indexed = [(i, a) for i, a in enumerate(annotations) if a.get('text', '').strip()]
+    if max_rows <= 0:
+        return []
+    if len(indexed) <= max_rows:
+        return [a for _, a in indexed]
+
+    groups = defaultdict(list)
+    for i, ann in indexed:
+        groups[_stratum(ann)].append(i)
+    rng = random.Random(seed)
+    for members in groups.values():
+        rng.shuffle(members)
+
+    strata = sorted(groups, key=lambda k: len(groups[k]), reverse=True)
+    quota = {}
+    if len(strata) > max_rows:
+        seen_intents, seen_labels = set(), set()
+
+        def _gain(key):
+            intent, labels = key
+            return int(intent not in seen_intents) + len(set(labels) - seen_labels)
+
+        remaining = list(strata)
+        while len(quota) < max_rows:
+            best = max(remaining, key=lambda k: (_gain(k), len(groups[k])))
+            remaining.remove(best)
+            quota[best] = 1
+            seen_intents.add(best[0])
+            seen_labels.update(best[1])
+    else:
+        quota = {k: 1 for k in strata}
+        extra = max_rows - len(strata)
+        # proportional shares of the strata with rows left, capped at their size; repeated
+        # until the budget is spent (len(indexed) > max_rows, so rows are always left)
+        while extra > 0:
+            open_strata = [k for k in strata if quota[k] < len(groups[k])]
+            total = sum(len(groups[k]) for k in open_strata)
+            shares = {k: extra * len(groups[k]) / total for k in open_strata}
+            given = 0
+            for k in open_strata:
+                n = min(int(shares[k]), len(groups[k]) - quota[k])
+                quota[k] += n
+                given += n
+            for k in sorted(open_strata, key=lambda k: shares[k] - int(shares[k]), reverse=True):
+                if given >= extra:
+                    break
+                if quota[k] < len(groups[k]):
+                    quota[k] += 1
+                    given += 1
+            extra -= given
+
+    chosen = sorted(i for k, n in quota.items() for i in groups[k][:n])
+    return [annotations[i] for i in chosen]
+
+
+def _throughput_path(base_dir: str) -> str:
+    return os.path.join(base_dir, 'models', THROUGHPUT_FILE)
+
+
+def load_throughput(base_dir: str) -> Dict[str, float]:
+    try:
+        with open(_throughput_path(base_dir), 'r', encoding='utf-8') as fh:
+            return json.load(fh) or {}
+    except Exception:
+        return {}
+
+
+def record_throughput(base_dir: str, backend: str, rows: int, seconds: float) -> None:
+    """Update the measured rows/second of a backend (exponential moving average)."""
+    if not rows or seconds <= 0:
+        return
+    data = load_throughput(base_dir)
+    rate = rows / seconds
+    previous = data.get(backend)
+    data[backend] = round(rate if previous is None else
+                          _THROUGHPUT_SMOOTHING * rate + (1 - _THROUGHPUT_SMOOTHING) * previous, 3)
+    try:
+        atomic_write_json(_throughput_path(base_dir), data)
+    except Exception as e:
+        print(f"[sampling] Could not record throughput for {base_dir}: {e}")
+
+
+def rows_for_budget(base_dir: str, backend: str, sample: Dict) -> Optional[int]:
+    """Translate a sample budget ({'rows': n} or {'seconds': s}) into a row count."""
+    if sample.get('rows'):
+        return max(1, int(sample['rows']))
+    if sample.get('seconds'):
+        rate = load_throughput(base_dir).get(backend) or DEFAULT_ROWS_PER_SECOND.get(backend, 50.0)
+        return max(1, int(float(sample['seconds']) * rate))
+    return None
+
+
+def prepare_draft_sample(base_dir: str, backend: str, sample: Dict) -> Tuple[List[Dict], Dict]:
+    """
+    Build the stratified training sample for a draft model.
+    Args:
+        base_dir: workspace directory
+        backend: 'spacy', 'rasa' or 'tfidf' (used for the seconds -> rows conversion)
+        sample: {'rows': int} or {'seconds': float}, optional 'seed'
+    Returns: (sampled annotations, metadata to store on the model: draft flag and sample info)
+    """
+    max_rows = rows_for_budget(base_dir, backend, sample)
+    if max_rows is None:
+        raise ValueError('sample budget must specify rows or seconds')
+    annotations = list(iter_annotations(base_dir))
+    sampled = stratified_sample(annotations, max_rows, seed=int(sample.get('seed', 13)))
+    meta = {
+        'draft': True,
+        'sample': {
+            'budget': {k: sample[k] for k in ('rows', 'seconds') if sample.get(k)},
+            'rows': len(sampled),
+            'total_rows': len(annotations),
+            'num_intents': len({a.get('intent') for a in sampled if a.get('intent')}),
+        },
+    }
+    return sampled, meta
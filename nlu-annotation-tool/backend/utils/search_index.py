@@ -0,0 +1,268 @@
+# backend/utils/search_index.py
+"""
+Full-text search over workspace annotations with SQLite FTS5 (data/search.sqlite).
+
+Every annotation record is a row keyed by its annotation id, with its text in an
+external-content FTS5 table and its intent and entity labels in indexed side tables, so
+term, phrase, intent and label filters are all index lookups. The index applies the
+annotation store's changes since its last sync (inserts, updates and deletes) after every
+write and before a search, and is rebuilt when those changes are no longer available.
+
+Records are also grouped into fixed chunks of CHUNK_RECORDS ids whose version is bumped
+on every write to them, so dataset snapshots only re-read chunks that changed.
+"""
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .annotation_store import open_annotations, store_position, changes_since
+
+INDEX_FILE = 'search.sqlite'
+MAX_SEARCH_LIMIT = 500
+SEARCH_ORDERS = ('newest', 'oldest', 'relevance')
+_INSERT_BATCH = 5000
+# records per change-tracking chunk (ids chunk * CHUNK_RECORDS ..)
+CHUNK_RECORDS = 1024
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def index_path(base_dir: str) -> str:
+    return os.path.join(base_dir, 'data', INDEX_FILE)
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def _connect(base_dir: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(index_path(base_dir), timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, text TEXT NOT NULL,
+                                         intent TEXT, record TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS docs_intent ON docs (intent, id);
+        CREATE TABLE IF NOT EXISTS doc_labels (label TEXT NOT NULL, id INTEGER NOT NULL,
+                                               PRIMARY KEY (label, id)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS chunk_versions (chunk INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+        CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+            text, content='docs', content_rowid='id', tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3');
+    ''')
+    return conn
+
+
+def _meta(conn: sqlite3.Connection, key: str, default: str = '') -> str:
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+def _labels(ann: Dict) -> List[str]:
+    return sorted({e.get('label') or e.get('entity') for e in ann.get('entities') or []} - {None, ''})
+
+
+def _bump_chunks(conn: sqlite3.Connection, ids: Iterable[int]) -> None:
+    conn.executemany('INSERT INTO chunk_versions (chunk, version) VALUES (?, 1) '
+                     'ON CONFLICT (chunk) DO UPDATE SET version = version + 1',
+                     [(c,) for c in sorted({i // CHUNK_RECORDS for i in ids})])
+
+
+def _insert(conn: sqlite3.Connection, records: Iterable[Dict]) -> int:
+    count = 0
+    docs, labels = [], []
+
+    def flush():
+        conn.executemany('INSERT INTO docs (id, text, intent, record) VALUES (?, ?, ?, ?)', docs)
+        conn.executemany('INSERT INTO docs_fts (rowid, text) VALUES (?, ?)', [(d[0], d[1]) for d in docs])
+        conn.executemany('INSERT OR IGNORE INTO doc_labels (label, id) VALUES (?, ?)', labels)
+        _bump_chunks(conn, (d[0] for d in docs))
+        docs.clear()
+        labels.clear()
+
+    for ann in records:
+        docs.append((ann['id'], ann.get('text') or '', ann.get('intent'), json.dumps(ann, ensure_ascii=False)))
+        labels.extend((label, ann['id']) for label in _labels(ann))
+        count += 1
+        if len(docs) >= _INSERT_BATCH:
+            flush()
+    if docs:
+        flush()
+    return count
+
+
+def _remove(conn: sqlite3.Connection, ids: Iterable[int]) -> int:
+    removed = 0
+    for i in ids:
+        row = conn.execute('SELECT text, record FROM docs WHERE id = ?', (i,)).fetchone()
+        if row is None:
+            continue
+        conn.execute("INSERT INTO docs_fts (docs_fts, rowid, text) VALUES ('delete', ?, ?)", (i, row[0]))
+        conn.executemany('DELETE FROM doc_labels WHERE label = ? AND id = ?',
+                         [(label, i) for label in _labels(json.loads(row[1]))])
+        conn.execute('DELETE FROM docs WHERE id = ?', (i,))
+        removed += 1
+    _bump_chunks(conn, ids)
+    return removed
+
+
+def _apply(conn: sqlite3.Connection, ops: List[Dict]) -> int:
+    """Apply annotation store operations; returns the change in the number of indexed records."""
+    latest = {}
+    for op in ops:
+        latest[op['id']] = op
+    delta = -_remove(conn, list(latest))
+    delta += _insert(conn, (op['record'] for op in latest.values() if op['op'] != 'delete'))
+    return delta
+
+
+def rebuild_search_index(base_dir: str) -> int:
+    """Re-index the workspace annotations from scratch. Returns the number of indexed records."""
+    with _lock(base_dir):
+        conn = _connect(base_dir)
+        try:
+            generation, seq, records = open_annotations(base_dir)
+            conn.execute('DELETE FROM doc_labels')
+            conn.execute('DELETE FROM docs')
+            conn.execute('DELETE FROM chunk_versions')
+            # chunk versions restart: consumers of them must not reuse anything older, even
+            # when the index file itself was deleted or came from another workspace
+            _set_meta(conn, 'generation', uuid.uuid4().hex)
+            conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('delete-all')")
+            count = _insert(conn, records)
+            _set_meta(conn, 'indexed', count)
+            _set_meta(conn, 'store_generation', generation)
+            _set_meta(conn, 'store_seq', seq)
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"[search_index] {base_dir}: indexed {count} annotation(s)")
+    return count
+
+
+def sync_search_index(base_dir: str) -> int:
+    """
+    Bring the index up to date with the annotation store: apply the operations since the
+    last sync (nothing to read when there are none), or rebuild when they were compacted away.
+    Returns the number of indexed records.
+    """
+    with _lock(base_dir):
+        conn = _connect(base_dir)
+        try:
+            indexed = int(_meta(conn, 'indexed', '0'))
+            generation, seq = _meta(conn, 'store_generation'), int(_meta(conn, 'store_seq', '-1'))
+            if (generation, seq) == store_position(base_dir):
+                return indexed
+            ops = changes_since(base_dir, generation, seq)
+            if ops is not None:
+                if ops:
+                    indexed += _apply(conn, ops)
+                    _set_meta(conn, 'indexed', indexed)
+                    _set_meta(conn, 'store_seq', ops[-1]['seq'])
+                    conn.commit()
+                return indexed
+        finally:
+            conn.close()
+    return rebuild_search_index(base_dir)
+
+
+def index_annotations(base_dir: str) -> None:
+    """
+    Index the annotations just written (see sync_search_index).
+    Never raises: the index is a cache and is re-synced before searching.
+    """
+    try:
+        sync_search_index(base_dir)
+    except Exception as e:
+        print(f"[search_index] Could not index annotations for {base_dir}: {e}")
+
+
+def _fts_query(terms: Optional[str], phrase: Optional[str]) -> str:
+    """FTS5 query: every term must occur (a trailing * matches a prefix), plus the exact phrase."""
+    parts = []
+    for term in (terms or '').split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            parts.append(f'"{term}"' + ('*' if prefix else ''))
+    if phrase and phrase.strip():
+        parts.append('"' + phrase.strip().replace('"', '""') + '"')
+    return ' AND '.join(parts)
+
+
+def search_annotations(base_dir: str, q: Optional[str] = None, phrase: Optional[str] = None,
+                       intent: Optional[str] = None, labels: Optional[List[str]] = None,
+                       offset: int = 0, limit: int = 50, order: str = 'newest',
+                       count: bool = False) -> Dict:
+    """
+    Annotations matching all given filters.
+    q: terms that must all occur; phrase: exact phrase; labels: entity labels that must all occur
+    order: 'newest' or 'oldest' stream matches in id order; 'relevance' (bm25, text
+           queries only) has to rank every match, so it is slow for very common terms
+    Returns: {'results': [{'id', 'annotation'}], 'has_more', 'total'?}
+    """
+    sync_search_index(base_dir)
+    match = _fts_query(q, phrase)
+    sql = ['SELECT d.id, d.record FROM docs d']
+    args: List = []
+    if match:
+        sql.append('JOIN docs_fts f ON f.rowid = d.id AND docs_fts MATCH ?')
+        args.append(match)
+    for i, label in enumerate(labels or []):
+        sql.append(f'JOIN doc_labels l{i} ON l{i}.id = d.id AND l{i}.label = ?')
+        args.append(label)
+    if intent:
+        sql.append('WHERE d.intent = ?')
+        args.append(intent)
+    if order == 'relevance' and match:
+        sql.append('ORDER BY f.rank, d.id')
+    else:
+        # ordering on the FTS rowid lets FTS5 stream its doclist instead of sorting all matches
+        sql.append(f"ORDER BY {'f.rowid' if match else 'd.id'} {'ASC' if order == 'oldest' else 'DESC'}")
+    conn = _connect(base_dir)
+    try:
+        rows = conn.execute(' '.join(sql) + ' LIMIT ? OFFSET ?', args + [limit + 1, offset]).fetchall()
+        result = {'results': [{'id': i, 'annotation': json.loads(r)} for i, r in rows[:limit]],
+                  'has_more': len(rows) > limit}
+        if count:
+            result['total'] = conn.execute(
+                'SELECT COUNT(*) FROM (' + ' '.join(s for s in sql if not s.startswith('ORDER BY'))
+                .replace('d.id, d.record', '1', 1) + ')', args).fetchone()[0]
+    finally:
+        conn.close()
+    return result
+
+
+def chunk_versions(base_dir: str) -> Tuple[str, int, Dict[int, int]]:
+    """
+    (generation, number of records, {chunk: version}) of the up-to-date index. Chunks
+    emptied by deletes keep a version; chunks never written have none.
+    """
+    sync_search_index(base_dir)
+    conn = _connect(base_dir)
+    try:
+        return (_meta(conn, 'generation', '0'), int(_meta(conn, 'indexed', '0')),
+                dict(conn.execute('SELECT chunk, version FROM chunk_versions')))
+    finally:
+        conn.close()
+
+
+def chunk_records(base_dir: str, chunk: int) -> List[Dict]:
+    """Records of one chunk in id order."""
+    conn = _connect(base_dir)
+    try:
+        return [json.loads(r) for (r,) in conn.execute(
+            'SELECT record FROM docs WHERE id >= ? AND id < ? ORDER BY id',
+            (chunk * CHUNK_RECORDS, (chunk + 1) * CHUNK_RECORDS))]
+    finally:
+        conn.close()
@@ -0,0 +1,210 @@
+# backend/utils/snapshots.py
+"""
+Immutable, content-addressed dataset snapshots.
+
+A snapshot is a manifest listing the chunks of the annotation records (records with ids
+chunk * CHUNK_RECORDS .. + CHUNK_RECORDS - 1, canonical JSON lines) plus the digests of intents.json and
+entities.json. Chunks and manifests are blobs in the artifact store, hardlinked into
+data/snapshots/objects/ so they stay referenced; a snapshot id is the sha256 of its
+manifest, so identical datasets get the same id and unchanged chunks are shared between
+snapshots (and workspaces).
+
+Chunk digests are cached against the search index's chunk versions, so a snapshot of
+the workspace dataset only reads and hashes the chunks written since the previous one.
+Models reference the snapshot they were trained on as 'dataset_snapshot' in their
+metadata.
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from .artifact_store import put_bytes, link_into, blob_path, store_lock
+from .search_index import CHUNK_RECORDS, chunk_versions, chunk_records
+from .storage import atomic_write_json
+
+SNAPSHOT_FORMAT = 1
+DATA_FILES = ('intents.json', 'entities.json')
+MAX_DIFF_RECORDS = 100
+_DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(base_dir: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(base_dir), threading.Lock())
+
+
+def snapshots_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, 'data', 'snapshots')
+
+
+def _object_path(base_dir: str, digest: str) -> str:
+    return os.path.join(snapshots_dir(base_dir), 'objects', digest)
+
+
+def _put(base_dir: str, data: bytes) -> str:
+    """Store a blob and keep it referenced from this workspace."""
+    with store_lock():
+        digest = put_bytes(data)
+        if not os.path.exists(_object_path(base_dir, digest)):
+            link_into(digest, _object_path(base_dir, digest))
+    return digest
+
+
+def _read(base_dir: str, digest: str) -> bytes:
+    path = _object_path(base_dir, digest)
+    if not os.path.exists(path):
+        path = blob_path(digest)
+        if not path:
+            raise FileNotFoundError('snapshot object not found: ' + digest)
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+def _canonical(record: Dict) -> str:
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def _chunk_bytes(records: Iterable[Dict]) -> bytes:
+    return ''.join(_canonical(r) + '\n' for r in records).encode('utf-8')
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return default
+
+
+def _dataset_chunks(base_dir: str) -> List[Dict]:
+    """Chunks of the workspace annotations; only chunks changed since the last call are hashed."""
+    cache_file = os.path.join(snapshots_dir(base_dir), 'chunk_cache.json')
+    generation, _, versions = chunk_versions(base_dir)
+    cache = _load_json(cache_file, {})
+    cached = cache.get('chunks', {}) if cache.get('generation') == generation else {}
+    chunks, fresh = [], {}
+    for chunk in sorted(versions):
+        entry = cached.get(str(chunk))
+        if not entry or entry['version'] != versions[chunk]:
+            records = chunk_records(base_dir, chunk)
+            entry = {'version': versions[chunk], 'records': len(records),
+                     'digest': _put(base_dir, _chunk_bytes(records)) if records else None}
+        fresh[str(chunk)] = entry
+        if entry['records']:        # every record of the chunk was deleted
+            chunks.append({'digest': entry['digest'], 'records': entry['records']})
+    atomic_write_json(cache_file, {'generation': generation, 'chunks': fresh})
+    return chunks
+
+
+def create_snapshot(base_dir: str, annotations: Optional[List[Dict]] = None, reason: str = None) -> Dict:
+    """
+    Snapshot the workspace dataset, or `annotations` (e.g. a draft sample) when given.
+    Returns: index entry {'id', 'created_at', 'records', 'chunks', 'subset', 'reason'}
+    """
+    with _lock(base_dir):
+        if annotations is None:
+            chunks = _dataset_chunks(base_dir)
+        else:
+            chunks = [{'digest': _put(base_dir, _chunk_bytes(annotations[lo:lo + CHUNK_RECORDS])),
+                       'records': len(annotations[lo:lo + CHUNK_RECORDS])}
+                      for lo in range(0, len(annotations), CHUNK_RECORDS)]
+        files = {}
+        for name in DATA_FILES:
+            path = os.path.join(base_dir, 'data', name)
+            if os.path.exists(path):
+                with open(path, 'rb') as fh:
+                    files[name] = _put(base_dir, fh.read())
+        manifest = {'format': SNAPSHOT_FORMAT, 'chunk_records': CHUNK_RECORDS, 'subset': annotations is not None,
+                    'records': sum(c['records'] for c in chunks), 'chunks': chunks, 'files': files}
+        snapshot_id = _put(base_dir, json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+        index_file = os.path.join(snapshots_dir(base_dir), 'index.json')
+        index = _load_json(index_file, [])
+        entry = {'id': snapshot_id, 'created_at': int(time.time()), 'records': manifest['records'],
+                 'chunks': len(chunks), 'subset': manifest['subset'], 'reason': reason}
+        if not index or index[-1]['id'] != snapshot_id:
+            index.append(entry)
+            atomic_write_json(index_file, index)
+        else:
+            entry = index[-1]
+    print(f"[snapshots] {base_dir}: snapshot {snapshot_id[:12]} ({entry['records']} records, {len(chunks)} chunks)")
+    return entry
+
+
+def snapshot_for_training(base_dir: str, backend: str, annotations: Optional[List[Dict]] = None,
+                          extra_meta: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    extra_meta with the id of a snapshot of the training data added as 'dataset_snapshot'.
+    Never raises: a failed snapshot is logged and training goes ahead without one.
+    """
+    try:
+        snapshot = create_snapshot(base_dir, annotations, reason='train_' + backend)
+    except Exception as e:
+        print(f"[snapshots] Could not snapshot the training data of {base_dir}: {e}")
+        return extra_meta
+    return {**(extra_meta or {}), 'dataset_snapshot': snapshot['id']}
+
+
+def list_snapshots(base_dir: str) -> List[Dict]:
+    return _load_json(os.path.join(snapshots_dir(base_dir), 'index.json'), [])
+
+
+def load_manifest(base_dir: str, snapshot_id: str) -> Dict:
+    if not _DIGEST_RE.fullmatch(snapshot_id or ''):
+        raise ValueError('invalid snapshot id: ' + str(snapshot_id))
+    return json.loads(_read(base_dir, snapshot_id))
+
+
+def iter_snapshot_records(base_dir: str, snapshot_id: str) -> Iterable[Dict]:
+    """The annotation records of a snapshot, in order."""
+    for chunk in load_manifest(base_dir, snapshot_id)['chunks']:
+        for line in _read(base_dir, chunk['digest']).decode('utf-8').splitlines():
+            yield json.loads(line)
+
+
+def diff_snapshots(base_dir: str, old_id: str, new_id: str, limit: int = MAX_DIFF_RECORDS) -> Dict:
+    """
+    Records added and removed between two snapshots (an edited record is one of each),
+    intent and entity label count changes, and changed data files. Only chunks whose
+    digest is not shared by both snapshots are read.
+    """
+    old, new = load_manifest(base_dir, old_id), load_manifest(base_dir, new_id)
+    old_digests = Counter(c['digest'] for c in old['chunks'])
+    new_digests = Counter(c['digest'] for c in new['chunks'])
+
+    def lines(digests: Counter) -> Counter:
+        found = Counter()
+        for digest, n in digests.items():
+            for line in _read(base_dir, digest).decode('utf-8').splitlines():
+                found[line] += n
+        return found
+
+    old_lines, new_lines = lines(old_digests - new_digests), lines(new_digests - old_digests)
+    added, removed = new_lines - old_lines, old_lines - new_lines
+
+    intents, labels = Counter(), Counter()
+    for recs, sign in ((added, 1), (removed, -1)):
+        for line, n in recs.items():
+            record = json.loads(line)
+            intents[record.get('intent') or ''] += sign * n
+            for ent in record.get('entities') or []:
+                labels[ent.get('label') or ent.get('entity') or ''] += sign * n
+    return {
+        'from': old_id, 'to': new_id,
+        'records': {'from': old['records'], 'to': new['records']},
+        'shared_chunks': sum((old_digests & new_digests).values()),
+        'added_count': sum(added.values()), 'removed_count': sum(removed.values()),
+        'added': [json.loads(line) for line in list(added.elements())[:limit]],
+        'removed': [json.loads(line) for line in list(removed.elements())[:limit]],
+        'intent_changes': {k: v for k, v in intents.items() if v},
+        'label_changes': {k: v for k, v in labels.items() if v},
+        'changed_files': sorted(name for name in set(old['files']) | set(new['files'])
+                                if old['files'].get(name) != new['files'].get(name)),
+    }
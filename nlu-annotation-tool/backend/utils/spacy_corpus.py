@@ -0,0 +1,205 @@
+# backend/utils/spacy_corpus.py
+"""
+Per-workspace compiled spaCy corpus: annotations are converted to Docs once, as they
+arrive, and stored as sharded DocBin files under data/corpus/. Entity spans are
+validated against the tokenization at write time; misaligned spans are rejected and
+reported in the manifest instead of surfacing at training time.
+
+New annotations are appended as they arrive; an update or delete in the annotation
+store means a recompile from scratch before the next training run.
+"""
+import os
+import json
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .annotation_store import open_annotations, store_position, changes_since
+
+CORPUS_SHARD_SIZE = int(os.environ.get('CORPUS_SHARD_SIZE', '2000'))
+# misaligned spans listed in the manifest (the total is always counted)
+MAX_REPORTED_MISALIGNED = 200
+
+_lock = threading.Lock()
+_nlp = None
+
+
+def _blank_nlp():
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.blank('en')
+    return _nlp
+
+
+def corpus_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, 'data', 'corpus')
+
+
+def _manifest_path(base_dir: str) -> str:
+    return os.path.join(corpus_dir(base_dir), 'manifest.json')
+
+
+def _empty_manifest() -> Dict:
+    return {'shard_size': CORPUS_SHARD_SIZE, 'shards': [], 'num_annotations': 0,
+            'num_docs': 0, 'labels': [], 'misaligned': [], 'misaligned_count': 0}
+
+
+def load_manifest(base_dir: str) -> Dict:
+    try:
+        with open(_manifest_path(base_dir), 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except Exception:
+        return _empty_manifest()
+
+
+def _save_manifest(base_dir: str, manifest: Dict) -> None:
+    path = _manifest_path(base_dir)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def _write_shard(docbin, path: str) -> None:
+    # replaced, never rewritten in place: the old file may be shared with a cloned workspace
+    tmp = path + '.tmp'
+    docbin.to_disk(tmp)
+    os.replace(tmp, path)
+
+
+def _to_doc(nlp, ann: Dict, index: int, manifest: Dict):
+    """Build a reference Doc; spans that do not align to token boundaries are rejected."""
+    from spacy.util import filter_spans
+
+    text = ann.get('text', '')
+    if not text:
+        return None
+    doc = nlp.make_doc(text)
+    spans = []
+    for e in ann.get('entities', []):
+        try:
+            start, end, label = int(e.get('start')), int(e.get('end')), str(e.get('label'))
+        except Exception:
+            continue
+        span = doc.char_span(start, end, label=label, alignment_mode='strict')
+        if span is None:
+            manifest['misaligned_count'] += 1
+            if len(manifest['misaligned']) < MAX_REPORTED_MISALIGNED:
+                manifest['misaligned'].append({'annotation_index': index, 'annotation_id': ann.get('id'),
+                                               'start': start, 'end': end,
+                                               'label': label, 'span_text': text[start:end]})
+            continue
+        spans.append(span)
+    doc.ents = filter_spans(spans)
+    if ann.get('intent'):
+        doc.cats = {str(ann['intent']): 1.0}
+    return doc
+
+
+def _append_docs(base_dir: str, manifest: Dict, annotations: Iterable[Dict], start_index: int) -> int:
+    """Append annotations to the last shard (or new shards). Returns the number consumed."""
+    from spacy.tokens import DocBin
+
+    nlp = _blank_nlp()
+    cdir = corpus_dir(base_dir)
+    os.makedirs(cdir, exist_ok=True)
+    labels = set(manifest['labels'])
+    shard_size = manifest.get('shard_size', CORPUS_SHARD_SIZE)
+
+    current, current_info = None, None
+    if manifest['shards'] and manifest['shards'][-1]['n_docs'] < shard_size:
+        current_info = manifest['shards'][-1]
+        current = DocBin(store_user_data=False).from_disk(os.path.join(cdir, current_info['file']))
+
+    consumed = 0
+    for offset, ann in enumerate(annotations):
+        consumed += 1
+        doc = _to_doc(nlp, ann, start_index + offset, manifest)
+        if doc is None:
+            continue
+        if current is None:
+            current_info = {'file': f"shard_{len(manifest['shards']):05d}.spacy", 'n_docs': 0}
+            manifest['shards'].append(current_info)
+            current = DocBin(store_user_data=False)
+        current.add(doc)
+        current_info['n_docs'] += 1
+        manifest['num_docs'] += 1
+        labels.update(ent.label_ for ent in doc.ents)
+        if current_info['n_docs'] >= shard_size:
+            _write_shard(current, os.path.join(cdir, current_info['file']))
+            current, current_info = None, None
+    if current is not None:
+        _write_shard(current, os.path.join(cdir, current_info['file']))
+
+    manifest['labels'] = sorted(labels)
+    manifest['num_annotations'] += consumed
+    return consumed
+
+
+def rebuild_corpus(base_dir: str) -> Dict:
+    """Recompile the corpus from the workspace annotations from scratch."""
+    with _lock:
+        cdir = corpus_dir(base_dir)
+        if os.path.isdir(cdir):
+            for name in os.listdir(cdir):
+                if name.endswith('.spacy'):
+                    os.remove(os.path.join(cdir, name))
+        manifest = _empty_manifest()
+        manifest['store_generation'], manifest['store_seq'], records = open_annotations(base_dir)
+        _append_docs(base_dir, manifest, records, 0)
+        os.makedirs(cdir, exist_ok=True)
+        _save_manifest(base_dir, manifest)
+        return manifest
+
+
+def sync_corpus(base_dir: str, rebuild: bool = True) -> Dict:
+    """
+    Bring the corpus up to date with the annotation store: append the records inserted
+    since the last sync, or rebuild if any were updated or deleted (or the changes were
+    compacted away).
+    rebuild: False leaves a corpus that needs a rebuild as it is (stale until training)
+    """
+    position = store_position(base_dir)
+    with _lock:
+        manifest = load_manifest(base_dir)
+        compiled = (manifest.get('store_generation'), manifest.get('store_seq', -1))
+        if compiled == position:
+            return manifest
+        ops = changes_since(base_dir, *compiled)
+        if ops is not None and all(op['op'] == 'insert' for op in ops):
+            if ops:
+                _append_docs(base_dir, manifest, [op['record'] for op in ops], manifest['num_annotations'])
+                manifest['store_seq'] = ops[-1]['seq']
+                _save_manifest(base_dir, manifest)
+            return manifest
+        if not rebuild:
+            return manifest
+    return rebuild_corpus(base_dir)
+
+
+def append_to_corpus(base_dir: str) -> Optional[Dict]:
+    """
+    Compile the annotations just written (see sync_corpus). A corpus that needs a rebuild
+    after updates or deletes is left for the next training run, so writes stay cheap.
+    Never raises: the corpus is a cache and is re-synced before training.
+    """
+    try:
+        return sync_corpus(base_dir, rebuild=False)
+    except Exception as e:
+        print(f"[spacy_corpus] Could not compile annotations for {base_dir}: {e}")
+        return None
+
+
+def load_corpus_examples(base_dir: str, nlp) -> List:
+    """
+    Training Examples of the whole corpus: every shard is deserialized and tokenized once
+    per training run, and the Examples are reused (reshuffled) across epochs.
+    """
+    from spacy.tokens import DocBin
+    from spacy.training import Example
+
+    examples = []
+    for info in load_manifest(base_dir)['shards']:
+        docbin = DocBin().from_disk(os.path.join(corpus_dir(base_dir), info['file']))
+        examples.extend(Example(nlp.make_doc(ref.text), ref) for ref in docbin.get_docs(nlp.vocab))
+    return examples
@@ -0,0 +1,84 @@
+# backend/utils/storage.py
+"""
+Storage helpers for workspace data files.
+"""
+import os
+import re
+import json
+import tempfile
+from typing import IO, Any, Iterator, Union
+
+_READ_CHUNK = 64 * 1024
+_WHITESPACE = ' \t\r\n'
+_SEPARATORS = re.compile(r'[ \t\r\n,]*')
+
+
+def iter_json_array(path: Union[str, IO[str]], chunk_size: int = _READ_CHUNK) -> Iterator[Any]:
+    """
+    Yield the items of a top-level JSON array one at a time, reading the file in chunks,
+    so memory is bounded by the largest single item rather than the whole file.
+    path: file path, or a text file opened by the caller (closed when iteration ends)
+    """
+    decoder = json.JSONDecoder()
+    if isinstance(path, str):
+        fh = open(path, 'r', encoding='utf-8')
+    else:
+        fh, path = path, getattr(path, 'name', 'JSON file')
+    with fh:
+        buf = fh.read(chunk_size).lstrip(_WHITESPACE)
+        if not buf:
+            return
+        if buf[0] != '[':
+            raise ValueError('expected a JSON array in ' + path)
+        # pos indexes the next unread character; buf is only compacted when a chunk is read
+        pos = 1
+        eof = False
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            while pos == len(buf) and not eof:
+                buf = fh.read(chunk_size)
+                eof = not buf
+                pos = _SEPARATORS.match(buf).end()
+            if buf.startswith(']', pos):
+                return
+            if pos == len(buf):
+                raise ValueError('unterminated JSON array in ' + path)
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # item spans beyond the buffer: read more and retry
+                more = fh.read(chunk_size)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            # a number cut by the chunk boundary parses as a prefix ("12" of "123", "1" of "1.5")
+            if (isinstance(item, (int, float)) and not isinstance(item, bool)
+                    and not eof and (end == len(buf) or buf[end] not in _WHITESPACE + ',]')):
+                more = fh.read(chunk_size)
+                if more:
+                    buf, pos = buf[pos:] + more, 0
+                    continue
+                eof = True
+            yield item
+            pos = end
+
+
+def atomic_write_json(path: str, data: Any, indent: int = 2) -> None:
+    """
+    Write JSON to a temp file in the same directory and rename it over path, so readers
+    see either the old or the new file, never a partial write.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(data, fh, indent=indent, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
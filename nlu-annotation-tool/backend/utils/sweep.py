@@ -0,0 +1,168 @@
+# backend/utils/sweep.py
+"""
+spaCy hyperparameter sweep: train a grid of configurations (dropout, batch-size
+schedule, epochs) concurrently in worker processes on one shared stratified split,
+score each on the held-out part and keep only the best model as the new model_v{ts}.
+The full sweep table is stored in its meta_v{ts}.json.
+"""
+import os
+import time
+import shutil
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from .model_utils import build_spacy_ner, _emit, _apply_retention_after_training
+from .evaluation import stratified_split, score, DEFAULT_TEST_FRACTION, DEFAULT_SEED
+from .storage import atomic_write_json
+from .annotation_store import iter_annotations
+
+# dropout x batch-size schedule (None = one example per update) x epochs
+DEFAULT_GRID = {
+    'drop': [0.2, 0.35, 0.5],
+    'batch_size': [None, [4.0, 32.0, 1.001]],
+    'epochs': [10, 20],
+}
+
+# split shared by the configurations of one sweep, set once per worker process
+_split = None
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _valid_value(key: str, value) -> bool:
+    if key == 'drop':
+        return _is_number(value) and 0 <= value < 1
+    if key == 'epochs':
+        return isinstance(value, int) and not isinstance(value, bool) and value > 0
+    # batch_size: None (one example per update) or a compounding schedule [start, stop, compound]
+    return value is None or (isinstance(value, list) and len(value) == 3
+                             and all(_is_number(v) and v > 0 for v in value))
+
+
+def validate_grid(grid) -> None:
+    """Raise ValueError unless grid maps keys of DEFAULT_GRID to non-empty lists of valid values."""
+    if not isinstance(grid, dict):
+        raise ValueError('sweep grid must be an object of value lists')
+    for key, values in grid.items():
+        if key not in DEFAULT_GRID:
+            raise ValueError(f"unknown sweep parameter {key!r}; expected one of {', '.join(DEFAULT_GRID)}")
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'sweep parameter {key!r} must be a non-empty list')
+        for value in values:
+            if not _valid_value(key, value):
+                raise ValueError(f'invalid {key} value in sweep: {value!r}')
+
+
+def expand_grid(grid: Dict[str, List]) -> List[Dict]:
+    """Cartesian product of the grid values as a list of config dicts."""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _init_worker(train: List[Dict], test: List[Dict]) -> None:
+    global _split
+    _split = (train, test)
+
+
+def _train_config(index: int, config: Dict, out_dir: str) -> Dict:
+    """Train and score one configuration on the shared split; the model is saved to out_dir."""
+    train, test = _split
+    started = time.time()
+    nlp = build_spacy_ner(train, epochs=int(config.get('epochs', 10)), drop=float(config.get('drop', 0.35)),
+                          on_output=None, batch_size=config.get('batch_size'))
+    seconds = round(time.time() - started, 2)
+    predicted = [
+        {'intent': None,
+         'entities': [{'start': e.start_char, 'end': e.end_char, 'label': e.label_} for e in doc.ents]}
+        for doc in nlp.pipe(a.get('text', '') for a in test)
+    ]
+    nlp.to_disk(out_dir)
+    metrics = score(test, predicted)
+    metrics['train_size'] = len(train)
+    metrics['seconds'] = seconds
+    return {'index': index, 'config': config, 'metrics': metrics}
+
+
+def _rank_key(row: Dict):
+    # best entity F1 first, then the cheaper configuration
+    metrics = row['metrics']
+    return (-(metrics.get('entity_f1') or 0.0), metrics.get('seconds') or 0.0)
+
+
+def run_spacy_sweep(base_dir: str, grid: Optional[Dict[str, List]] = None,
+                    test_fraction: float = DEFAULT_TEST_FRACTION, max_workers: int = None,
+                    on_output: Optional[Callable[[str], None]] = None, extra_meta: Optional[dict] = None) -> str:
+    """
+    Run a hyperparameter sweep for the workspace and save the winning model.
+    Args:
+        base_dir: workspace directory
+        grid: {'drop': [...], 'batch_size': [...], 'epochs': [...]} (missing keys use DEFAULT_GRID)
+        test_fraction: held-out share of the stratified split used to score every configuration
+        max_workers: worker processes (default: CPU count)
+        extra_meta: merged into the winner's meta_v{ts}.json (e.g. {'dataset_snapshot': ...})
+    Returns: path of the saved model_v{ts} directory
+    """
+    spacy_dir = os.path.join(base_dir, 'models', 'spacy_model')
+    os.makedirs(spacy_dir, exist_ok=True)
+    data_file = os.path.join(base_dir, 'data', 'annotations.json')
+    if not os.path.exists(data_file):
+        raise FileNotFoundError('annotations.json not found')
+
+    annotations = list(iter_annotations(base_dir))
+    train, test = stratified_split(annotations, test_fraction, DEFAULT_SEED)
+    if not train or not test:
+        raise RuntimeError('Not enough annotations for a held-out split')
+
+    if grid:
+        validate_grid(grid)
+    configs = expand_grid({**DEFAULT_GRID, **(grid or {})})
+    workers = min(len(configs), max_workers or os.cpu_count() or 1)
+    timestamp = int(time.time())
+    work_dir = os.path.join(spacy_dir, f'.sweep_{timestamp}')
+    os.makedirs(work_dir, exist_ok=True)
+    _emit(f'[sweep] {len(configs)} configuration(s) on {workers} worker(s), '
+          f'train={len(train)} test={len(test)}', on_output)
+
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(train, test)) as pool:
+            futures = [pool.submit(_train_config, i, cfg, os.path.join(work_dir, f'cfg_{i}'))
+                       for i, cfg in enumerate(configs)]
+            for future in as_completed(futures):
+                row = future.result()
+                rows.append(row)
+                _emit(f"[sweep] {len(rows)}/{len(configs)} {row['config']} "
+                      f"entity_f1={row['metrics']['entity_f1']} ({row['metrics']['seconds']}s)", on_output)
+
+        rows.sort(key=_rank_key)
+        best = rows[0]
+        model_version_dir = os.path.join(spacy_dir, f'model_v{timestamp}')
+        os.replace(os.path.join(work_dir, f"cfg_{best['index']}"), model_version_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    meta = {
+        'name': 'spacy_ner',
+        'version': f'v{timestamp}',
+        'trained_at': timestamp,
+        'config': best['config'],
+        'evaluation': {'backend': 'spacy', 'evaluated_at': int(time.time()), 'seed': DEFAULT_SEED,
+                       'method': 'holdout', 'test_fraction': test_fraction, 'metrics': best['metrics']},
+        'sweep': {
+            'num_configs': len(rows),
+            'workers': workers,
+            'train_size': len(train),
+            'test_size': len(test),
+            'results': [{'config': r['config'], 'metrics': r['metrics']} for r in rows],
+        },
+        **(extra_meta or {}),
+    }
+    atomic_write_json(os.path.join(spacy_dir, f'meta_v{timestamp}.json'), meta)
+    _emit(f"[sweep] best {best['config']} entity_f1={best['metrics']['entity_f1']}", on_output)
+
+    _apply_retention_after_training(base_dir, on_output)
+    return model_version_dir
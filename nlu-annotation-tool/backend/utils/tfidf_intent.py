@@ -0,0 +1,324 @@
+# backend/utils/tfidf_intent.py
+"""
+In-process intent classifier: hashed word (1-2 gram) and character (3-5 gram)
+TF-IDF features in SciPy sparse matrices and a Complement Naive Bayes linear layer
+with temperature-scaled softmax confidences. Training is a few sparse products (no
+subprocess, no iterative solver) and predictions come from a compact .npz artifact:
+only the feature columns seen in training are stored.
+
+Artifacts: models/tfidf_model/model_v{ts}.npz + meta_v{ts}.json
+"""
+import os
+import re
+import time
+import zlib
+import threading
+from itertools import chain
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import minimize_scalar
+
+from .storage import atomic_write_json
+from .annotation_store import iter_annotations
+
+# hashed feature space (power of two); only the columns used in training are stored
+TFIDF_N_FEATURES = 1 << int(os.environ.get('TFIDF_HASH_BITS', '20'))
+# additive smoothing of the complement feature counts
+TFIDF_ALPHA = float(os.environ.get('TFIDF_ALPHA', '0.1'))
+CHAR_NGRAMS = (3, 4, 5)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_HASH_MULT = np.uint64(1000003)
+
+
+def _char_ngram_features(texts: List[str], n_features: int):
+    """
+    Vectorized hashing of character n-grams over all texts at once: texts are joined with
+    NUL separators (each padded with spaces) and rolling hashes are computed with NumPy.
+    Returns: (row indices, column indices) of every n-gram occurrence.
+    """
+    joined = '\0'.join(' ' + t.lower() + ' ' for t in texts).encode('utf-8')
+    buf = np.frombuffer(joined, dtype=np.uint8).astype(np.uint64)
+    is_sep = buf == 0
+    sep_cum = np.concatenate(([0], np.cumsum(is_sep)))
+    rows, cols = [], []
+    for n in CHAR_NGRAMS:
+        count = len(buf) - n + 1
+        if count <= 0:
+            continue
+        h = np.full(count, n, dtype=np.uint64)
+        for j in range(n):
+            h = h * _HASH_MULT + buf[j:j + count]
+        # drop windows that cross a document separator
+        valid = (sep_cum[n:n + count] - sep_cum[:count]) == 0
+        h = h[valid]
+        rows.append(sep_cum[:count][valid])
+        cols.append(((h ^ (h >> np.uint64(31))) % np.uint64(n_features)).astype(np.int64))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows).astype(np.int64), np.concatenate(cols)
+
+
+def _word_features(texts: List[str], n_features: int):
+    """
+    Word unigram ('w:a') and bigram ('b:a b') features. Tokens are mapped to vocabulary ids
+    and bigrams to id pairs with NumPy, so only distinct tokens and distinct bigrams are
+    hashed in Python (a bigram's crc32 continues from the crc32 of 'b:a ').
+    Returns: (row indices, column indices) of every occurrence.
+    """
+    docs = [_WORD_RE.findall(text.lower()) for text in texts]
+    lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+    tokens = list(chain.from_iterable(docs))
+    if not tokens:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    vocab = list(dict.fromkeys(tokens))
+    ids = np.fromiter(map({t: i for i, t in enumerate(vocab)}.__getitem__, tokens),
+                      dtype=np.int64, count=len(tokens))
+    encoded = [t.encode('utf-8') for t in vocab]
+    unigram = np.fromiter((zlib.crc32(b'w:' + t) for t in encoded), dtype=np.int64, count=len(vocab))
+    token_rows = np.repeat(np.arange(len(docs), dtype=np.int64), lengths)
+
+    # bigrams: consecutive tokens of the same document
+    same_doc = token_rows[:-1] == token_rows[1:]
+    pairs = ids[:-1][same_doc] * len(vocab) + ids[1:][same_doc]
+    distinct, inverse = np.unique(pairs, return_inverse=True)
+    prefix = [zlib.crc32(b'b:' + t + b' ') for t in encoded]
+    bigram = np.fromiter((zlib.crc32(encoded[b], prefix[a]) for a, b in
+                          zip((distinct // len(vocab)).tolist(), (distinct % len(vocab)).tolist())),
+                         dtype=np.int64, count=len(distinct))
+    rows = np.concatenate((token_rows, token_rows[:-1][same_doc]))
+    cols = np.concatenate((unigram[ids], bigram[inverse.ravel()])) % n_features
+    return rows, cols
+
+
+def hashed_counts(texts: List[str], n_features: int = TFIDF_N_FEATURES) -> sp.csr_matrix:
+    """Term counts of all word and char n-gram features of texts in the hashed space."""
+    r1, c1 = _word_features(texts, n_features)
+    r2, c2 = _char_ngram_features(texts, n_features)
+    rows, cols = np.concatenate((r1, r2)), np.concatenate((c1, c2))
+    data = np.ones(len(rows), dtype=np.float32)
+    m = sp.csr_matrix((data, (rows, cols)), shape=(len(texts), n_features))
+    m.sum_duplicates()
+    return m
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+
+class TfidfIntentModel:
+    """TF-IDF features restricted to the training columns plus a linear layer with softmax."""
+
+    def __init__(self, columns, idf, weights, bias, labels, n_features=TFIDF_N_FEATURES):
+        self.columns = columns          # sorted hashed column ids seen in training
+        self.idf = idf                  # idf per stored column
+        self.weights = weights          # (len(columns), n_labels)
+        self.bias = bias                # (n_labels,)
+        self.labels = list(labels)
+        self.n_features = int(n_features)
+
+    def transform(self, texts: List[str]) -> sp.csr_matrix:
+        """Sublinear TF-IDF, L2-normalised rows, over the stored columns (unseen features dropped)."""
+        counts = hashed_counts(texts, self.n_features)
+        pos = np.minimum(np.searchsorted(self.columns, counts.indices), len(self.columns) - 1)
+        known = self.columns[pos] == counts.indices
+        return self._weigh(counts, pos, known)
+
+    def _weigh(self, counts: sp.csr_matrix, pos: np.ndarray, known: np.ndarray) -> sp.csr_matrix:
+        # counts: hashed term counts; pos: stored column of each entry; known: entry is stored
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))[known]
+        data = (1.0 + np.log(counts.data[known])) * self.idf[pos[known]]
+        norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=counts.shape[0]))
+        norms[norms == 0] = 1.0
+        data = (data / norms[rows]).astype(np.float32)
+        return sp.csr_matrix((data, (rows, pos[known])), shape=(counts.shape[0], len(self.columns)))
+
+    def _logits_single(self, text: str) -> np.ndarray:
+        # same features as transform() without building sparse matrices (latency path)
+        _, c1 = _word_features([text], self.n_features)
+        _, c2 = _char_ngram_features([text], self.n_features)
+        cols, counts = np.unique(np.concatenate((c1, c2)), return_counts=True)
+        pos = np.minimum(np.searchsorted(self.columns, cols), len(self.columns) - 1)
+        known = self.columns[pos] == cols
+        pos = pos[known]
+        values = (1.0 + np.log(counts[known])) * self.idf[pos]
+        norm = np.sqrt(values @ values) or 1.0
+        return (values / norm) @ self.weights[pos] + self.bias
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        if len(texts) == 1:
+            return _softmax(self._logits_single(texts[0])[None, :].astype(np.float64))
+        return _softmax(np.asarray(self.transform(texts) @ self.weights) + self.bias)
+
+    def predict(self, texts: List[str], top_k: int = 5) -> List[Dict]:
+        """Returns: list of {"intent", "confidence", "intent_ranking", "entities": []}"""
+        results = []
+        for probs in self.predict_proba(texts):
+            order = np.argsort(-probs)[:top_k]
+            results.append({
+                'intent': self.labels[order[0]],
+                'confidence': float(probs[order[0]]),
+                'intent_ranking': [{'name': self.labels[i], 'confidence': float(probs[i])} for i in order],
+                'entities': [],
+            })
+        return results
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as fh:
+            np.savez_compressed(fh, columns=self.columns, idf=self.idf, weights=self.weights,
+                                bias=self.bias, labels=np.asarray(self.labels),
+                                n_features=np.asarray(self.n_features))
+
+    @classmethod
+    def load(cls, path: str) -> 'TfidfIntentModel':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['columns'], data['idf'], data['weights'], data['bias'],
+                       [str(label) for label in data['labels']], int(data['n_features']))
+
+
+def fit_tfidf_intent(texts: List[str], intents: List[str], alpha: float = TFIDF_ALPHA,
+                     sample_weight: Optional[List[float]] = None) -> TfidfIntentModel:
+    """
+    Fit the vectorizer and a Complement Naive Bayes linear layer (one sparse product, no
+    iterative solver), then scale the logits with a temperature fitted on held-out folds
+    so predict_proba gives usable confidences for uncertainty sampling.
+    sample_weight: per-example weight of the class feature counts (e.g. 1 / near-duplicate cluster size)
+    """
+    labels = sorted(set(intents))
+    if len(labels) < 2:
+        raise RuntimeError('At least two intents are needed to train the tfidf classifier')
+    counts = hashed_counts(texts)
+    # used columns and document frequencies by counting over the hashed space (no sort)
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    columns = np.flatnonzero(df)
+    pos = (np.cumsum(df > 0) - 1)[counts.indices]
+    df = df[columns]
+    idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+    model = TfidfIntentModel(columns.astype(np.int64), idf, None, None, labels)
+    x = model._weigh(counts, pos, np.ones(len(pos), dtype=bool))
+
+    index = {label: i for i, label in enumerate(labels)}
+    y_idx = np.asarray([index[i] for i in intents])
+    w_ex = (np.ones(len(y_idx)) if sample_weight is None
+            else np.asarray(sample_weight, dtype=np.float64))
+    weights = _complement_nb_weights(x, y_idx, len(labels), alpha, w_ex)
+
+    # temperature from 2-fold held-out scores, so confidences are not fitted on seen examples
+    fold = np.arange(len(y_idx)) % 2 == 1
+    np.random.default_rng(13).shuffle(fold)
+    scores = np.zeros((len(y_idx), len(labels)))
+    for held_out in (fold, ~fold):
+        if held_out.all() or not held_out.any():
+            continue
+        w = _complement_nb_weights(x[~held_out], y_idx[~held_out], len(labels), alpha, w_ex[~held_out])
+        scores[held_out] = np.asarray(x[held_out] @ w)
+    rows = np.arange(len(y_idx))
+
+    def _nll(log_t):
+        p = _softmax(scores * np.exp(log_t))
+        return -float(np.average(np.log(p[rows, y_idx] + 1e-12), weights=w_ex))
+
+    temperature = float(np.exp(minimize_scalar(_nll, bounds=(0.0, 12.0), method='bounded').x))
+    model.weights = (weights * temperature).astype(np.float32)
+    model.bias = np.zeros(len(labels), dtype=np.float32)
+    return model
+
+
+def _complement_nb_weights(x: sp.csr_matrix, y_idx: np.ndarray, n_labels: int, alpha: float,
+                           sample_weight: np.ndarray) -> np.ndarray:
+    """Weight-normalised Complement NB as a (features, labels) matrix where higher scores win."""
+    y = sp.csr_matrix((sample_weight.astype(np.float32), (y_idx, np.arange(len(y_idx)))),
+                      shape=(n_labels, len(y_idx)))
+    feature_count = np.asarray((y @ x).todense())                       # (k, d)
+    complement = feature_count.sum(axis=0) - feature_count + alpha
+    log_w = np.log(complement / complement.sum(axis=1, keepdims=True))
+    log_w /= np.abs(log_w).sum(axis=1, keepdims=True)
+    return -log_w.T                                                     # low complement weight wins
+
+
+def build_tfidf_intent(annotations: List[dict], **kwargs) -> TfidfIntentModel:
+    """
+    Train on annotations that have both text and intent; returns the model (nothing is saved).
+    An optional per-annotation 'weight' (see near_dup.dedupe_annotations) weights the example.
+    """
+    rows = [(a.get('text', ''), str(a['intent']), float(a.get('weight', 1.0))) for a in annotations
+            if a.get('text', '').strip() and a.get('intent')]
+    if not rows:
+        raise RuntimeError('No intent-labelled annotations available in annotations.json')
+    texts, intents, weights = zip(*rows)
+    if any(w != 1.0 for w in weights):
+        kwargs.setdefault('sample_weight', list(weights))
+    return fit_tfidf_intent(list(texts), list(intents), **kwargs)
+
+
+def train_tfidf_model(base_dir: str, on_output: Optional[Callable[[str], None]] = None,
+                      annotations: Optional[List[dict]] = None, extra_meta: Optional[dict] = None) -> str:
+    """
+    Train the tfidf intent classifier and save models/tfidf_model/model_v{ts}.npz + meta_v{ts}.json.
+    annotations: train on these instead of annotations.json (e.g. a draft sample)
+    extra_meta: merged into meta_v{ts}.json
+    """
+    # imported here: model_utils imports the sampling/retention helpers used by every trainer
+    from .model_utils import _emit, _apply_retention_after_training
+    from .sampling import record_throughput
+
+    tfidf_dir = os.path.join(base_dir, 'models', 'tfidf_model')
+    os.makedirs(tfidf_dir, exist_ok=True)
+    if annotations is None:
+        data_file = os.path.join(base_dir, 'data', 'annotations.json')
+        if not os.path.exists(data_file):
+            raise FileNotFoundError('annotations.json not found')
+        annotations = list(iter_annotations(base_dir))
+
+    started = time.time()
+    model = build_tfidf_intent(annotations)
+    seconds = time.time() - started
+    record_throughput(base_dir, 'tfidf', len(annotations), seconds)
+    _emit(f'[tfidf_intent] trained on {len(annotations)} annotation(s), {len(model.labels)} intent(s), '
+          f'{len(model.columns)} feature(s) in {seconds:.2f}s', on_output)
+
+    timestamp = int(time.time())
+    model_path = os.path.join(tfidf_dir, f'model_v{timestamp}.npz')
+    model.save(model_path)
+    meta = {'name': 'tfidf_intent', 'version': f'v{timestamp}', 'trained_at': timestamp,
+            'intents': model.labels, 'num_features': int(len(model.columns)),
+            'train_seconds': round(seconds, 3), **(extra_meta or {})}
+    atomic_write_json(os.path.join(tfidf_dir, f'meta_v{timestamp}.json'), meta)
+
+    _apply_retention_after_training(base_dir, on_output)
+    return model_path
+
+
+def find_latest_tfidf_model(base_dir: str) -> Optional[str]:
+    tfidf_dir = os.path.join(base_dir, 'models', 'tfidf_model')
+    if not os.path.isdir(tfidf_dir):
+        return None
+    versions = [n for n in os.listdir(tfidf_dir)
+                if n.startswith('model_v') and n.endswith('.npz') and n[len('model_v'):-4].isdigit()]
+    if not versions:
+        return None
+    return os.path.join(tfidf_dir, max(versions, key=lambda n: int(n[len('model_v'):-4])))
+
+
+_loaded: Dict[str, tuple] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_tfidf_model(path: str) -> TfidfIntentModel:
+    """Load an artifact, cached per path (reloaded when the file changes)."""
+    mtime = os.path.getmtime(path)
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    model = TfidfIntentModel.load(path)
+    with _loaded_lock:
+        _loaded[path] = (mtime, model)
+    return model
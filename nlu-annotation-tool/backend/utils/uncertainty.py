@@ -0,0 +1,299 @@
+# backend/utils/uncertainty.py
+"""
+Uncertainty sampling: score an unlabeled pool with the latest workspace models and
+keep the top-K most uncertain utterances in data/uncertain_samples.json.
+
+Intent uncertainty comes from the intent model's class distribution (tfidf, or Rasa's
+intent ranking); entity uncertainty from span marginals of the spaCy NER beam. Each
+is expressed as least-confidence, margin and (normalised) entropy in [0, 1]. The pool
+is scored in batches and only a K-sized heap of candidates is kept in memory.
+The 'committee' strategy ranks by disagreement between models instead (committee.py).
+"""
+import os
+import time
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .active_learning import (get_workspace_dir, load_uncertain_samples, save_uncertain_samples,
+                              uncertain_queue_lock, is_lease_active)
+from .inference import resolve_model, load_spacy_model
+from .model_utils import rasa_predict
+from .prediction_cache import cached_predict
+from .pool import (text_key, has_pool, iter_pool, sync_labeled, requeue, find_indices,
+                   UNLABELED, QUEUED)
+from .annotation_store import iter_annotations
+from .tfidf_intent import load_tfidf_model
+from .diversity import diversify, candidate_pool_size, DIVERSITY_METHODS
+from .committee import CommitteeScorer, COMMITTEE_STRATEGY
+from .near_dup import index_texts, cluster_ids
+
+SCORE_BATCH_SIZE = int(os.environ.get('SCORE_BATCH_SIZE', '512'))
+DEFAULT_TOP_K = int(os.environ.get('UNCERTAIN_TOP_K', '200'))
+NER_BEAM_WIDTH = int(os.environ.get('NER_BEAM_WIDTH', '8'))
+STRATEGIES = ('least_confidence', 'margin', 'entropy', COMMITTEE_STRATEGY)
+# spans with a beam marginal at or above this are reported as predicted entities
+ENTITY_THRESHOLD = 0.5
+
+
+def intent_uncertainty(probs: np.ndarray) -> Dict[str, np.ndarray]:
+    """Row-wise uncertainty of class distributions (n, k); every score is in [0, 1]."""
+    probs = np.clip(np.asarray(probs, dtype=np.float64), 0.0, 1.0)
+    k = probs.shape[1]
+    top2 = -np.sort(-probs, axis=1)[:, :2] if k > 1 else np.hstack((probs, np.zeros_like(probs)))
+    entropy = -np.sum(np.where(probs > 0, probs * np.log(np.where(probs > 0, probs, 1.0)), 0.0), axis=1)
+    return {
+        'least_confidence': 1.0 - top2[:, 0],
+        'margin': 1.0 - (top2[:, 0] - top2[:, 1]),
+        'entropy': entropy / np.log(k) if k > 1 else np.zeros(len(probs)),
+    }
+
+
+def entity_uncertainty(span_probs: Dict) -> Dict[str, float]:
+    """
+    Uncertainty of one document's NER output from beam span marginals {span: p}.
+    least_confidence: 1 - weakest predicted span; margin: 1 - |2p - 1| of the most
+    ambiguous candidate span; entropy: largest binary entropy over candidate spans.
+    """
+    if not span_probs:
+        return {'least_confidence': 0.0, 'margin': 0.0, 'entropy': 0.0}
+    p = np.clip(np.fromiter(span_probs.values(), dtype=np.float64), 1e-12, 1 - 1e-12)
+    predicted = p[p >= ENTITY_THRESHOLD]
+    binary_entropy = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    return {
+        'least_confidence': float(1.0 - predicted.min()) if len(predicted) else 0.0,
+        'margin': float(1.0 - np.abs(2 * p - 1).min()),
+        'entropy': float(binary_entropy.max()),
+    }
+
+
+class PoolScorer:
+    """Scores batches of texts with the workspace's latest intent and entity models."""
+
+    def __init__(self, base_dir: str, intent_backend: str = 'auto', entity_backend: str = 'auto'):
+        self.base_dir = base_dir
+        self.intent_backend, self.intent_model = self._pick(base_dir, intent_backend, ('tfidf', 'rasa'))
+        self.entity_backend, self.entity_model = self._pick(base_dir, entity_backend, ('spacy',))
+        if not self.intent_model and not self.entity_model:
+            raise FileNotFoundError('no trained model in workspace to score the pool with')
+        self._tfidf = load_tfidf_model(self.intent_model) if self.intent_backend == 'tfidf' else None
+        self._nlp = load_spacy_model(self.entity_model) if self.entity_model else None
+
+    @staticmethod
+    def _pick(base_dir: str, backend: str, candidates: Tuple[str, ...]):
+        if backend in (None, 'none'):
+            return None, None
+        for name in (candidates if backend == 'auto' else (backend,)):
+            path = resolve_model(base_dir, name)
+            if path:
+                return name, path
+        return None, None
+
+    @property
+    def model_versions(self) -> Dict[str, str]:
+        versions = {}
+        if self.intent_model:
+            versions[self.intent_backend] = os.path.basename(self.intent_model)
+        if self.entity_model:
+            versions[self.entity_backend] = os.path.basename(self.entity_model)
+        return versions
+
+    def close(self) -> None:
+        pass
+
+    def _intents(self, texts: List[str]):
+        if self._tfidf is not None:
+            probs = np.asarray(cached_predict(
+                self.base_dir, 'tfidf', self.intent_model, 'proba', texts,
+                lambda batch: np.round(self._tfidf.predict_proba(batch), 6).tolist(), lowercase=True))
+            labels = self._tfidf.labels
+            top = np.argsort(-probs, axis=1)[:, :3]
+            rankings = [[{'name': labels[j], 'confidence': round(float(row[j]), 4)} for j in order]
+                        for row, order in zip(probs, top)]
+            return probs, rankings
+        predictions = cached_predict(self.base_dir, 'rasa', self.intent_model, 'predict', texts,
+                                     lambda batch: rasa_predict(self.intent_model, batch))
+        width = max((len(p['intent_ranking']) for p in predictions), default=1) or 1
+        probs = np.zeros((len(texts), width))
+        for i, p in enumerate(predictions):
+            for j, r in enumerate(p['intent_ranking']):
+                probs[i, j] = r.get('confidence') or 0.0
+        rankings = [p['intent_ranking'][:3] for p in predictions]
+        return probs, rankings
+
+    def _entities(self, texts: List[str]):
+        return [(r['spans'], r['scores']) for r in
+                cached_predict(self.base_dir, 'spacy', self.entity_model, 'beam', texts, self._beam_entities)]
+
+    def _beam_entities(self, texts: List[str]) -> List[Dict]:
+        ner = self._nlp.get_pipe('ner')
+        docs = [self._nlp.make_doc(t) for t in texts]
+        beams = ner.beam_parse(docs, beam_width=NER_BEAM_WIDTH)
+        results = []
+        for doc, scored in zip(docs, ner.scored_ents(beams)):
+            spans = [
+                {'start': doc[s:e].start_char, 'end': doc[s:e].end_char, 'label': label,
+                 'confidence': round(float(p), 4)}
+                for (s, e, label), p in scored.items() if p >= ENTITY_THRESHOLD
+            ]
+            results.append({'spans': spans, 'scores': entity_uncertainty(scored)})
+        return results
+
+    def score_batch(self, texts: List[str], strategy: str) -> List[Dict]:
+        """Returns one dict per text with predictions, per-strategy scores and the ranking score."""
+        rows = [{'text': t, 'scores': {}} for t in texts]
+        if self.intent_model:
+            probs, rankings = self._intents(texts)
+            scores = intent_uncertainty(probs)
+            for i, row in enumerate(rows):
+                row['predicted_intent'] = rankings[i][0]['name'] if rankings[i] else None
+                row['confidence'] = rankings[i][0]['confidence'] if rankings[i] else None
+                row['intent_ranking'] = rankings[i]
+                row['scores']['intent'] = {name: round(float(v[i]), 4) for name, v in scores.items()}
+        if self.entity_model:
+            for row, (spans, scores) in zip(rows, self._entities(texts)):
+                row['entities'] = spans
+                row['scores']['entity'] = {name: round(v, 4) for name, v in scores.items()}
+        for row in rows:
+            # uncertain if either the intent or the entities are
+            row['score'] = max(s[strategy] for s in row['scores'].values())
+        return rows
+
+
+def _keep_on_rescore(sample: Dict) -> bool:
+    """Samples flagged for re-annotation or held by a reviewer survive a new scoring run."""
+    return bool(sample.get('marked_for_reannotation')) or is_lease_active(sample)
+
+
+def _exclusion_keys(base_dir: str) -> set:
+    """Keys of texts that are already annotated (not worth asking about again)."""
+    keys = set()
+    for ann in iter_annotations(base_dir):
+        if ann.get('text'):
+            keys.add(text_key(ann['text']))
+    return keys
+
+
+def _batches(items: Iterable[Tuple[str, str]], size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def select_uncertain(scorer: PoolScorer, items: Iterable[Tuple[str, str]], top_k: int = DEFAULT_TOP_K,
+                     strategy: str = 'entropy', batch_size: int = SCORE_BATCH_SIZE, exclude: set = None,
+                     on_output: Optional[Callable[[str], None]] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Stream (item_id, text) pairs through the scorer and keep the top_k by score.
+    Memory is bounded by one batch plus the heap. Returns (samples sorted by score, stats).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown strategy '{strategy}'; expected one of {list(STRATEGIES)}")
+    exclude = exclude or set()
+    heap: List[tuple] = []              # (score, seq, key) min-heap of the current top_k
+    entries: Dict[str, Dict] = {}       # key -> sample of heap members
+    seen = skipped = 0
+    seq = 0
+    for batch in _batches(items, batch_size):
+        fresh = []
+        for item_id, text in batch:
+            key = text_key(text)
+            if key in exclude or key in entries:
+                skipped += 1
+                continue
+            fresh.append((item_id, text, key))
+        if not fresh:
+            continue
+        for (item_id, _, key), row in zip(fresh, scorer.score_batch([t for _, t, _ in fresh], strategy)):
+            seq += 1
+            if len(heap) < top_k:
+                heapq.heappush(heap, (row['score'], seq, key))
+            elif row['score'] > heap[0][0]:
+                _, _, evicted = heapq.heapreplace(heap, (row['score'], seq, key))
+                entries.pop(evicted, None)
+            else:
+                continue
+            row['pool_item_id'] = item_id
+            entries[key] = row
+        seen += len(batch)
+        if on_output and seen // batch_size % 20 == 0:
+            on_output(f'[uncertainty] scored {seen} item(s)')
+    samples = [entries[key] for _, _, key in sorted(heap, reverse=True)]
+    return samples, {'scored': seq, 'read': seen, 'skipped': skipped}
+
+
+def score_pool(workspace_id: str, items: Optional[Iterable[Tuple[str, str]]] = None,
+               top_k: int = DEFAULT_TOP_K, strategy: str = 'entropy', batch_size: int = SCORE_BATCH_SIZE,
+               intent_backend: str = 'auto', entity_backend: str = 'auto',
+               diversity: Optional[str] = None, candidate_factor: Optional[int] = None,
+               committee: Optional[List[str]] = None, on_output: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Score a pool and replace the uncertain queue with its top_k samples. Samples flagged
+    marked_for_reannotation or under an active review lease stay in the queue.
+    items: (item_id, text) pairs of a pool file; None scores the workspace pool store
+    (unlabeled and queued items) and updates the queued status of its items.
+    diversity: 'kcenter' or 'kmeanspp' to keep top_k * candidate_factor uncertain candidates
+    and pick a diverse batch of top_k among them (see diversity.py)
+    committee: members for the 'committee' strategy ('backend' or 'backend:model_version');
+    default the latest model of every backend
+    Returns: summary with counts, strategy and model versions used
+    """
+    base_dir = get_workspace_dir(workspace_id)
+    started = time.time()
+    if strategy == COMMITTEE_STRATEGY:
+        scorer = CommitteeScorer(base_dir, committee)
+    else:
+        scorer = PoolScorer(base_dir, intent_backend, entity_backend)
+    kept = [s for s in load_uncertain_samples(workspace_id) if _keep_on_rescore(s)]
+    exclude = {s.get('sample_id', '')[2:] for s in kept}
+    use_store = items is None
+    if use_store:
+        if not has_pool(base_dir):
+            raise FileNotFoundError('workspace has no unlabeled pool; ingest one first')
+        # labeled items are skipped through their status
+        sync_labeled(base_dir)
+        items = iter_pool(base_dir, (UNLABELED, QUEUED))
+    else:
+        exclude |= _exclusion_keys(base_dir)
+    if diversity and diversity not in DIVERSITY_METHODS:
+        raise ValueError(f"unknown diversity method '{diversity}'")
+    n_candidates = candidate_pool_size(top_k, candidate_factor) if diversity else top_k
+    try:
+        samples, stats = select_uncertain(scorer, items, n_candidates, strategy, batch_size, exclude, on_output)
+    finally:
+        scorer.close()
+    if diversity:
+        samples = diversify(samples, top_k, diversity)
+
+    # near-duplicate clusters of the new queue, so reviewers can act on a cluster at once
+    index_texts(base_dir, [s['text'] for s in kept + samples])
+    clusters = cluster_ids(base_dir, [s['text'] for s in samples])
+    scored_at = int(time.time())
+    for s in samples:
+        s['cluster_id'], s['cluster_size'] = clusters.get(text_key(s['text']), (text_key(s['text']), 1))
+        s['sample_id'] = 'u_' + text_key(s['text'])
+        s['strategy'] = strategy
+        s['model_versions'] = scorer.model_versions
+        s['scored_at'] = scored_at
+        s['pool'] = 'store' if use_store else 'file'
+    with uncertain_queue_lock(workspace_id):
+        # re-read: samples may have been leased or reviewed while the pool was scored
+        kept = [s for s in load_uncertain_samples(workspace_id) if _keep_on_rescore(s)]
+        kept_ids = {s.get('sample_id') for s in kept}
+        samples = [s for s in samples if s['sample_id'] not in kept_ids]
+        save_uncertain_samples(workspace_id, kept + samples)
+    if use_store:
+        requeue(base_dir, [s['pool_item_id'] for s in samples]
+                + [int(i) for i in find_indices(base_dir, [s['text'] for s in kept])])
+
+    summary = {'workspace_id': workspace_id, 'strategy': strategy, 'top_k': top_k, 'diversity': diversity,
+               'queued': len(samples), 'kept': len(kept),
+               'model_versions': scorer.model_versions, 'seconds': round(time.time() - started, 2), **stats}
+    print(f"[uncertainty] {workspace_id}: scored {stats['scored']} item(s), queued {len(samples)}")
+    return summary
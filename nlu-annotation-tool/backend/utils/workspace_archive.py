@@ -0,0 +1,416 @@
+# backend/utils/workspace_archive.py
+"""
+Streaming workspace export / import archives.
+
+An export is a tar stream of the workspace files (data, pool, snapshots and the selected
+model versions) compressed with zstd when the zstandard package is installed, gzip
+otherwise, and ended by a MANIFEST.json member listing every file with its size and
+sha256. A producer thread reads, hashes and compresses the files into a bounded queue
+that the HTTP response drains, so memory use does not depend on the workspace size.
+
+The archive bytes are a pure function of the file list (sorted paths, sizes, mtimes,
+fixed owners, no compression timestamps), identified by an ETag, so an interrupted
+download is resumed by regenerating the stream and skipping the bytes already received.
+
+Imports are uploaded in chunks appended to a part file (resumable from its size), then
+extracted into a temp directory, checked against the manifest and renamed into place.
+Only the files an export can contain are accepted: derived caches (which are trusted
+when loaded) are rebuilt by the importing workspace, never taken from the archive.
+Model files are moved into the artifact store, so identical models are shared.
+"""
+import os
+import re
+import gzip
+import json
+import zlib
+import queue
+import shutil
+import hashlib
+import tarfile
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .artifact_store import put_file, link_into, store_lock
+from .retention import load_pinned
+from .workspace_clone import _skipped
+
+try:
+    import zstandard
+except ImportError:         # optional: archives are gzip-compressed without it
+    zstandard = None
+
+ARCHIVE_FORMAT = 1
+MANIFEST_NAME = 'MANIFEST.json'
+COMPRESSIONS = ('zstd', 'gzip')
+MODEL_SELECTIONS = ('latest', 'all', 'none')
+# top-level workspace directories that are exported and may be imported
+ARCHIVE_DIRS = ('data', 'models')
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', str(256 * 1024)))
+# compressed chunks buffered between the producer thread and the response
+EXPORT_QUEUE_CHUNKS = int(os.environ.get('EXPORT_QUEUE_CHUNKS', '16'))
+ZSTD_LEVEL = int(os.environ.get('EXPORT_ZSTD_LEVEL', '3'))
+GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', '6'))
+_COPY_CHUNK = 1024 * 1024
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_GZIP_MAGIC = b'\x1f\x8b'
+
+_VERSION_RE = re.compile(r'^(?:model|meta)_v(\d+)(?:\.npz|\.json)?$')
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def default_compression() -> str:
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+# ---------- export ----------
+def _model_versions(models_dir: str, models: str) -> Dict[str, set]:
+    """Versions kept per backend dir (<ts> of model_v<ts>, rasa archive names); unlisted dirs keep everything."""
+    if models == 'all':
+        return {}
+    pinned = load_pinned(models_dir)
+    kept: Dict[str, set] = {}
+    for backend in ('spacy', 'tfidf', 'rasa'):
+        sub = os.path.join(models_dir, backend + '_model')
+        keep = set()
+        if models == 'latest' and os.path.isdir(sub):
+            if backend == 'rasa':
+                archives = [n for n in os.listdir(sub) if n.endswith('.tar.gz')]
+                if archives:
+                    keep.add(max(archives, key=lambda n: os.path.getmtime(os.path.join(sub, n))))
+            else:
+                stamps = [int(_VERSION_RE.match(n).group(1)) for n in os.listdir(sub)
+                          if n.startswith('model_v') and _VERSION_RE.match(n)]
+                if stamps:
+                    keep.add(str(max(stamps)))
+            for name in pinned.get(backend, []):
+                m = _VERSION_RE.match(name)
+                keep.add(m.group(1) if m and backend != 'rasa' else name)
+        kept[backend + '_model'] = keep
+    return kept
+
+
+def _selected(rel: str, kept: Dict[str, set]) -> bool:
+    parts = rel.split('/')
+    if len(parts) < 3 or parts[0] != 'models' or parts[1] not in kept:
+        return True
+    name = parts[2]
+    if parts[1] == 'rasa_model':
+        return not name.endswith('.tar.gz') or name in kept[parts[1]]
+    m = _VERSION_RE.match(name)
+    return not m or m.group(1) in kept[parts[1]]
+
+
+def export_files(base_dir: str, models: str = 'latest') -> List[Dict]:
+    """
+    Files of an export, sorted by path, as {'path', 'size', 'mtime', 'mtime_ns'}.
+    models: 'latest' (newest version of each backend plus pinned ones), 'all' or 'none'
+    """
+    if models not in MODEL_SELECTIONS:
+        raise ValueError('models must be one of ' + ', '.join(MODEL_SELECTIONS))
+    kept = _model_versions(os.path.join(base_dir, 'models'), models)
+    files = []
+    for root, dirs, names in os.walk(base_dir):
+        if root == base_dir:
+            dirs[:] = [d for d in dirs if d in ARCHIVE_DIRS]
+            continue
+        dirs[:] = [d for d in dirs if not _skipped(d)]
+        for name in names:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, base_dir).replace(os.sep, '/')
+            if _skipped(name) or os.path.islink(path) or not _selected(rel, kept):
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append({'path': rel, 'size': st.st_size, 'mtime': int(st.st_mtime), 'mtime_ns': st.st_mtime_ns})
+    files.sort(key=lambda f: f['path'])
+    return files
+
+
+def export_etag(files: List[Dict], compression: str) -> str:
+    """Identifies the archive bytes: equal etags mean byte-identical exports."""
+    key = json.dumps([ARCHIVE_FORMAT, compression, ZSTD_LEVEL if compression == 'zstd' else GZIP_LEVEL,
+                      [(f['path'], f['size'], f['mtime_ns']) for f in files]])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """File-like sink for tarfile: compresses and hands out EXPORT_CHUNK_SIZE chunks through a bounded queue."""
+
+    def __init__(self, compression: str, out: queue.Queue, stop: threading.Event):
+        if compression == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            # wbits 31: gzip container, header mtime 0, so the output is reproducible
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self._out = out
+        self._stop = stop
+        self._buf = bytearray()
+
+    def _put(self, item) -> None:
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                self._out.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data: bytes) -> int:
+        self._buf += self._compressor.compress(data)
+        while len(self._buf) >= EXPORT_CHUNK_SIZE:
+            self._put(bytes(self._buf[:EXPORT_CHUNK_SIZE]))
+            del self._buf[:EXPORT_CHUNK_SIZE]
+        return len(data)
+
+    def finish(self) -> None:
+        self._buf += self._compressor.flush()
+        if self._buf:
+            self._put(bytes(self._buf))
+        self._put(None)
+
+
+class _HashingReader:
+    def __init__(self, fh):
+        self._fh = fh
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fh.read(size)
+        self.sha256.update(data)
+        return data
+
+
+class _FileChanged(Exception):
+    pass
+
+
+class _ExactReader:
+    """Exactly `size` bytes of reader; raises _FileChanged if the file turns out shorter."""
+
+    def __init__(self, reader: _HashingReader, size: int, path: str):
+        self._reader = reader
+        self._left = size
+        self._path = path
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._left if size is None or size < 0 else min(size, self._left)
+        data = self._reader.read(size)
+        if len(data) < size:
+            raise _FileChanged(self._path)
+        self._left -= len(data)
+        return data
+
+
+def _check_unchanged(fh, f: Dict) -> None:
+    st = os.fstat(fh.fileno())
+    if st.st_size != f['size'] or st.st_mtime_ns != f['mtime_ns']:
+        raise _FileChanged(f['path'])
+
+
+class _BytesReader:
+    def __init__(self, data: bytes):
+        self._data = memoryview(data)
+
+    def read(self, size: int = -1) -> bytes:
+        size = len(self._data) if size is None or size < 0 else size
+        chunk, self._data = self._data[:size], self._data[size:]
+        return bytes(chunk)
+
+
+def _tarinfo(name: str, size: int, mtime: int) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.size, info.mtime, info.mode = size, mtime, 0o644
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+
+def _produce(base_dir: str, files: List[Dict], compression: str, workspace: str,
+             out: queue.Queue, stop: threading.Event) -> None:
+    writer = _QueueWriter(compression, out, stop)
+    try:
+        manifest = {'format': ARCHIVE_FORMAT, 'workspace': workspace, 'files': []}
+        with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            for f in files:
+                # the listing is what the etag promised; a file written since then (e.g. an
+                # annotation appended to the journal) fails the export rather than sending a
+                # torn copy, and the client starts over with a new listing. Files replaced by
+                # rename are fine: the open handle keeps reading the listed version.
+                with open(os.path.join(base_dir, f['path']), 'rb') as fh:
+                    _check_unchanged(fh, f)
+                    reader = _HashingReader(fh)
+                    tar.addfile(_tarinfo(f['path'], f['size'], f['mtime']),
+                                _ExactReader(reader, f['size'], f['path']))
+                    _check_unchanged(fh, f)
+                manifest['files'].append({'path': f['path'], 'size': f['size'],
+                                          'sha256': reader.sha256.hexdigest()})
+            data = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+            tar.addfile(_tarinfo(MANIFEST_NAME, len(data), 0), _BytesReader(data))
+        writer.finish()
+    except _Cancelled:
+        pass
+    except _FileChanged as e:
+        print(f"[workspace_archive] Export of {base_dir} stopped: {e} changed while exporting")
+        try:
+            writer._put(RuntimeError(f'{e} changed during the export; start the download again'))
+        except _Cancelled:
+            pass
+    except BaseException as e:
+        print(f"[workspace_archive] Export of {base_dir} failed: {e}")
+        try:
+            writer._put(e)
+        except _Cancelled:
+            pass
+
+
+def stream_export(base_dir: str, files: List[Dict], compression: str, offset: int = 0) -> Iterator[bytes]:
+    """
+    Compressed archive bytes from `offset` on. Files are read, hashed and compressed by a
+    producer thread; closing the iterator (client gone) stops it.
+    """
+    if compression not in COMPRESSIONS or (compression == 'zstd' and zstandard is None):
+        raise ValueError('unsupported compression: ' + str(compression))
+    out: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    stop = threading.Event()
+    workspace = os.path.basename(os.path.normpath(base_dir))
+    producer = threading.Thread(target=_produce, args=(base_dir, files, compression, workspace, out, stop),
+                                daemon=True, name='export-' + workspace)
+    producer.start()
+    skip = offset
+    try:
+        while True:
+            chunk = out.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if skip:
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk, skip = chunk[skip:], 0
+            yield chunk
+    finally:
+        stop.set()
+
+
+# ---------- import ----------
+def append_upload(part_path: str, offset: int, stream, max_bytes: Optional[int] = None) -> int:
+    """
+    Append an uploaded chunk to part_path if offset is its current size.
+    Returns: the new size. Raises ValueError (with the current size) on an offset mismatch.
+    """
+    with _lock(part_path):
+        size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset != size:
+            raise ValueError(size)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        with open(part_path, 'ab') as fh:
+            while True:
+                data = stream.read(_COPY_CHUNK)
+                if not data:
+                    break
+                size += len(data)
+                if max_bytes is not None and size > max_bytes:
+                    fh.truncate(offset)
+                    raise OverflowError(max_bytes)
+                fh.write(data)
+        return size
+
+
+def _decompressed(fh):
+    magic = fh.read(4)
+    fh.seek(0)
+    if magic.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError('archive is zstd-compressed but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().stream_reader(fh)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fh, mode='rb')
+    raise ValueError('not a zstd or gzip workspace archive')
+
+
+def _member_path(root: str, name: str) -> str:
+    parts = name.split('/')
+    if not name or name.startswith('/') or any(p in ('', '.', '..') for p in parts):
+        raise ValueError('unsafe path in archive: ' + name)
+    # exports never contain caches: an archive that does is not one of ours
+    if len(parts) < 2 or parts[0] not in ARCHIVE_DIRS or any(_skipped(p) for p in parts):
+        raise ValueError('unexpected file in archive: ' + name)
+    return os.path.join(root, *parts)
+
+
+def import_archive(archive_path: str, dest_dir: str) -> Dict:
+    """
+    Extract an export into dest_dir (which must not exist), verifying every file against
+    the manifest. Nothing is left behind when the archive is incomplete or corrupt.
+    Returns: {'files', 'bytes', 'workspace', 'models_shared'}
+    """
+    if os.path.exists(dest_dir):
+        raise FileExistsError('workspace already exists: ' + dest_dir)
+    tmp_dir = os.path.join(os.path.dirname(dest_dir), f'.{os.path.basename(dest_dir)}.tmp_import{os.getpid()}')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    found: Dict[str, tuple] = {}
+    manifest = None
+    try:
+        with open(archive_path, 'rb') as raw, tarfile.open(fileobj=_decompressed(raw), mode='r|') as tar:
+            for member in tar:
+                if member.name == MANIFEST_NAME:
+                    manifest = json.loads(tar.extractfile(member).read().decode('utf-8'))
+                    continue
+                if not member.isfile():
+                    raise ValueError('unexpected archive member: ' + member.name)
+                path = _member_path(tmp_dir, member.name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                digest = hashlib.sha256()
+                src = tar.extractfile(member)
+                with open(path, 'wb') as fh:
+                    while True:
+                        data = src.read(_COPY_CHUNK)
+                        if not data:
+                            break
+                        digest.update(data)
+                        fh.write(data)
+                found[member.name] = (member.size, digest.hexdigest())
+        if manifest is None or manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError('archive has no valid manifest (truncated upload?)')
+        expected = {f['path']: (f['size'], f['sha256']) for f in manifest['files']}
+        bad = sorted(p for p in set(expected) | set(found) if expected.get(p) != found.get(p))
+        if bad:
+            raise ValueError(f'{len(bad)} file(s) do not match the manifest, e.g. {bad[0]}')
+
+        os.rename(tmp_dir, dest_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # models are shared through the artifact store, like freshly trained ones; linked at
+    # their final paths, which is where the store records reflinks / copies
+    shared = 0
+    for rel, (_, sha256) in found.items():
+        if rel.startswith('models/'):
+            path = os.path.join(dest_dir, *rel.split('/'))
+            try:
+                with store_lock():
+                    link_into(put_file(path, digest=sha256), path)
+                shared += 1
+            except OSError as e:
+                print(f"[workspace_archive] Could not share {path} through the artifact store: {e}")
+    report = {'files': len(found), 'bytes': sum(size for size, _ in found.values()),
+              'workspace': manifest.get('workspace'), 'models_shared': shared}
+    print(f"[workspace_archive] Imported {report['files']} file(s) into {dest_dir}")
+    return report
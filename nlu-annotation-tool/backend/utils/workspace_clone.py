@@ -0,0 +1,88 @@
+# backend/utils/workspace_clone.py
+"""
+Copy-on-write workspace clones.
+
+A clone shares every file of the source workspace through hardlinks (or reflinks /
+copies when hardlinks are not possible), so forking a workspace with a large dataset,
+pool and model history costs directory entries, not bytes. This is safe because nothing
+in a workspace is modified in place: JSON files, corpus shards and models are written to
+a temp file and renamed over the old one, and the pool store gives a file its own copy
+(artifact_store.unshare) before appending to or memory-mapping it for writing.
+
+Derived caches (SQLite indexes, analytics columns) are not shared; SQLite writes in
+place. The clone rebuilds them on first use.
+"""
+import os
+import time
+import shutil
+from collections import Counter
+from typing import Dict
+
+from .artifact_store import share_file
+from .storage import atomic_write_json
+from .analytics import COLUMNS_FILE
+from .near_dup import INDEX_FILE as NEAR_DUP_FILE
+from .prediction_cache import CACHE_FILE as PREDICTION_CACHE_FILE
+from .preannotate import SUGGESTIONS_FILE
+from .search_index import INDEX_FILE as SEARCH_INDEX_FILE
+from .snapshots import list_snapshots
+
+CLONE_INFO_FILE = 'clone.json'
+# rebuilt by the clone on first use; deployment history belongs to the source's containers
+SKIPPED_FILES = {
+    COLUMNS_FILE, NEAR_DUP_FILE, PREDICTION_CACHE_FILE, SUGGESTIONS_FILE, SEARCH_INDEX_FILE,
+    'chunk_cache.json', 'deployment_history.json', CLONE_INFO_FILE,
+}
+_SQLITE_SUFFIXES = ('-wal', '-shm', '-journal')
+
+
+def _skipped(name: str) -> bool:
+    for suffix in _SQLITE_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    # '.tmp' marks files being written (atomic_write_json, corpus shards, store links)
+    return name in SKIPPED_FILES or '.tmp' in name
+
+
+def clone_workspace(src_dir: str, dest_dir: str) -> Dict:
+    """
+    Fork the workspace at src_dir into dest_dir, which must not exist. The clone is built
+    next to dest_dir and renamed into place, so a failed clone leaves nothing behind.
+    Returns: {'files', 'bytes_shared', 'methods', 'skipped', 'seconds'}
+    """
+    if os.path.exists(dest_dir):
+        raise FileExistsError('workspace already exists: ' + dest_dir)
+    started = time.time()
+    tmp_dir = os.path.join(os.path.dirname(dest_dir), f'.{os.path.basename(dest_dir)}.tmp_clone{os.getpid()}')
+    methods: Counter = Counter()
+    files = size = skipped = 0
+    try:
+        for root, dirs, names in os.walk(src_dir):
+            dirs.sort()
+            target = os.path.join(tmp_dir, os.path.relpath(root, src_dir))
+            os.makedirs(target, exist_ok=True)
+            for name in sorted(names):
+                src = os.path.join(root, name)
+                if _skipped(name) or os.path.islink(src):
+                    skipped += 1
+                    continue
+                try:
+                    methods[share_file(src, os.path.join(target, name))] += 1
+                except FileNotFoundError:
+                    continue        # replaced or removed while cloning
+                files += 1
+                size += os.path.getsize(src)
+        snapshots = list_snapshots(src_dir)
+        atomic_write_json(os.path.join(tmp_dir, CLONE_INFO_FILE), {
+            'source': os.path.basename(os.path.normpath(src_dir)),
+            'cloned_at': int(time.time()),
+            'dataset_snapshot': snapshots[-1]['id'] if snapshots else None,
+        })
+        os.rename(tmp_dir, dest_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    report = {'files': files, 'bytes_shared': size, 'methods': dict(methods), 'skipped': skipped,
+              'seconds': round(time.time() - started, 3)}
+    print(f"[workspace_clone] {src_dir} -> {dest_dir}: {files} file(s), {dict(methods)}")
+    return report